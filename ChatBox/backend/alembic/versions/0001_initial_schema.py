@@ -0,0 +1,87 @@
+"""initial schema
+
+The tables as `Base.metadata.create_all` used to create them. Databases
+created that way before migrations existed are stamped at this revision
+by run_migrations (or by hand: `alembic stamp 0001`) and then upgraded.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def timestamps():
+    return [
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    ]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("is_superuser", sa.Boolean(), nullable=True),
+        *timestamps(),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "conversations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("title", sa.String(length=255), nullable=True),
+        sa.Column("summary", sa.Text(), nullable=True),
+        *timestamps(),
+    )
+    op.create_index("ix_conversations_id", "conversations", ["id"])
+
+    op.create_table(
+        "messages",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("conversation_id", sa.Integer(), sa.ForeignKey("conversations.id"), nullable=False),
+        sa.Column("role", sa.Enum("USER", "ASSISTANT", "SYSTEM", name="messagerole"), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("tokens_used", sa.Integer(), nullable=True),
+        *timestamps(),
+    )
+    op.create_index("ix_messages_id", "messages", ["id"])
+
+    op.create_table(
+        "documents",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("title", sa.String(length=255), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("source", sa.String(length=255), nullable=True),
+        sa.Column("file_path", sa.String(length=500), nullable=True),
+        sa.Column("chunk_id", sa.String(length=100), nullable=True),
+        sa.Column("embedding_id", sa.String(length=100), nullable=True),
+        sa.Column("document_type", sa.String(length=50), nullable=True),
+        sa.Column("page_number", sa.Integer(), nullable=True),
+        sa.Column("chunk_index", sa.Integer(), nullable=True),
+        *timestamps(),
+    )
+    op.create_index("ix_documents_id", "documents", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("documents")
+    op.drop_table("messages")
+    op.drop_table("conversations")
+    op.drop_table("users")
+    sa.Enum(name="messagerole").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,92 @@
+"""conversation state and message full-text search
+
+Columns added since the initial schema: documents.content_hash
+(incremental re-ingestion), conversations.summary_message_id (rolling
+summary cursor), conversations.message_count / last_message_at (listing
+without per-row counts), plus full-text search over messages.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+
+    op.add_column("documents", sa.Column("content_hash", sa.String(length=32), nullable=True))
+
+    with op.batch_alter_table("conversations") as batch:
+        batch.add_column(sa.Column("summary_message_id", sa.Integer(), nullable=True))
+        batch.add_column(sa.Column("message_count", sa.Integer(), nullable=False, server_default="0"))
+        batch.add_column(sa.Column("last_message_at", sa.DateTime(), nullable=True))
+
+    op.execute("""
+        UPDATE conversations SET
+            message_count = (SELECT COUNT(*) FROM messages m WHERE m.conversation_id = conversations.id),
+            last_message_at = COALESCE(
+                (SELECT MAX(m.created_at) FROM messages m WHERE m.conversation_id = conversations.id),
+                created_at,
+                CURRENT_TIMESTAMP
+            )
+    """)
+    with op.batch_alter_table("conversations") as batch:
+        batch.alter_column("last_message_at", existing_type=sa.DateTime(), nullable=False)
+        batch.create_index(
+            "ix_conversations_user_last_message", ["user_id", "last_message_at", "id"]
+        )
+
+    if dialect == "postgresql":
+        op.execute(
+            "ALTER TABLE messages ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED"
+        )
+        op.execute("CREATE INDEX ix_messages_search_vector ON messages USING GIN (search_vector)")
+    elif dialect == "sqlite":
+        op.execute(
+            "CREATE VIRTUAL TABLE messages_fts USING fts5("
+            "content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        op.execute(
+            "CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN "
+            "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END"
+        )
+        op.execute(
+            "CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN "
+            "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+        )
+        op.execute(
+            "CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+            "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+            "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END"
+        )
+        # Index the messages that already exist
+        op.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute("DROP INDEX ix_messages_search_vector")
+        op.execute("ALTER TABLE messages DROP COLUMN search_vector")
+    elif dialect == "sqlite":
+        for trigger in ("messages_fts_insert", "messages_fts_delete", "messages_fts_update"):
+            op.execute(f"DROP TRIGGER {trigger}")
+        op.execute("DROP TABLE messages_fts")
+
+    with op.batch_alter_table("conversations") as batch:
+        batch.drop_index("ix_conversations_user_last_message")
+        batch.drop_column("last_message_at")
+        batch.drop_column("message_count")
+        batch.drop_column("summary_message_id")
+
+    op.drop_column("documents", "content_hash")
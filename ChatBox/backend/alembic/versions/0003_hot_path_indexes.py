@@ -0,0 +1,33 @@
+"""hot-path indexes
+
+Composite and lookup indexes for the queries every request runs:
+a conversation's messages in order, a user's conversations, and chunk
+lookups by source file and by vector id.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_messages_conversation_created", "messages", ["conversation_id", "created_at"])
+    op.create_index("ix_conversations_user_created", "conversations", ["user_id", "created_at"])
+    op.create_index("ix_documents_source", "documents", ["source"])
+    op.create_index("ix_documents_embedding_id", "documents", ["embedding_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_documents_embedding_id", table_name="documents")
+    op.drop_index("ix_documents_source", table_name="documents")
+    op.drop_index("ix_conversations_user_created", table_name="conversations")
+    op.drop_index("ix_messages_conversation_created", table_name="messages")
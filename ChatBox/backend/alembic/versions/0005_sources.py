@@ -0,0 +1,59 @@
+"""sources
+
+A `sources` row per ingested file, with an indexed foreign key from its
+chunks (documents.source_id). Existing chunks are grouped by their
+source name.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "sources",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(length=255), nullable=False),
+        sa.Column("document_type", sa.String(length=50), nullable=True),
+        sa.Column("status", sa.String(length=20), nullable=False, server_default="active"),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.UniqueConstraint("name", name="uq_sources_name"),
+    )
+    op.create_index("ix_sources_id", "sources", ["id"])
+
+    with op.batch_alter_table("documents") as batch:
+        batch.add_column(sa.Column("source_id", sa.Integer(), nullable=True))
+        batch.create_foreign_key(
+            "fk_documents_source_id", "sources", ["source_id"], ["id"], ondelete="CASCADE"
+        )
+
+    op.execute("""
+        INSERT INTO sources (name, document_type, status, created_at, updated_at)
+        SELECT source, MIN(document_type), 'active', MIN(created_at), MAX(updated_at)
+        FROM documents WHERE source IS NOT NULL GROUP BY source
+    """)
+    op.execute("""
+        UPDATE documents SET source_id = (SELECT s.id FROM sources s WHERE s.name = documents.source)
+        WHERE source IS NOT NULL
+    """)
+    op.create_index("ix_documents_source_id", "documents", ["source_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_documents_source_id", table_name="documents")
+    with op.batch_alter_table("documents") as batch:
+        batch.drop_constraint("fk_documents_source_id", type_="foreignkey")
+        batch.drop_column("source_id")
+    op.drop_index("ix_sources_id", table_name="sources")
+    op.drop_table("sources")
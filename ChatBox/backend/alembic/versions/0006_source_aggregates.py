@@ -0,0 +1,54 @@
+"""source aggregates
+
+Per-source chunk count, chunk text size and last ingestion time, kept up
+to date on every ingestion so document listings and stats never scan
+chunks. Backfilled from the existing chunks; the keyset index serves the
+listing (most recently ingested first).
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("sources") as batch:
+        batch.add_column(sa.Column("chunk_count", sa.Integer(), nullable=False, server_default="0"))
+        batch.add_column(sa.Column("total_bytes", sa.BigInteger(), nullable=False, server_default="0"))
+        batch.add_column(sa.Column("last_ingested_at", sa.DateTime(), nullable=True))
+
+    # File sizes were never recorded: start from the UTF-8 chunk text (which
+    # counts chunk overlap) until the next ingestion stores the real size
+    if op.get_bind().dialect.name == "sqlite":
+        content_bytes = "LENGTH(CAST(content AS BLOB))"
+    else:
+        content_bytes = "OCTET_LENGTH(content)"
+    op.execute(f"""
+        UPDATE sources SET
+            chunk_count = (SELECT COUNT(*) FROM documents d WHERE d.source_id = sources.id),
+            total_bytes = (
+                SELECT COALESCE(SUM({content_bytes}), 0) FROM documents d WHERE d.source_id = sources.id
+            ),
+            last_ingested_at = (
+                SELECT MAX(COALESCE(d.updated_at, d.created_at)) FROM documents d WHERE d.source_id = sources.id
+            )
+    """)
+    op.execute("UPDATE sources SET last_ingested_at = created_at WHERE last_ingested_at IS NULL")
+    op.create_index("ix_sources_last_ingested", "sources", ["last_ingested_at", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_sources_last_ingested", table_name="sources")
+    with op.batch_alter_table("sources") as batch:
+        batch.drop_column("last_ingested_at")
+        batch.drop_column("total_bytes")
+        batch.drop_column("chunk_count")
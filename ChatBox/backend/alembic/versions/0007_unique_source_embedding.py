@@ -0,0 +1,43 @@
+"""unique chunk vector per source
+
+Two ingestions of the same file racing each other could store the same
+chunk twice. Duplicates are removed (keeping the oldest row, and the
+source's chunk count recomputed) before (source_id, embedding_id) is
+made unique.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        DELETE FROM documents
+        WHERE source_id IS NOT NULL AND embedding_id IS NOT NULL
+          AND id NOT IN (
+              SELECT MIN(id) FROM documents
+              WHERE source_id IS NOT NULL AND embedding_id IS NOT NULL
+              GROUP BY source_id, embedding_id
+          )
+    """)
+    op.execute("""
+        UPDATE sources SET chunk_count = (
+            SELECT COUNT(*) FROM documents d WHERE d.source_id = sources.id
+        )
+    """)
+    op.create_index(
+        "uq_documents_source_embedding", "documents", ["source_id", "embedding_id"], unique=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uq_documents_source_embedding", table_name="documents")
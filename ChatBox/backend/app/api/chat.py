@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import List, Optional
-from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
 from app.core.database import get_db
 from app.services.chat_service import ChatService
-from app.services.vector_service import VectorService
+from app.services.vector_service import VectorService, get_vector_service
+from app.services.answer_cache import SemanticAnswerCache, get_answer_cache
 
 router = APIRouter()
 
@@ -16,46 +21,160 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     answer: str
     conversation_id: int
-    message_id: int
+    message_id: Optional[int] = None  # None while write-behind has not stored it yet
     sources: List[str] = []
     tokens_used: Optional[int] = None
+    cached: bool = False
+    prompt_tokens: Optional[Dict[str, int]] = None
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    vector_service: VectorService = Depends(get_vector_service),
+    answer_cache: Optional[SemanticAnswerCache] = Depends(get_answer_cache)
 ):
     """Chat endpoint with RAG capabilities"""
     try:
-        chat_service = ChatService(db)
-        vector_service = VectorService()
+        chat_service = ChatService(db, answer_cache)
         
         # Get relevant documents using RAG
-        relevant_docs = await vector_service.search_documents(request.message, top_k=3)
+        try:
+            retrieval = await vector_service.search(request.message, top_k=settings.RETRIEVAL_TOP_K)
+        except Exception as e:
+            print(f"Vector search error: {e}")
+            retrieval = None
         
         # Generate response using LLM
         response = await chat_service.generate_response(
             user_id=request.user_id,
             message=request.message,
             conversation_id=request.conversation_id,
-            context_docs=relevant_docs
+            context_docs=retrieval["documents"] if retrieval else [],
+            retrieval=retrieval
         )
         
+        # Fold older turns into the conversation summary after responding
+        background_tasks.add_task(chat_service.memory.update, response["conversation_id"])
+        
         return response
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
+@router.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    db: AsyncSession = Depends(get_db),
+    vector_service: VectorService = Depends(get_vector_service),
+    answer_cache: Optional[SemanticAnswerCache] = Depends(get_answer_cache)
+):
+    """Chat endpoint streaming the answer as server-sent events.
+    
+    Events: `sources` (conversation id, null for a new conversation, and
+    retrieved context), then one `token` per generated fragment, then
+    `done` with conversation_id, message_id, tokens_used and ttfb_ms (or
+    `error` with the fallback answer).
+    When the client disconnects, Starlette cancels this generator, which
+    closes the upstream completion request.
+    """
+    chat_service = ChatService(db, answer_cache)
+    
+    try:
+        retrieval = await vector_service.search(request.message, top_k=settings.RETRIEVAL_TOP_K)
+    except Exception as e:
+        print(f"Vector search error: {e}")
+        retrieval = None
+    
+    # The conversation id of a new conversation is only known once the turn is stored
+    stored: Dict[str, int] = {}
+    
+    async def event_stream():
+        async for event in chat_service.stream_response(
+            user_id=request.user_id,
+            message=request.message,
+            conversation_id=request.conversation_id,
+            context_docs=retrieval["documents"] if retrieval else [],
+            retrieval=retrieval
+        ):
+            if event["event"] in ("done", "error"):
+                stored["conversation_id"] = event["data"]["conversation_id"]
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+    
+    async def update_memory():
+        # Fold older turns into the conversation summary after the stream has closed
+        if "conversation_id" in stored:
+            await chat_service.memory.update(stored["conversation_id"])
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(update_memory)
+    )
+
 @router.get("/chat/history/{user_id}")
 async def get_chat_history(
     user_id: int,
     limit: int = 50,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    format: str = "json",
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get chat history for a user"""
+    """Stream chat history for a user, newest conversation first.
+    
+    format=json (default) streams {"history": [...], "next_cursor": ...};
+    format=ndjson streams one JSON object per line: "conversation" and
+    "message" records, then a final "cursor" record. Pass next_cursor (or
+    "<conversation_id>.<message_id>" of the last message received) as
+    `cursor` to continue.
+    """
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
     try:
-        chat_service = ChatService(db)
-        history = await chat_service.get_user_history(user_id, limit)
-        return {"history": history}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching history: {str(e)}")
+        parsed_cursor = ChatService.parse_history_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    chat_service = ChatService(db)
+    records = chat_service.iter_user_history(user_id, limit, parsed_cursor)
+    if format == "ndjson":
+        body, media_type = _history_ndjson(records), "application/x-ndjson"
+    else:
+        body, media_type = _history_json(records), "application/json"
+    return StreamingResponse(_buffered(body), media_type=media_type)
+
+async def _history_ndjson(records):
+    async for kind, record in records:
+        if kind == "cursor":
+            record = {"next_cursor": record}
+        yield json.dumps({"type": kind, **record}, ensure_ascii=False) + "\n"
+
+async def _history_json(records):
+    """Render records as {"history": [{..., "messages": [...]}], "next_cursor": ...}"""
+    yield '{"history": ['
+    open_conversation = False
+    first_message = True
+    async for kind, record in records:
+        if kind == "conversation":
+            yield ("]}, " if open_conversation else "") + json.dumps(record, ensure_ascii=False)[:-1] + ', "messages": ['
+            open_conversation, first_message = True, True
+        elif kind == "message":
+            message = {"role": record["role"], "content": record["content"], "timestamp": record["timestamp"]}
+            yield ("" if first_message else ", ") + json.dumps(message, ensure_ascii=False)
+            first_message = False
+        else:
+            yield ("]}" if open_conversation else "") + f'], "next_cursor": {json.dumps(record)}}}'
+
+async def _buffered(chunks, size: int = 64 * 1024):
+    """Join small chunks so each write to the socket is about `size` bytes"""
+    buffer, buffered = [], 0
+    async for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield "".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield "".join(buffer)
@@ -1,7 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from typing import List, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import get_db
 from app.services.conversation_service import ConversationService
 
@@ -9,36 +9,61 @@ router = APIRouter()
 
 class ConversationResponse(BaseModel):
     id: int
-    title: str
+    title: Optional[str]
     summary: Optional[str]
     created_at: str
+    last_message_at: str
     message_count: int
 
+class ConversationPage(BaseModel):
+    conversations: List[ConversationResponse]
+    next_cursor: Optional[str] = None
+
 class MessageResponse(BaseModel):
     id: int
     role: str
     content: str
     created_at: str
 
-@router.get("/conversations/{user_id}", response_model=List[ConversationResponse])
+@router.get("/conversations/{user_id}", response_model=ConversationPage)
 async def get_user_conversations(
     user_id: int,
-    skip: int = 0,
-    limit: int = 20,
-    db: Session = Depends(get_db)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get all conversations for a user"""
+    """Get a page of conversations for a user, most recently active first"""
     try:
         conversation_service = ConversationService(db)
-        conversations = await conversation_service.get_user_conversations(user_id, skip, limit)
-        return conversations
+        return await conversation_service.get_user_conversations(user_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching conversations: {str(e)}")
 
+class ConversationSearchResult(BaseModel):
+    id: int
+    title: Optional[str]
+    created_at: str
+    message_id: int
+    snippet: Optional[str]
+    rank: float
+
+@router.get("/conversations/{user_id}/search", response_model=List[ConversationSearchResult])
+async def search_conversations(
+    user_id: int,
+    q: str,
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_db)
+):
+    """Full-text search over a user's conversations, best match first"""
+    conversation_service = ConversationService(db)
+    return await conversation_service.search_conversations(user_id, q, limit)
+
 @router.get("/conversations/{conversation_id}/messages", response_model=List[MessageResponse])
 async def get_conversation_messages(
     conversation_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get all messages in a conversation"""
     try:
@@ -48,10 +73,23 @@ async def get_conversation_messages(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching messages: {str(e)}")
 
+@router.get("/conversations/{conversation_id}/summary")
+async def get_conversation_summary(
+    conversation_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the rolling summary of a conversation"""
+    try:
+        conversation_service = ConversationService(db)
+        summary = await conversation_service.get_conversation_summary(conversation_id)
+        return {"conversation_id": conversation_id, "summary": summary}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching summary: {str(e)}")
+
 @router.delete("/conversations/{conversation_id}")
 async def delete_conversation(
     conversation_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete a conversation"""
     try:
@@ -65,7 +103,7 @@ async def delete_conversation(
 async def update_conversation_title(
     conversation_id: int,
     title: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update conversation title"""
     try:
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
 from pydantic import BaseModel
-from typing import List
-from sqlalchemy.orm import Session
+from typing import List, Dict, Any, Optional
+from datetime import datetime
+import time
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import get_db
 from app.services.document_service import DocumentService
+from app.services.ingestion_queue import IngestionQueue, IngestionQueueFull, get_ingestion_queue
+from app.services.vector_service import VectorService, get_vector_service
 
 router = APIRouter()
 
@@ -11,60 +15,127 @@ class DocumentResponse(BaseModel):
     id: int
     title: str
     source: str
-    document_type: str
+    document_type: Optional[str]
     created_at: str
+    last_ingested_at: str
+    chunk_count: int
+    total_bytes: int
 
-@router.post("/documents/ingest")
+class DocumentPage(BaseModel):
+    documents: List[DocumentResponse]
+    next_cursor: Optional[str] = None
+
+class IngestJobResponse(BaseModel):
+    job_id: str
+    status: str
+    priority: int
+    filename: str
+    chunks_done: int
+    chunks_total: Optional[int] = None
+    chunks_per_second: Optional[float] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+def _job_response(job: Dict[str, Any]) -> IngestJobResponse:
+    throughput = None
+    if job["started_at"] is not None:
+        elapsed = (job["finished_at"] or time.time()) - job["started_at"]
+        throughput = round(job["chunks_done"] / elapsed, 1) if elapsed > 0 else None
+    return IngestJobResponse(
+        job_id=job["id"],
+        status=job["status"],
+        priority=job["priority"],
+        filename=job["filename"],
+        chunks_done=job["chunks_done"],
+        chunks_total=job["chunks_total"],
+        chunks_per_second=throughput,
+        created_at=datetime.utcfromtimestamp(job["created_at"]),
+        started_at=datetime.utcfromtimestamp(job["started_at"]) if job["started_at"] is not None else None,
+        finished_at=datetime.utcfromtimestamp(job["finished_at"]) if job["finished_at"] is not None else None,
+        result=job["result"],
+        error=job["error"]
+    )
+
+def _require_queue() -> IngestionQueue:
+    queue = get_ingestion_queue()
+    if queue is None:
+        raise HTTPException(status_code=503, detail="Ingestion queue is not running")
+    return queue
+
+@router.post("/documents/ingest", status_code=202, response_model=IngestJobResponse)
 async def ingest_document(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    priority: int = 0,
+    queue: IngestionQueue = Depends(_require_queue)
 ):
-    """Ingest a new document into the system"""
+    """Queue a document for ingestion; poll GET /documents/jobs/{job_id} for progress.
+    
+    Jobs with a higher priority run first. When too many jobs are waiting
+    the upload is refused with 429 and should be retried later.
+    """
+    # Validate file type
+    if not file.filename.endswith(('.txt', '.md', '.pdf')):
+        raise HTTPException(
+            status_code=400, 
+            detail="Only .txt, .md, and .pdf files are supported"
+        )
+    
     try:
-        document_service = DocumentService(db)
-        
-        # Validate file type
-        if not file.filename.endswith(('.txt', '.md', '.pdf')):
-            raise HTTPException(
-                status_code=400, 
-                detail="Only .txt, .md, and .pdf files are supported"
-            )
-        
-        # Process and store document
-        result = await document_service.ingest_document(file)
-        
-        return {
-            "message": "Document ingested successfully",
-            "document_id": result["document_id"],
-            "chunks_created": result["chunks_created"]
-        }
-        
+        job = await queue.submit(file, priority=priority)
+    except IngestionQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ingestion error: {str(e)}")
+    return _job_response(job)
 
-@router.get("/documents", response_model=List[DocumentResponse])
+@router.get("/documents/jobs/{job_id}", response_model=IngestJobResponse)
+async def get_ingest_job(job_id: str, queue: IngestionQueue = Depends(_require_queue)):
+    """Status, chunk progress and throughput of an ingestion job"""
+    job = await queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
+
+@router.get("/documents", response_model=DocumentPage)
 async def list_documents(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    vector_service: VectorService = Depends(get_vector_service)
 ):
-    """List all documents in the system"""
+    """Get a page of documents (one per ingested file), most recently ingested first"""
     try:
-        document_service = DocumentService(db)
-        documents = await document_service.list_documents(skip, limit)
-        return documents
+        document_service = DocumentService(db, vector_service)
+        return await document_service.list_documents(limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing documents: {str(e)}")
 
+@router.get("/documents/stats")
+async def get_document_stats(
+    db: AsyncSession = Depends(get_db),
+    vector_service: VectorService = Depends(get_vector_service)
+):
+    """Document, chunk and byte totals, plus vector store statistics"""
+    document_service = DocumentService(db, vector_service)
+    return await document_service.get_document_stats()
+
 @router.delete("/documents/{document_id}")
 async def delete_document(
     document_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    vector_service: VectorService = Depends(get_vector_service)
 ):
-    """Delete a document from the system"""
+    """Delete a document (an ingested file, by its listing id) with all its chunks"""
     try:
-        document_service = DocumentService(db)
-        await document_service.delete_document(document_id)
-        return {"message": "Document deleted successfully"}
+        document_service = DocumentService(db, vector_service)
+        deleted = await document_service.delete_document(document_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting document: {str(e)}")
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"message": "Document deleted successfully"}
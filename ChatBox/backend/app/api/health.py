@@ -1,23 +1,34 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import get_db
+from app.services.vector_service import current_vector_service
 
 router = APIRouter()
 
 @router.get("/health")
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_db)):
     """Health check endpoint"""
+    # Never initialise the vector store from here: if startup couldn't,
+    # report it as not ready instead of failing the health check
+    vector_service = current_vector_service()
+    if vector_service is None:
+        vector_store = {"status": "not_ready", "error": "Vector service not initialized"}
+    else:
+        vector_store = vector_service.health()
     try:
         # Test database connection
-        db.execute("SELECT 1")
+        await db.execute(text("SELECT 1"))
         return {
-            "status": "healthy",
+            "status": "healthy" if vector_store["status"] == "ready" else "degraded",
             "database": "connected",
+            "vector_store": vector_store,
             "timestamp": "2024-01-01T00:00:00Z"
         }
     except Exception as e:
         return {
             "status": "unhealthy",
             "database": "disconnected",
+            "vector_store": vector_store,
             "error": str(e)
         }
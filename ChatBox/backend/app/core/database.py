@@ -1,25 +1,78 @@
-from sqlalchemy import create_engine
+from pathlib import Path
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
+# DATABASE_URL keeps its plain (sync) form for Alembic; the app talks to the
+# same database through the matching asyncio driver
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    return parsed.set(
+        drivername=ASYNC_DRIVERS.get(parsed.get_backend_name(), parsed.drivername)
+    ).render_as_string(hide_password=False)
+
+def create_engine_from_settings():
+    url = async_database_url(settings.DATABASE_URL)
+    options = {"pool_pre_ping": True, "echo": False}
+    if make_url(url).get_backend_name() != "sqlite":
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_timeout=settings.DB_POOL_TIMEOUT
+        )
+    return create_async_engine(url, **options)
+
 # Create database engine
-engine = create_engine(
-    settings.DATABASE_URL,
-    pool_pre_ping=True,
-    echo=False
-)
+engine = create_engine_from_settings()
 
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Create session factory. Objects stay usable after commit: reloading
+# expired attributes would be implicit I/O, which AsyncSession forbids.
+AsyncSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 
 # Create base class for models
 Base = declarative_base()
 
 # Dependency to get database session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
+
+async def close_db():
+    await engine.dispose()
+
+def run_migrations(revision: str = "head"):
+    """Upgrade the database schema with the Alembic migrations in backend/alembic"""
+    from alembic import command
+    from alembic.config import Config
+
+    backend_dir = Path(__file__).resolve().parents[2]
+    config = Config(str(backend_dir / "alembic.ini"))
+    config.set_main_option("script_location", str(backend_dir / "alembic"))
+    if _created_without_migrations():
+        # Tables from the old Base.metadata.create_all match revision 0001
+        print("Existing schema has no Alembic revision; stamping it at 0001")
+        command.stamp(config, "0001")
+    command.upgrade(config, revision)
+
+def _created_without_migrations() -> bool:
+    """True for databases built by create_all before migrations existed"""
+    from sqlalchemy import create_engine, inspect, text
+
+    sync_engine = create_engine(settings.DATABASE_URL)
+    try:
+        with sync_engine.connect() as connection:
+            tables = set(inspect(connection).get_table_names())
+            if "conversations" not in tables:
+                return False
+            if "alembic_version" not in tables:
+                return True
+            return connection.execute(text("SELECT COUNT(*) FROM alembic_version")).scalar() == 0
     finally:
-        db.close()
+        sync_engine.dispose()
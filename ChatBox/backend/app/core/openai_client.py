@@ -0,0 +1,159 @@
+import asyncio
+import json
+from typing import List, Dict, Any, Optional, AsyncIterator
+import httpx
+from app.core.config import settings
+
+class OpenAIError(Exception):
+    """Error response (or transport failure) from the OpenAI-compatible API"""
+    
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class OpenAIClient:
+    """Async client for an OpenAI-compatible API, shared by the whole process.
+    
+    One httpx.AsyncClient keeps a pool of keep-alive connections; a
+    semaphore caps in-flight requests so bursts queue here instead of
+    piling onto the upstream; every call has its own timeout.
+    """
+    
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        api_key = settings.OPENAI_API_KEY if api_key is None else api_key
+        self._client = httpx.AsyncClient(
+            base_url=base_url or settings.OPENAI_BASE_URL,
+            headers={"Authorization": f"Bearer {api_key}"} if api_key else {},
+            timeout=httpx.Timeout(settings.OPENAI_CHAT_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=30.0
+            ),
+            transport=transport
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency or settings.OPENAI_MAX_CONCURRENCY)
+    
+    async def chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        max_tokens: int = 500,
+        temperature: float = 0.2,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """POST /chat/completions and return the decoded response"""
+        return await self._post(
+            "/chat/completions",
+            {
+                "model": model or settings.OPENAI_MODEL,
+                "messages": messages,
+                "max_tokens": max_tokens,
+                "temperature": temperature
+            },
+            timeout or settings.OPENAI_CHAT_TIMEOUT
+        )
+    
+    async def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        max_tokens: int = 500,
+        temperature: float = 0.2,
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """POST /chat/completions with stream=true and yield each decoded chunk.
+        
+        The last chunk carries "usage". Closing the iterator (or cancelling
+        the task driving it) closes the HTTP response, which aborts the
+        generation upstream.
+        """
+        payload = {
+            "model": model or settings.OPENAI_MODEL,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }
+        async with self._semaphore:
+            try:
+                async with self._client.stream(
+                    "POST", "/chat/completions", json=payload, timeout=timeout or settings.OPENAI_CHAT_TIMEOUT
+                ) as response:
+                    if response.status_code >= 400:
+                        body = await response.aread()
+                        raise OpenAIError(
+                            f"/chat/completions returned {response.status_code}: {body[:200]!r}",
+                            status_code=response.status_code
+                        )
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        yield json.loads(data)
+            except httpx.TimeoutException as e:
+                raise OpenAIError(f"Streaming /chat/completions timed out: {str(e)}") from e
+            except httpx.HTTPError as e:
+                raise OpenAIError(f"Streaming /chat/completions failed: {str(e)}") from e
+    
+    async def embeddings(
+        self,
+        inputs: List[str],
+        model: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> List[List[float]]:
+        """POST /embeddings and return the vectors in input order"""
+        data = await self._post(
+            "/embeddings",
+            {"model": model or settings.OPENAI_EMBEDDING_MODEL, "input": inputs},
+            timeout or settings.OPENAI_EMBEDDING_TIMEOUT
+        )
+        # The API may return items out of order; restore input order
+        items = sorted(data["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in items]
+    
+    async def _post(self, path: str, payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        async with self._semaphore:
+            try:
+                response = await self._client.post(path, json=payload, timeout=timeout)
+            except httpx.TimeoutException as e:
+                raise OpenAIError(f"Request to {path} timed out after {timeout}s") from e
+            except httpx.HTTPError as e:
+                raise OpenAIError(f"Request to {path} failed: {str(e)}") from e
+        if response.status_code >= 400:
+            raise OpenAIError(
+                f"{path} returned {response.status_code}: {response.text[:200]}",
+                status_code=response.status_code
+            )
+        return response.json()
+    
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+# Process-wide instance shared by all requests
+_openai_client: Optional[OpenAIClient] = None
+
+# Dependency to get the shared API client
+def get_openai_client() -> OpenAIClient:
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = OpenAIClient()
+    return _openai_client
+
+async def close_openai_client() -> None:
+    """Close pooled connections (called at shutdown)"""
+    global _openai_client
+    client, _openai_client = _openai_client, None
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,39 @@
+import threading
+from typing import Optional
+import redis
+import redis.asyncio
+from app.core.config import settings
+
+_client: Optional[redis.Redis] = None
+_client_lock = threading.Lock()
+_async_client: Optional[redis.asyncio.Redis] = None
+
+def get_redis() -> redis.Redis:
+    """Return the process-wide Redis client (connections are pooled and opened lazily)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = redis.Redis.from_url(
+                settings.REDIS_URL,
+                socket_connect_timeout=1,
+                socket_timeout=1
+            )
+        return _client
+
+def close_redis() -> None:
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """Return the process-wide asyncio Redis client, for calls made on the event loop"""
+    global _async_client
+    if _async_client is None:
+        _async_client = redis.asyncio.Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=1,
+            socket_timeout=1
+        )
+    return _async_client
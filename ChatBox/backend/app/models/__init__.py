@@ -3,6 +3,7 @@ from .user import User
 from .conversation import Conversation
 from .message import Message
 from .document import Document
+from .source import Source
 
 __all__ = [
     "Base",
@@ -10,5 +11,6 @@ __all__ = [
     "User",
     "Conversation",
     "Message",
-    "Document"
+    "Document",
+    "Source"
 ]
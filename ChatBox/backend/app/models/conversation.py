@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime, Index
 from sqlalchemy.orm import relationship
+from datetime import datetime
 from .base import Base, TimestampMixin
 
 class Conversation(Base, TimestampMixin):
@@ -9,7 +10,19 @@ class Conversation(Base, TimestampMixin):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     title = Column(String(255), nullable=True)
     summary = Column(Text, nullable=True)
+    # Last message folded into summary; later messages are kept verbatim
+    summary_message_id = Column(Integer, nullable=True)
+    # Maintained on message insert/delete (see app.models.message) so listing
+    # needs no per-conversation COUNT
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Keyset pagination of a user's conversations, most recent first
+        Index("ix_conversations_user_last_message", "user_id", "last_message_at", "id"),
+        Index("ix_conversations_user_created", "user_id", "created_at"),
+    )
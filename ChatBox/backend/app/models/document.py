@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, Float
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, Float, Index
 from sqlalchemy.orm import relationship
 from .base import Base, TimestampMixin
 
@@ -8,7 +8,9 @@ class Document(Base, TimestampMixin):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
     content = Column(Text, nullable=False)
+    content_hash = Column(String(32), nullable=True)  # md5 of content, for incremental re-ingestion
     source = Column(String(255), nullable=True)
+    source_id = Column(Integer, ForeignKey("sources.id", ondelete="CASCADE"), nullable=True)
     file_path = Column(String(500), nullable=True)
     chunk_id = Column(String(100), nullable=True)  # For vector store reference
     embedding_id = Column(String(100), nullable=True)  # Vector store ID
@@ -17,3 +19,14 @@ class Document(Base, TimestampMixin):
     document_type = Column(String(50), nullable=True)
     page_number = Column(Integer, nullable=True)
     chunk_index = Column(Integer, nullable=True)
+    heading_path = Column(Text, nullable=True)  # enclosing Markdown headings, joined with " > "
+    
+    __table_args__ = (
+        # Re-ingestion and deletion look chunks up by source file and by vector id
+        Index("ix_documents_source", "source"),
+        Index("ix_documents_embedding_id", "embedding_id"),
+        # A source's chunks, for re-ingestion and bulk deletion
+        Index("ix_documents_source_id", "source_id"),
+        # A chunk vector is stored once per source, even if two ingestions race
+        Index("uq_documents_source_embedding", "source_id", "embedding_id", unique=True),
+    )
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, Enum
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, Enum, DDL, Index, event, func, select, case
 from sqlalchemy.orm import relationship
 import enum
 from .base import Base, TimestampMixin
+from .conversation import Conversation
 
 class MessageRole(str, enum.Enum):
     USER = "user"
@@ -19,3 +20,68 @@ class Message(Base, TimestampMixin):
     
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
+    
+    __table_args__ = (
+        # A conversation's messages in order (history, memory, export)
+        Index("ix_messages_conversation_created", "conversation_id", "created_at"),
+    )
+
+
+# Keep Conversation.message_count / last_message_at in step with ORM message
+# writes, in the same transaction. Bulk query.delete() bypasses these hooks.
+@event.listens_for(Message, "after_insert")
+def _count_inserted_message(mapper, connection, target):
+    conversations = Conversation.__table__
+    connection.execute(
+        conversations.update()
+        .where(conversations.c.id == target.conversation_id)
+        .values(
+            message_count=conversations.c.message_count + 1,
+            last_message_at=case(
+                (conversations.c.last_message_at < target.created_at, target.created_at),
+                else_=conversations.c.last_message_at
+            )
+        )
+    )
+
+@event.listens_for(Message, "after_delete")
+def _count_deleted_message(mapper, connection, target):
+    conversations = Conversation.__table__
+    messages = Message.__table__
+    latest = select(func.max(messages.c.created_at)).where(
+        messages.c.conversation_id == target.conversation_id
+    ).scalar_subquery()
+    connection.execute(
+        conversations.update()
+        .where(conversations.c.id == target.conversation_id)
+        .values(
+            message_count=conversations.c.message_count - 1,
+            last_message_at=func.coalesce(latest, conversations.c.created_at)
+        )
+    )
+
+
+# Full-text search over message content (see ConversationService.search_conversations).
+# Postgres: a generated tsvector column with a GIN index. The 'simple'
+# configuration only lowercases, which suits Vietnamese (no stemmer).
+for statement in (
+    "ALTER TABLE messages ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED",
+    "CREATE INDEX ix_messages_search_vector ON messages USING GIN (search_vector)",
+):
+    event.listen(Message.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+# SQLite: an external-content FTS5 table kept in sync by triggers;
+# remove_diacritics lets "gia cuoc" match "giá cước".
+for statement in (
+    "CREATE VIRTUAL TABLE messages_fts USING fts5("
+    "content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+):
+    event.listen(Message.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
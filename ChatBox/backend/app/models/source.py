@@ -0,0 +1,22 @@
+from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, String
+from .base import Base, TimestampMixin
+
+class Source(Base, TimestampMixin):
+    """One ingested file; its chunks are the `documents` rows pointing at it"""
+    __tablename__ = "sources"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(255), nullable=False, unique=True)  # file name, also documents.source
+    document_type = Column(String(50), nullable=True)
+    # "active", or "deleting" from the start of a delete until its rows are gone;
+    # deletes left in that state by a crash are finished on startup
+    status = Column(String(20), nullable=False, default="active", server_default="active")
+    # Aggregates over the chunks, updated by every ingestion
+    chunk_count = Column(Integer, nullable=False, default=0, server_default="0")
+    total_bytes = Column(BigInteger, nullable=False, default=0, server_default="0")  # size of the ingested file
+    last_ingested_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Keyset pagination of the document listing, most recently ingested first
+        Index("ix_sources_last_ingested", "last_ingested_at", "id"),
+    )
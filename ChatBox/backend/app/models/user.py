@@ -1,4 +1,5 @@
 from sqlalchemy import Column, Integer, String, Boolean
+from sqlalchemy.orm import relationship
 from .base import Base, TimestampMixin
 
 class User(Base, TimestampMixin):
@@ -10,3 +11,6 @@ class User(Base, TimestampMixin):
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
     is_superuser = Column(Boolean, default=False)
+    
+    # Relationships
+    conversations = relationship("Conversation", back_populates="user")
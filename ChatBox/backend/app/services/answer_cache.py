@@ -0,0 +1,180 @@
+import math
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Set, FrozenSet, Tuple
+from app.core.config import settings
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    if norm == 0:
+        return vector
+    return [x / norm for x in vector]
+
+class AnswerCacheEntry:
+    def __init__(
+        self,
+        embedding: List[float],
+        version: Optional[str],
+        source_ids: FrozenSet[str],
+        sources: Set[str],
+        answer: str
+    ):
+        self.embedding = embedding
+        self.version = version
+        self.source_ids = source_ids
+        self.sources = sources
+        self.answer = answer
+
+
+class SemanticAnswerCache:
+    """Serve stored answers for near-duplicate questions.
+    
+    An entry holds the normalized query embedding, the set of retrieved
+    chunk ids and the answer. A new question hits when it retrieved exactly
+    the same chunks and its cosine similarity with a cached query is at
+    least the threshold. Entries are dropped when any of their chunks or
+    source files are deleted or re-ingested.
+    
+    The cache is per process, and so are those drops. Entries are
+    therefore also keyed by the corpus version the chunks were retrieved
+    at (see RetrievalCache). A change made in any process bumps the shared
+    version, so its entries stop matching everywhere and age out of the LRU.
+    """
+    
+    def __init__(self, threshold: float, max_entries: int):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._next_id = 0
+        self._entries: "OrderedDict[int, AnswerCacheEntry]" = OrderedDict()
+        self._by_source_ids: Dict[Tuple[Optional[str], FrozenSet[str]], Set[int]] = {}
+        self._by_chunk: Dict[str, Set[int]] = {}
+        self._by_source: Dict[str, Set[int]] = {}
+        self._lock = threading.Lock()
+    
+    def lookup(
+        self,
+        query_embedding: List[float],
+        source_ids: List[str],
+        version: Optional[str] = None
+    ) -> Optional[str]:
+        """Return a cached answer for a similar question over the same
+        sources, retrieved at the same corpus `version`"""
+        if not source_ids:
+            return None
+        query = _normalize(query_embedding)
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id in self._by_source_ids.get((version, frozenset(source_ids)), ()):
+                entry = self._entries[entry_id]
+                score = sum(a * b for a, b in zip(query, entry.embedding))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id].answer
+    
+    def store(
+        self,
+        query_embedding: List[float],
+        source_ids: List[str],
+        answer: str,
+        sources: Optional[List[str]] = None,
+        version: Optional[str] = None
+    ) -> None:
+        """Cache an answer generated from the given retrieved chunks"""
+        if not source_ids:
+            return
+        entry = AnswerCacheEntry(
+            _normalize(query_embedding),
+            version,
+            frozenset(source_ids),
+            {source for source in (sources or []) if source},
+            answer
+        )
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._by_source_ids.setdefault((entry.version, entry.source_ids), set()).add(entry_id)
+            for chunk_id in entry.source_ids:
+                self._by_chunk.setdefault(chunk_id, set()).add(entry_id)
+            for source in entry.sources:
+                self._by_source.setdefault(source, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+    
+    def invalidate_chunks(self, chunk_ids: List[str]) -> int:
+        """Drop entries built from any of these vector-store chunk ids"""
+        with self._lock:
+            entry_ids = set()
+            for chunk_id in chunk_ids:
+                entry_ids |= self._by_chunk.get(chunk_id, set())
+            for entry_id in entry_ids:
+                self._remove(entry_id)
+            return len(entry_ids)
+    
+    def invalidate_sources(self, sources: List[str]) -> int:
+        """Drop entries built from any chunk of these source files"""
+        with self._lock:
+            entry_ids = set()
+            for source in sources:
+                entry_ids |= self._by_source.get(source, set())
+            for entry_id in entry_ids:
+                self._remove(entry_id)
+            return len(entry_ids)
+    
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self._discard(self._by_source_ids, (entry.version, entry.source_ids), entry_id)
+        for chunk_id in entry.source_ids:
+            self._discard(self._by_chunk, chunk_id, entry_id)
+        for source in entry.sources:
+            self._discard(self._by_source, source, entry_id)
+    
+    @staticmethod
+    def _discard(index: Dict[Any, Set[int]], key: Any, entry_id: int) -> None:
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del index[key]
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_source_ids.clear()
+            self._by_chunk.clear()
+            self._by_source.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "threshold": self.threshold
+        }
+
+
+# Process-wide instance shared by all requests
+_answer_cache: Optional[SemanticAnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+# Dependency to get the shared answer cache (None when disabled)
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    global _answer_cache
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = SemanticAnswerCache(
+                threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+                max_entries=settings.ANSWER_CACHE_MAX_ENTRIES
+            )
+        return _answer_cache
@@ -1,116 +1,306 @@
-import openai
-from typing import List, Dict, Any
-from sqlalchemy.orm import Session
+import time
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
+from app.core.openai_client import OpenAIClient, OpenAIError, get_openai_client
 from app.models.conversation import Conversation
 from app.models.message import Message, MessageRole
 from app.models.user import User
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.context_assembler import ContextAssembler, count_tokens
+from app.services.conversation_memory import ConversationMemory
+from app.services.message_writer import MessageWriter, get_message_writer
 from datetime import datetime
 
+FALLBACK_ANSWER = "Xin lỗi, tôi đang gặp sự cố. Vui lòng thử lại sau."
+
 class ChatService:
-    def __init__(self, db: Session):
+    def __init__(
+        self,
+        db: AsyncSession,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        llm: Optional[OpenAIClient] = None,
+        message_writer: Optional[MessageWriter] = None
+    ):
         self.db = db
-        openai.api_key = settings.OPENAI_API_KEY
+        self.answer_cache = answer_cache
+        self.llm = llm or get_openai_client()
+        self.message_writer = message_writer or get_message_writer()
+        self.context_assembler = ContextAssembler()
+        self.memory = ConversationMemory(db, self.llm)
         
     async def generate_response(
         self,
         user_id: int,
         message: str,
         conversation_id: int = None,
-        context_docs: List[str] = []
+        context_docs: List[str] = [],
+        retrieval: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
-        """Generate AI response using LLM with RAG context"""
+        """Generate AI response using LLM with RAG context and conversation memory.
         
-        # Get or create conversation
-        if not conversation_id:
-            conversation = self._create_conversation(user_id, message)
-            conversation_id = conversation.id
+        The turn (new conversation, question and answer) is stored once the
+        answer is ready; with write-behind enabled `message_id` is None.
+        Call `self.memory.update(conversation_id)` afterwards (off the
+        response path) to fold older turns into the rolling summary.
+        """
+        
+        asked_at = datetime.utcnow()
+        memory = await self._load_memory(conversation_id)
+        # Follow-ups depend on the history, so only first questions use the answer cache
+        if memory["summary"] or memory["messages"]:
+            retrieval_for_cache = None
         else:
-            conversation = self.db.query(Conversation).filter(
-                Conversation.id == conversation_id
-            ).first()
-            
-        # Save user message
-        user_message = Message(
-            conversation_id=conversation_id,
-            role=MessageRole.USER,
-            content=message
-        )
-        self.db.add(user_message)
-        self.db.commit()
+            retrieval_for_cache = retrieval
+        
+        # Serve near-duplicate questions over the same sources from the cache
+        cached_answer = self._lookup_cached_answer(retrieval_for_cache)
+        if cached_answer is not None:
+            conversation_id, message_id = await self._save_turn(
+                user_id, conversation_id, message, asked_at, cached_answer, 0
+            )
+            return {
+                "answer": cached_answer,
+                "conversation_id": conversation_id,
+                "message_id": message_id,
+                "sources": context_docs,
+                "tokens_used": 0,
+                "cached": True
+            }
         
         # Build prompt with context
-        prompt = self._build_prompt(message, context_docs)
+        prompt, prompt_tokens = self._build_prompt(message, context_docs, retrieval, memory)
         
         try:
-            # Generate response using OpenAI
-            response = openai.ChatCompletion.create(
-                model=settings.OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": prompt},
-                    {"role": "user", "content": message}
-                ],
+            # Generate response using OpenAI without blocking the event loop
+            response = await self.llm.chat_completion(
+                messages=self._build_messages(prompt, message, memory),
                 max_tokens=500,
                 temperature=0.2
             )
             
-            answer = response.choices[0].message.content
-            tokens_used = response.usage.total_tokens
-            
-            # Save AI response
-            ai_message = Message(
-                conversation_id=conversation_id,
-                role=MessageRole.ASSISTANT,
-                content=answer,
-                tokens_used=tokens_used
-            )
-            self.db.add(ai_message)
-            self.db.commit()
-            
-            return {
-                "answer": answer,
-                "conversation_id": conversation_id,
-                "message_id": ai_message.id,
-                "sources": context_docs,
-                "tokens_used": tokens_used
-            }
-            
+            answer = response["choices"][0]["message"]["content"]
+            tokens_used = response["usage"]["total_tokens"]
         except Exception as e:
-            # Fallback response
-            fallback_answer = "Xin lỗi, tôi đang gặp sự cố. Vui lòng thử lại sau."
-            
-            ai_message = Message(
-                conversation_id=conversation_id,
-                role=MessageRole.ASSISTANT,
-                content=fallback_answer
+            # Fallback response, stored with the question like any answer
+            print(f"Chat completion error: {e}")
+            conversation_id, message_id = await self._save_turn(
+                user_id, conversation_id, message, asked_at, FALLBACK_ANSWER
             )
-            self.db.add(ai_message)
-            self.db.commit()
-            
             return {
-                "answer": fallback_answer,
+                "answer": FALLBACK_ANSWER,
                 "conversation_id": conversation_id,
-                "message_id": ai_message.id,
+                "message_id": message_id,
                 "sources": [],
                 "tokens_used": 0
             }
+        
+        conversation_id, message_id = await self._save_turn(
+            user_id, conversation_id, message, asked_at, answer, tokens_used
+        )
+        self._cache_answer(retrieval_for_cache, answer)
+        return {
+            "answer": answer,
+            "conversation_id": conversation_id,
+            "message_id": message_id,
+            "sources": context_docs,
+            "tokens_used": tokens_used,
+            "prompt_tokens": prompt_tokens
+        }
     
-    def _create_conversation(self, user_id: int, first_message: str) -> Conversation:
+    async def stream_response(
+        self,
+        user_id: int,
+        message: str,
+        conversation_id: int = None,
+        context_docs: List[str] = [],
+        retrieval: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream an AI response as events: sources first, then tokens, then done.
+        
+        The turn is stored once, when the answer is complete, so `sources`
+        carries conversation_id null for a new conversation and `done`
+        carries the stored ids. If the consumer stops iterating (client
+        disconnect), the upstream request is closed and nothing is stored.
+        Like generate_response, call `self.memory.update(conversation_id)`
+        once the stream has ended (off the response path).
+        """
+        started = time.perf_counter()
+        asked_at = datetime.utcnow()
+        memory = await self._load_memory(conversation_id)
+        yield {"event": "sources", "data": {"conversation_id": conversation_id, "sources": context_docs}}
+        
+        if memory["summary"] or memory["messages"]:
+            retrieval_for_cache = None
+        else:
+            retrieval_for_cache = retrieval
+        cached_answer = self._lookup_cached_answer(retrieval_for_cache)
+        if cached_answer is not None:
+            yield {"event": "token", "data": {"content": cached_answer}}
+            ttfb_ms = (time.perf_counter() - started) * 1000
+            conversation_id, message_id = await self._save_turn(
+                user_id, conversation_id, message, asked_at, cached_answer, 0
+            )
+            yield {"event": "done", "data": {
+                "conversation_id": conversation_id,
+                "message_id": message_id,
+                "tokens_used": 0,
+                "cached": True,
+                "ttfb_ms": round(ttfb_ms, 1),
+                "total_ms": round((time.perf_counter() - started) * 1000, 1)
+            }}
+            return
+        
+        prompt, prompt_tokens = self._build_prompt(message, context_docs, retrieval, memory)
+        parts: List[str] = []
+        usage = None
+        ttfb_ms = None
+        try:
+            async for chunk in self.llm.stream_chat_completion(
+                messages=self._build_messages(prompt, message, memory),
+                max_tokens=500,
+                temperature=0.2
+            ):
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                for choice in chunk.get("choices") or []:
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        if ttfb_ms is None:
+                            ttfb_ms = (time.perf_counter() - started) * 1000
+                        parts.append(content)
+                        yield {"event": "token", "data": {"content": content}}
+        except OpenAIError as e:
+            print(f"Chat stream error: {e}")
+            conversation_id, message_id = await self._save_turn(
+                user_id, conversation_id, message, asked_at, FALLBACK_ANSWER
+            )
+            yield {"event": "error", "data": {
+                "conversation_id": conversation_id, "message_id": message_id, "answer": FALLBACK_ANSWER
+            }}
+            return
+        
+        answer = "".join(parts)
+        # Servers that ignore stream_options send no usage; one delta is about one token
+        tokens_used = usage["total_tokens"] if usage else len(parts)
+        conversation_id, message_id = await self._save_turn(
+            user_id, conversation_id, message, asked_at, answer, tokens_used
+        )
+        self._cache_answer(retrieval_for_cache, answer)
+        
+        total_ms = (time.perf_counter() - started) * 1000
+        yield {"event": "done", "data": {
+            "conversation_id": conversation_id,
+            "message_id": message_id,
+            "tokens_used": tokens_used,
+            "cached": False,
+            "ttfb_ms": round(ttfb_ms if ttfb_ms is not None else total_ms, 1),
+            "total_ms": round(total_ms, 1),
+            "prompt_tokens": prompt_tokens
+        }}
+    
+    async def _save_turn(
+        self,
+        user_id: int,
+        conversation_id: Optional[int],
+        question: str,
+        asked_at: datetime,
+        answer: str,
+        tokens_used: Optional[int] = None
+    ) -> Tuple[int, Optional[int]]:
+        """Store a question and its answer, creating the conversation if needed.
+        
+        Returns (conversation_id, assistant message id). Without write-behind
+        everything goes in one transaction, one commit. With write-behind the
+        messages are handed to the batch writer and the id is None; only a
+        new conversation is committed here, since its id is needed now.
+        """
+        new_conversation = not conversation_id
+        if new_conversation:
+            conversation = self._new_conversation(user_id, question)
+            self.db.add(conversation)
+            await self.db.flush()
+            conversation_id = conversation.id
+        
+        if self.message_writer is not None:
+            if new_conversation:
+                await self.db.commit()
+            await self.message_writer.enqueue([
+                self.message_writer.make_row(conversation_id, MessageRole.USER, question, created_at=asked_at),
+                self.message_writer.make_row(conversation_id, MessageRole.ASSISTANT, answer, tokens_used)
+            ])
+            return conversation_id, None
+        
+        ai_message = Message(
+            conversation_id=conversation_id,
+            role=MessageRole.ASSISTANT,
+            content=answer,
+            tokens_used=tokens_used
+        )
+        self.db.add_all([
+            Message(conversation_id=conversation_id, role=MessageRole.USER, content=question, created_at=asked_at),
+            ai_message
+        ])
+        await self.db.commit()
+        return conversation_id, ai_message.id
+    
+    def _lookup_cached_answer(self, retrieval: Optional[Dict[str, Any]]) -> Optional[str]:
+        if self.answer_cache is None or not retrieval:
+            return None
+        return self.answer_cache.lookup(
+            retrieval["query_embedding"], retrieval["ids"], retrieval.get("corpus_version")
+        )
+    
+    def _cache_answer(self, retrieval: Optional[Dict[str, Any]], answer: str) -> None:
+        if self.answer_cache is None or not retrieval:
+            return
+        self.answer_cache.store(
+            retrieval["query_embedding"],
+            retrieval["ids"],
+            answer,
+            sources=[metadata.get("source") for metadata in retrieval["metadatas"] if metadata],
+            version=retrieval.get("corpus_version")
+        )
+    
+    async def _load_memory(self, conversation_id: Optional[int]) -> Dict[str, Any]:
+        if not conversation_id:
+            return {"summary": None, "messages": []}
+        # Turns still queued for write-behind are part of the history too
+        unsaved = self.message_writer.pending(conversation_id) if self.message_writer is not None else None
+        return await self.memory.load(conversation_id, unsaved)
+    
+    def _build_messages(
+        self,
+        prompt: str,
+        message: str,
+        memory: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, str]]:
+        history = memory["messages"] if memory else []
+        return [
+            {"role": "system", "content": prompt},
+            *history,
+            {"role": "user", "content": message}
+        ]
+    
+    def _new_conversation(self, user_id: int, first_message: str) -> Conversation:
         """Create a new conversation"""
         # Generate title from first message
         title = first_message[:50] + "..." if len(first_message) > 50 else first_message
-        
-        conversation = Conversation(
-            user_id=user_id,
-            title=title
-        )
-        self.db.add(conversation)
-        self.db.commit()
-        self.db.refresh(conversation)
-        return conversation
+        return Conversation(user_id=user_id, title=title)
     
-    def _build_prompt(self, message: str, context_docs: List[str]) -> str:
-        """Build system prompt with RAG context"""
+    def _build_prompt(
+        self,
+        message: str,
+        context_docs: List[str],
+        retrieval: Optional[Dict[str, Any]] = None,
+        memory: Optional[Dict[str, Any]] = None
+    ) -> Tuple[str, Dict[str, int]]:
+        """Build system prompt with RAG context, fitted to the context token budget.
+        
+        Returns the prompt and the token count of each section
+        (instructions, summary, history, context, question).
+        """
         system_prompt = """Bạn là một trợ lý AI thông minh chuyên về hỗ trợ khách hàng và trả lời câu hỏi.
 
 HƯỚNG DẪN:
@@ -118,38 +308,120 @@ HƯỚNG DẪN:
 2. Nếu không có thông tin phù hợp trong context, hãy nói rõ "Tôi không tìm thấy thông tin phù hợp"
 3. Trả lời ngắn gọn, rõ ràng và hữu ích
 4. Luôn lịch sự và chuyên nghiệp
+5. Khi dùng thông tin từ CONTEXT, ghi nguồn theo nhãn [n] của đoạn đó
 
 CONTEXT:
 {context}
 
 Hãy trả lời câu hỏi của người dùng dựa trên thông tin trên."""
+        summary_section = """
+
+TÓM TẮT HỘI THOẠI TRƯỚC ĐÓ:
+{summary}"""
         
-        context_text = "\n\n".join(context_docs) if context_docs else "Không có tài liệu tham khảo."
-        return system_prompt.format(context=context_text)
+        if retrieval and retrieval.get("documents"):
+            context = self.context_assembler.assemble(
+                retrieval["documents"], retrieval.get("metadatas"), retrieval.get("scores")
+            )
+        else:
+            context = self.context_assembler.assemble(context_docs)
+        
+        context_text = context["text"] or "Không có tài liệu tham khảo."
+        summary = memory["summary"] if memory else None
+        history = memory["messages"] if memory else []
+        prompt_tokens = {
+            "instructions": count_tokens(system_prompt.format(context="")),
+            "summary": count_tokens(summary or ""),
+            "history": sum(count_tokens(msg["content"]) for msg in history),
+            "context": context["tokens"],
+            "question": count_tokens(message)
+        }
+        prompt = system_prompt.format(context=context_text)
+        if summary:
+            prompt += summary_section.format(summary=summary)
+        return prompt, prompt_tokens
     
     async def get_user_history(self, user_id: int, limit: int = 50) -> List[Dict[str, Any]]:
         """Get chat history for a user"""
-        conversations = self.db.query(Conversation).filter(
-            Conversation.user_id == user_id
-        ).order_by(Conversation.created_at.desc()).limit(limit).all()
-        
         history = []
-        for conv in conversations:
-            messages = self.db.query(Message).filter(
-                Message.conversation_id == conv.id
-            ).order_by(Message.created_at.asc()).all()
-            
-            history.append({
-                "conversation_id": conv.id,
-                "title": conv.title,
-                "messages": [
-                    {
-                        "role": msg.role.value,
-                        "content": msg.content,
-                        "timestamp": msg.created_at.isoformat()
-                    }
-                    for msg in messages
-                ]
-            })
-        
+        async for kind, record in self.iter_user_history(user_id, limit):
+            if kind == "conversation":
+                history.append({**record, "messages": []})
+            elif kind == "message":
+                history[-1]["messages"].append(record)
         return history
+    
+    async def iter_user_history(
+        self,
+        user_id: int,
+        limit: int = 50,
+        cursor: Optional[Tuple[int, int]] = None,
+        batch_size: int = 500
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Yield a user's history as ("conversation", {...}) and ("message", {...})
+        records, newest conversation first and messages in order, then
+        ("cursor", next_cursor) where next_cursor is None when nothing is left.
+        
+        One ordered outer join, read in batches of `batch_size` rows, so
+        memory stays flat however long the history is. `cursor` is the
+        (conversation_id, message_id) of the last record received; a
+        stream cut short can be resumed from its last message line.
+        """
+        query = select(
+            Conversation.id.label("conversation_id"),
+            Conversation.title,
+            Message.id.label("message_id"),
+            Message.role,
+            Message.content,
+            Message.created_at
+        ).outerjoin(
+            Message, Message.conversation_id == Conversation.id
+        ).where(Conversation.user_id == user_id)
+        
+        if cursor:
+            conversation_id, message_id = cursor
+            query = query.where(or_(
+                Conversation.id < conversation_id,
+                and_(Conversation.id == conversation_id, Message.id > message_id)
+            ))
+        
+        rows = await self.db.stream(query.order_by(
+            Conversation.id.desc(), Message.id.asc()
+        ).execution_options(yield_per=batch_size))
+        
+        conversations = 0
+        current_id = None
+        last = cursor
+        async for row in rows:
+            if row.conversation_id != current_id:
+                if conversations == limit:
+                    await rows.close()
+                    yield "cursor", self.format_history_cursor(*last)
+                    return
+                conversations += 1
+                current_id = row.conversation_id
+                last = (row.conversation_id, 0)
+                yield "conversation", {"conversation_id": row.conversation_id, "title": row.title}
+            if row.message_id is None:
+                continue
+            last = (row.conversation_id, row.message_id)
+            yield "message", {
+                "conversation_id": row.conversation_id,
+                "id": row.message_id,
+                "role": row.role.value,
+                "content": row.content,
+                "timestamp": row.created_at.isoformat()
+            }
+        yield "cursor", None
+    
+    @staticmethod
+    def format_history_cursor(conversation_id: int, message_id: int) -> str:
+        return f"{conversation_id}.{message_id}"
+    
+    @staticmethod
+    def parse_history_cursor(cursor: str) -> Tuple[int, int]:
+        try:
+            conversation_id, message_id = cursor.split(".")
+            return int(conversation_id), int(message_id)
+        except ValueError:
+            raise ValueError("Invalid cursor")
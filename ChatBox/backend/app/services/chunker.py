@@ -0,0 +1,252 @@
+import re
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from app.core.config import settings
+from app.services.context_assembler import count_tokens
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+LIST_ITEM_RE = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+")
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+# Sentence ends keep their punctuation; the whitespace after them is kept as the separator
+SENTENCE_END_RE = re.compile(r"(?<=[.!?…])(\s+)")
+SENTENCE_ENDS = (".", "!", "?", "…")
+WORD_RE = re.compile(r"\S+\s*")
+
+
+class Chunk(NamedTuple):
+    text: str
+    page_number: Optional[int]
+    heading_path: Tuple[str, ...]  # enclosing Markdown headings, outermost first
+
+
+class _Unit(NamedTuple):
+    """Smallest piece a chunk is packed from: a sentence, list item, heading or code line"""
+    text: str
+    tokens: int
+    separator: str  # whitespace that preceded it in the source
+    page_number: Optional[int]
+    is_heading: bool = False
+
+
+class MarkdownChunker:
+    """Streaming chunker sized in embedding tokens.
+
+    Text is fed in pieces (a file, or one PDF page at a time) and complete
+    chunks are yielded as soon as they fill up, so memory stays bounded by
+    one chunk plus one line. Each unit is tokenized once and every string
+    is joined once, so the work is linear in the input size.
+
+    Chunks are packed from whole sentences and list items up to
+    `max_tokens`; a unit longer than that is cut at word boundaries. The
+    last `overlap_tokens` worth of units are repeated at the start of the
+    next chunk. With `markdown`, a heading always starts a new chunk and
+    the heading path is tracked for every chunk; a lead-in line ending in
+    ":" stays with the list that follows it. Text inside code fences is
+    packed line by line and never parsed.
+    """
+
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None,
+        markdown: bool = True,
+        count: Optional[Callable[[str], int]] = None
+    ):
+        self.max_tokens = max(1, max_tokens or settings.CHUNK_MAX_TOKENS)
+        overlap = settings.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+        self.overlap_tokens = min(max(0, overlap), self.max_tokens // 2)
+        self.markdown = markdown
+        self.count = count or (lambda text: count_tokens(text, settings.OPENAI_EMBEDDING_MODEL))
+        self._headings: List[Tuple[int, str]] = []
+        self._units: List[_Unit] = []
+        self._tokens = 0
+        self._carry = ""  # incomplete last line of the previous piece
+        self._carry_page: Optional[int] = None
+        self._sentence: List[str] = []  # lines of the sentence in progress
+        self._sentence_chars = 0
+        self._sentence_page: Optional[int] = None
+        self._separator = ""
+        self._in_fence = False
+
+    def feed(self, text: str, page_number: Optional[int] = None) -> Iterator[Chunk]:
+        """Add text; yields the chunks it completes"""
+        if not text:
+            return
+        lines = text.split("\n")
+        # A line continued from the previous piece keeps the page it started on
+        line_page = self._carry_page if self._carry else page_number
+        lines[0] = self._carry + lines[0]
+        self._carry = lines.pop()
+        if lines:
+            self._carry_page = page_number
+        else:
+            self._carry_page = line_page
+        for line in lines:
+            yield from self._line(line.rstrip("\r"), line_page)
+            line_page = page_number
+
+    def close(self) -> Iterator[Chunk]:
+        """Yield what is left once the input ends"""
+        if self._carry:
+            carry, self._carry = self._carry, ""
+            yield from self._line(carry.rstrip("\r"), self._carry_page)
+        yield from self._end_paragraph()
+        yield from self._emit(keep_overlap=False)
+        self._headings = []
+        self._separator = ""
+        self._in_fence = False
+
+    def split(self, text: str) -> List[Chunk]:
+        return list(self.feed(text)) + list(self.close())
+
+    def _line(self, line: str, page_number: Optional[int]) -> Iterator[Chunk]:
+        if FENCE_RE.match(line):
+            yield from self._end_paragraph()
+            self._in_fence = not self._in_fence
+            yield from self._add(line, page_number, split=False)
+            return
+        if self._in_fence:
+            yield from self._add(line, page_number, split=False)
+            return
+        if not line.strip():
+            yield from self._end_paragraph()
+            if self._units:
+                self._separator = "\n\n"
+            return
+        heading = HEADING_RE.match(line) if self.markdown else None
+        if heading:
+            yield from self._end_paragraph()
+            # A new section: the chunk so far belongs to the previous heading path.
+            # Headings with no text of their own live on in the path only.
+            if all(unit.is_heading for unit in self._units):
+                self._units, self._tokens = [], 0
+            yield from self._emit(keep_overlap=False)
+            level = len(heading.group(1))
+            while self._headings and self._headings[-1][0] >= level:
+                self._headings.pop()
+            self._headings.append((level, heading.group(2)))
+            yield from self._add(line, page_number, split=False, is_heading=True)
+            self._separator = "\n"
+            return
+        if LIST_ITEM_RE.match(line):
+            yield from self._end_paragraph()
+            yield from self._add(line, page_number, split=False)
+            self._separator = "\n"
+            return
+        yield from self._paragraph_line(line, page_number)
+
+    def _paragraph_line(self, line: str, page_number: Optional[int]) -> Iterator[Chunk]:
+        """Add the sentences a line completes; an unfinished one waits for the next line"""
+        # pieces alternate sentence, whitespace, sentence, ...
+        pieces = SENTENCE_END_RE.split(line)
+        for i in range(0, len(pieces), 2):
+            if not self._sentence:
+                self._sentence_page = page_number
+            self._sentence.append(pieces[i])
+            self._sentence_chars += len(pieces[i])
+            last = i + 1 >= len(pieces)
+            # Bound the buffer even if the text never ends a sentence (it is cut to size)
+            if not last or pieces[i].endswith(SENTENCE_ENDS) or self._sentence_chars > self.max_tokens * 8:
+                yield from self._end_sentence()
+                self._separator = pieces[i + 1] if not last else "\n"
+
+    def _end_sentence(self) -> Iterator[Chunk]:
+        if self._sentence:
+            sentence = "\n".join(self._sentence)
+            self._sentence, self._sentence_chars = [], 0
+            yield from self._add(sentence, self._sentence_page, split=True)
+
+    def _end_paragraph(self) -> Iterator[Chunk]:
+        if self._sentence:
+            yield from self._end_sentence()
+            self._separator = "\n"
+
+    def _add(self, text: str, page_number: Optional[int], split: bool, is_heading: bool = False) -> Iterator[Chunk]:
+        """Append one unit, cut to size if it is too long"""
+        tokens = self.count(text)
+        room = self.max_tokens
+        if not is_heading and self._units and all(unit.is_heading for unit in self._units):
+            # Headings with no text yet: the first piece goes in with them,
+            # so a heading never makes a chunk of its own
+            room = self.max_tokens - self._tokens
+        if tokens > self.max_tokens or 0 < room < tokens:
+            for piece in self._cut(text, room if room > 0 else self.max_tokens):
+                yield from self._append(piece, self.count(piece), page_number, split, is_heading)
+            return
+        yield from self._append(text, tokens, page_number, split, is_heading)
+
+    def _append(self, text: str, tokens: int, page_number: Optional[int], split: bool, is_heading: bool) -> Iterator[Chunk]:
+        """Append one unit, emitting the current chunk first if it wouldn't fit"""
+        if self._units and self._tokens + tokens > self.max_tokens:
+            yield from self._emit(keep_overlap=True)
+            # Drop overlap until the new unit fits
+            while self._units and self._tokens + tokens > self.max_tokens:
+                self._tokens -= self._units.pop(0).tokens
+        self._units.append(_Unit(text, tokens, self._separator if self._units else "", page_number, is_heading))
+        self._tokens += tokens
+        self._separator = " " if split else "\n"
+
+    def _cut(self, text: str, first_tokens: int) -> Iterator[str]:
+        """Pieces of an overlong unit cut between words: the first within
+        `first_tokens`, the others within max_tokens"""
+        words: List[str] = []
+        tokens = 0
+        limit = first_tokens
+        for match in WORD_RE.finditer(text):
+            word = match.group()
+            word_tokens = self.count(word)
+            if not words and word_tokens > limit:
+                # Not even one word fits the first piece
+                limit = self.max_tokens
+            if words and tokens + word_tokens > limit:
+                yield "".join(words).rstrip()
+                words, tokens = [], 0
+                limit = self.max_tokens
+            if word_tokens > self.max_tokens:
+                # A single "word" longer than a chunk (no spaces): cut by characters
+                step = max(1, len(word) * self.max_tokens // word_tokens)
+                for start in range(0, len(word), step):
+                    yield word[start:start + step]
+                continue
+            words.append(word)
+            tokens += word_tokens
+        if words:
+            yield "".join(words).rstrip()
+
+    def _emit(self, keep_overlap: bool) -> Iterator[Chunk]:
+        if not self._units:
+            return
+        units = self._units
+        # A lead-in ("... bạn cần:") belongs with the list after it
+        lead_in = None
+        if keep_overlap and len(units) > 1 and units[-1].text.rstrip().endswith(":"):
+            lead_in = units.pop()
+        text = units[0].text + "".join(unit.separator + unit.text for unit in units[1:])
+        yield Chunk(text, units[0].page_number, tuple(title for _, title in self._headings))
+
+        kept: List[_Unit] = []
+        if keep_overlap and self.overlap_tokens:
+            tokens = 0
+            # Trailing units, never the whole chunk (each chunk must add something new)
+            for unit in reversed(units[1:]):
+                if tokens + unit.tokens > self.overlap_tokens:
+                    break
+                kept.append(unit)
+                tokens += unit.tokens
+            kept.reverse()
+        if lead_in is not None:
+            kept.append(lead_in)
+        if kept:
+            kept[0] = kept[0]._replace(separator="")
+        self._units = kept
+        self._tokens = sum(unit.tokens for unit in kept)
+
+
+def chunk_stream(
+    pieces: Iterable[Tuple[str, Optional[int]]],
+    chunker: Optional[MarkdownChunker] = None
+) -> Iterator[Chunk]:
+    """Chunks of a stream of (text, page number) pieces, as a generator"""
+    chunker = chunker or MarkdownChunker()
+    for text, page_number in pieces:
+        yield from chunker.feed(text, page_number)
+    yield from chunker.close()
@@ -0,0 +1,204 @@
+import hashlib
+import os
+import re
+from functools import lru_cache
+from typing import List, Dict, Any, Optional
+from app.core.config import settings
+
+WORD_RE = re.compile(r"\S+")
+PUNCTUATION = ".,;:!?\"'()[]"
+
+# Rough characters-per-token ratio for Vietnamese text, used only when the
+# tokenizer can't be loaded (tiktoken downloads its BPE files on first use)
+APPROX_CHARS_PER_TOKEN = 3
+
+@lru_cache(maxsize=8)
+def get_encoding(model: str):
+    """Tokenizer for a chat model (cl100k_base for unknown models), or None
+    when tiktoken or its encoding files are unavailable"""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"Tokenizer unavailable, approximating token counts: {e}")
+        return None
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    if not text:
+        return 0
+    encoding = get_encoding(model or settings.OPENAI_MODEL)
+    if encoding is None:
+        return -(-len(text) // APPROX_CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+def truncate_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    encoding = get_encoding(model or settings.OPENAI_MODEL)
+    if encoding is None:
+        return text[:max(max_tokens, 0) * APPROX_CHARS_PER_TOKEN]
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max(max_tokens, 0)])
+
+def source_label(metadata: Optional[Dict[str, Any]]) -> str:
+    """Compact label such as "bang_gia.pdf #3 p.2" built from chunk metadata"""
+    if not metadata:
+        return "tài liệu"
+    label = os.path.basename(str(metadata.get("source") or metadata.get("title") or "tài liệu"))
+    if metadata.get("chunk_index") is not None:
+        label += f" #{int(metadata['chunk_index']) + 1}"
+    if metadata.get("page_number"):
+        label += f" p.{metadata['page_number']}"
+    return label
+
+def _shingles(words: List[str], size: int = 3) -> set:
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _overlap(left: List[str], right: List[str], min_words: int) -> int:
+    """Largest k >= min_words such that the last k words of left start right"""
+    if not left or not right:
+        return 0
+    longest = min(len(left), len(right))
+    for k in range(longest, min_words - 1, -1):
+        if left[-k] == right[0] and left[-k:] == right[:k]:
+            return k
+    return 0
+
+
+class ContextChunk:
+    def __init__(self, text: str, metadata: Optional[Dict[str, Any]], score: float):
+        self.text = text
+        self.metadata = metadata or {}
+        self.score = score
+        self.source = self.metadata.get("source")
+        self.spans = [m.span() for m in WORD_RE.finditer(text)]
+        # Compared without case and edge punctuation, so "tháng." matches "tháng"
+        self.words = [text[start:end].lower().strip(PUNCTUATION) for start, end in self.spans]
+
+    def trim(self, head: int = 0, tail: int = 0) -> None:
+        """Drop `head` words from the start and `tail` words from the end"""
+        spans = self.spans[head:len(self.spans) - tail]
+        if not spans:
+            self.text, self.spans, self.words = "", [], []
+            return
+        start, end = spans[0][0], spans[-1][1]
+        self.text = self.text[start:end]
+        self.spans = [(s - start, e - start) for s, e in spans]
+        self.words = self.words[head:len(self.words) - tail]
+
+
+class ContextAssembler:
+    """Fit retrieved chunks into a token budget for the prompt.
+
+    Chunks are taken in score order. Exact and near-identical duplicates
+    (word 3-gram containment at or above the threshold) are dropped, and
+    text shared with an already selected chunk of the same source (the
+    chunker's overlap) is trimmed. Each chunk is rendered under a short
+    "[n] source #chunk" label and counted with the model's tokenizer;
+    chunks that don't fit the remaining budget are skipped, except the
+    best one, which is truncated rather than lost.
+    """
+
+    def __init__(
+        self,
+        budget_tokens: Optional[int] = None,
+        dedup_threshold: Optional[float] = None,
+        min_overlap_words: int = 8,
+        model: Optional[str] = None
+    ):
+        self.budget_tokens = budget_tokens if budget_tokens is not None else settings.CONTEXT_TOKEN_BUDGET
+        self.dedup_threshold = dedup_threshold if dedup_threshold is not None else settings.CONTEXT_DEDUP_THRESHOLD
+        self.min_overlap_words = min_overlap_words
+        self.model = model or settings.OPENAI_MODEL
+
+    def assemble(
+        self,
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        scores: Optional[List[float]] = None
+    ) -> Dict[str, Any]:
+        """Return the context text, the labels used and token/chunk counts"""
+        metadatas = metadatas or [None] * len(documents)
+        # Without scores, keep the retrieval order
+        scores = scores or [-i for i in range(len(documents))]
+        ranked = sorted(
+            (ContextChunk(text, metadata, score) for text, metadata, score in zip(documents, metadatas, scores)),
+            key=lambda chunk: chunk.score,
+            reverse=True
+        )
+
+        selected: List[ContextChunk] = []
+        blocks: List[str] = []
+        labels: List[str] = []
+        seen_hashes = set()
+        kept_shingles: List[set] = []
+        used_tokens = 0
+        duplicates = 0
+        over_budget = 0
+
+        for chunk in ranked:
+            digest = hashlib.md5(" ".join(chunk.words).encode("utf-8")).hexdigest()
+            if not chunk.words or digest in seen_hashes:
+                duplicates += 1
+                continue
+            shingles = _shingles(chunk.words)
+            if any(
+                len(shingles & kept) / min(len(shingles), len(kept)) >= self.dedup_threshold
+                for kept in kept_shingles
+            ):
+                duplicates += 1
+                continue
+
+            self._trim_overlap(chunk, selected)
+            if not chunk.words:
+                duplicates += 1
+                continue
+
+            label = source_label(chunk.metadata)
+            block = f"[{len(blocks) + 1}] {label}\n{chunk.text}"
+            block_tokens = count_tokens(block, self.model) + (2 if blocks else 0)  # "\n\n" separator
+            remaining = self.budget_tokens - used_tokens
+            if block_tokens > remaining:
+                if blocks:
+                    over_budget += 1
+                    continue
+                block = truncate_tokens(block, remaining, self.model)
+                block_tokens = count_tokens(block, self.model)
+                if not block_tokens:
+                    over_budget += 1
+                    continue
+
+            seen_hashes.add(digest)
+            kept_shingles.append(shingles)
+            selected.append(chunk)
+            blocks.append(block)
+            labels.append(label)
+            used_tokens += block_tokens
+
+        return {
+            "text": "\n\n".join(blocks),
+            "sources": labels,
+            "tokens": used_tokens,
+            "chunks_used": len(blocks),
+            "chunks_duplicate": duplicates,
+            "chunks_over_budget": over_budget
+        }
+
+    def _trim_overlap(self, chunk: ContextChunk, selected: List[ContextChunk]) -> None:
+        """Cut text the chunk shares with the edges of selected chunks of its source"""
+        for kept in selected:
+            if kept.source != chunk.source:
+                continue
+            head = _overlap(kept.words, chunk.words, self.min_overlap_words)
+            if head:
+                chunk.trim(head=head)
+            tail = _overlap(chunk.words, kept.words, self.min_overlap_words)
+            if tail:
+                chunk.trim(tail=tail)
+            if not chunk.words:
+                return
@@ -0,0 +1,146 @@
+from typing import List, Dict, Any, Optional
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.openai_client import OpenAIClient, OpenAIError, get_openai_client
+from app.models.conversation import Conversation
+from app.models.message import Message, MessageRole
+from app.services.context_assembler import truncate_tokens
+
+SUMMARY_PROMPT = """Bạn duy trì bản tóm tắt của một cuộc hội thoại giữa người dùng và trợ lý hỗ trợ khách hàng.
+
+Cập nhật BẢN TÓM TẮT HIỆN TẠI với các TIN NHẮN MỚI. Giữ lại các sự kiện, con số, yêu cầu
+và quyết định quan trọng mà câu hỏi tiếp theo có thể cần; bỏ chào hỏi và chi tiết thừa.
+Viết ngắn gọn bằng tiếng Việt, không quá {max_tokens} token.
+
+BẢN TÓM TẮT HIỆN TẠI:
+{summary}
+
+TIN NHẮN MỚI:
+{messages}"""
+
+
+class ConversationMemory:
+    """Bounded conversation memory: a rolling summary plus recent turns.
+
+    `Conversation.summary` covers every message up to and including
+    `Conversation.summary_message_id`; later messages are sent verbatim.
+    Once more than MEMORY_RECENT_TURNS + MEMORY_SUMMARY_BATCH_TURNS turns
+    sit after that cursor, all but the last MEMORY_RECENT_TURNS are folded
+    into the summary with one LLM call, so the history in a prompt stays
+    bounded however long the conversation gets.
+    """
+
+    def __init__(self, db: AsyncSession, llm: Optional[OpenAIClient] = None):
+        self.db = db
+        self.llm = llm or get_openai_client()
+        self.recent_messages = settings.MEMORY_RECENT_TURNS * 2
+        self.batch_messages = settings.MEMORY_SUMMARY_BATCH_TURNS * 2
+
+    async def load(
+        self,
+        conversation_id: int,
+        unsaved: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """Return the stored summary and the messages after it, oldest first.
+
+        `unsaved` are message rows not written yet (write-behind queue),
+        appended after the stored ones.
+        """
+        conversation = await self._state(conversation_id)
+        if conversation is None:
+            return {"summary": None, "messages": []}
+
+        limit = self.recent_messages + self.batch_messages
+        messages = [
+            (msg.role, msg.content)
+            for msg in await self._messages_after(conversation_id, conversation.summary_message_id, limit)
+        ]
+        messages += [(MessageRole[row["role"]], row["content"]) for row in unsaved or []]
+        return {
+            "summary": conversation.summary,
+            "messages": [
+                {"role": role.value, "content": truncate_tokens(content, settings.MEMORY_MESSAGE_MAX_TOKENS)}
+                for role, content in messages[-limit:]
+            ]
+        }
+
+    async def update(self, conversation_id: int) -> bool:
+        """Fold turns that left the recent window into the summary.
+
+        Returns True when the summary changed. The cursor only moves if no
+        concurrent update moved it first, so turns are never folded twice.
+        """
+        conversation = await self._state(conversation_id)
+        if conversation is None:
+            return False
+
+        # Bounded even when earlier updates failed: the oldest unfolded turns go first
+        pending = await self._messages_after(
+            conversation_id, conversation.summary_message_id,
+            self.recent_messages + self.batch_messages * 4, oldest_first=True
+        )
+        if len(pending) < self.recent_messages + self.batch_messages:
+            return False
+        to_fold = pending[:len(pending) - self.recent_messages]
+
+        try:
+            summary = await self._summarize(conversation.summary, to_fold)
+        except OpenAIError as e:
+            print(f"Conversation summary error: {e}")
+            return False
+
+        cursor = Conversation.summary_message_id
+        result = await self.db.execute(
+            update(Conversation).where(
+                Conversation.id == conversation_id,
+                cursor.is_(None) if conversation.summary_message_id is None
+                else cursor == conversation.summary_message_id
+            ).values(summary=summary, summary_message_id=to_fold[-1].id)
+        )
+        await self.db.commit()
+        return result.rowcount > 0
+
+    async def _state(self, conversation_id: int):
+        return (await self.db.execute(
+            select(Conversation.summary, Conversation.summary_message_id)
+            .where(Conversation.id == conversation_id)
+        )).first()
+
+    async def _messages_after(
+        self,
+        conversation_id: int,
+        cursor: Optional[int],
+        limit: int,
+        oldest_first: bool = False
+    ) -> List[Message]:
+        query = select(Message).where(
+            Message.conversation_id == conversation_id,
+            Message.role != MessageRole.SYSTEM
+        )
+        if cursor is not None:
+            query = query.where(Message.id > cursor)
+        if oldest_first:
+            return list(await self.db.scalars(query.order_by(Message.id.asc()).limit(limit)))
+        return list(reversed((await self.db.scalars(query.order_by(Message.id.desc()).limit(limit))).all()))
+
+    async def _summarize(self, summary: Optional[str], messages: List[Message]) -> str:
+        max_tokens = settings.MEMORY_SUMMARY_MAX_TOKENS
+        lines = [
+            f"{'Người dùng' if msg.role == MessageRole.USER else 'Trợ lý'}: "
+            f"{truncate_tokens(msg.content, settings.MEMORY_MESSAGE_MAX_TOKENS)}"
+            for msg in messages
+        ]
+        prompt = SUMMARY_PROMPT.format(
+            max_tokens=max_tokens,
+            summary=summary or "(chưa có)",
+            messages="\n".join(lines)
+        )
+        response = await self.llm.chat_completion(
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=0
+        )
+        # Keep the bound even if the server doesn't honour max_tokens
+        return truncate_tokens(response["choices"][0]["message"]["content"].strip(), max_tokens)
+
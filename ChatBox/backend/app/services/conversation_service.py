@@ -1,45 +1,86 @@
-from typing import List, Dict, Any
-from sqlalchemy.orm import Session
+import base64
+import re
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import delete, func, literal, select, text, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.conversation import Conversation
 from app.models.message import Message
 
 class ConversationService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
     
     async def get_user_conversations(
         self, 
         user_id: int, 
-        skip: int = 0, 
-        limit: int = 20
-    ) -> List[Dict[str, Any]]:
-        """Get conversations for a user with message count"""
-        conversations = self.db.query(Conversation).filter(
-            Conversation.user_id == user_id
-        ).offset(skip).limit(limit).all()
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get a page of a user's conversations, most recently active first.
         
-        result = []
-        for conv in conversations:
-            # Get message count
-            message_count = self.db.query(Message).filter(
-                Message.conversation_id == conv.id
-            ).count()
-            
-            result.append({
-                "id": conv.id,
-                "title": conv.title,
-                "summary": conv.summary,
-                "created_at": conv.created_at.isoformat(),
-                "message_count": message_count
-            })
+        One query on the (user_id, last_message_at, id) index; pass the
+        returned `next_cursor` to get the following page.
+        """
+        query = select(
+            Conversation.id,
+            Conversation.title,
+            Conversation.summary,
+            Conversation.created_at,
+            Conversation.message_count,
+            Conversation.last_message_at
+        ).where(Conversation.user_id == user_id)
+        
+        if cursor:
+            last_message_at, conversation_id = self._decode_cursor(cursor)
+            query = query.where(
+                tuple_(Conversation.last_message_at, Conversation.id) < (last_message_at, conversation_id)
+            )
         
-        return result
+        rows = (await self.db.execute(query.order_by(
+            Conversation.last_message_at.desc(), Conversation.id.desc()
+        ).limit(limit + 1))).all()
+        
+        page = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = self._encode_cursor(page[-1].last_message_at, page[-1].id)
+        
+        return {
+            "conversations": [
+                {
+                    "id": conv.id,
+                    "title": conv.title,
+                    "summary": conv.summary,
+                    "created_at": conv.created_at.isoformat(),
+                    "last_message_at": conv.last_message_at.isoformat(),
+                    "message_count": conv.message_count
+                }
+                for conv in page
+            ],
+            "next_cursor": next_cursor
+        }
+    
+    @staticmethod
+    def _encode_cursor(last_message_at: datetime, conversation_id: int) -> str:
+        raw = f"{last_message_at.isoformat()}|{conversation_id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+        try:
+            timestamp, conversation_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            return datetime.fromisoformat(timestamp), int(conversation_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
     
     async def get_conversation_messages(self, conversation_id: int) -> List[Dict[str, Any]]:
         """Get all messages in a conversation"""
-        messages = self.db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(Message.created_at.asc()).all()
+        messages = (await self.db.scalars(
+            select(Message).where(
+                Message.conversation_id == conversation_id
+            ).order_by(Message.created_at.asc())
+        )).all()
         
         return [
             {
@@ -54,53 +95,57 @@ class ConversationService:
     async def delete_conversation(self, conversation_id: int) -> bool:
         """Delete a conversation and all its messages"""
         try:
-            conversation = self.db.query(Conversation).filter(
-                Conversation.id == conversation_id
-            ).first()
-            
-            if not conversation:
-                return False
-            
-            # Messages will be deleted automatically due to cascade
-            self.db.delete(conversation)
-            self.db.commit()
-            return True
+            # One bulk delete instead of loading every message for the cascade
+            await self.db.execute(
+                delete(Message).where(Message.conversation_id == conversation_id)
+            )
+            result = await self.db.execute(
+                delete(Conversation).where(Conversation.id == conversation_id)
+            )
+            await self.db.commit()
+            return result.rowcount > 0
             
         except Exception as e:
-            self.db.rollback()
+            await self.db.rollback()
             raise Exception(f"Conversation deletion failed: {str(e)}")
     
     async def update_title(self, conversation_id: int, title: str) -> bool:
         """Update conversation title"""
         try:
-            conversation = self.db.query(Conversation).filter(
-                Conversation.id == conversation_id
-            ).first()
-            
-            if not conversation:
-                return False
-            
-            conversation.title = title
-            self.db.commit()
-            return True
+            result = await self.db.execute(
+                update(Conversation).where(Conversation.id == conversation_id).values(title=title)
+            )
+            await self.db.commit()
+            return result.rowcount > 0
             
         except Exception as e:
-            self.db.rollback()
+            await self.db.rollback()
             raise Exception(f"Title update failed: {str(e)}")
     
     async def get_conversation_summary(self, conversation_id: int) -> str:
-        """Generate a summary of the conversation"""
+        """Return the stored rolling summary of the conversation.
+        
+        Until the conversation is long enough to have one, describe it by
+        its first and last messages (two single-row queries).
+        """
         try:
-            messages = self.db.query(Message).filter(
-                Message.conversation_id == conversation_id
-            ).order_by(Message.created_at.asc()).all()
+            summary = await self.db.scalar(
+                select(Conversation.summary).where(Conversation.id == conversation_id)
+            )
+            if summary:
+                return summary
             
-            if not messages:
+            messages = select(Message.content).where(
+                Message.conversation_id == conversation_id
+            ).limit(1)
+            first = await self.db.scalar(messages.order_by(Message.id.asc()))
+            if first is None:
                 return "Không có tin nhắn nào trong cuộc hội thoại này."
+            last = await self.db.scalar(messages.order_by(Message.id.desc()))
             
             # Simple summary based on first and last messages
-            first_msg = messages[0].content[:100] + "..." if len(messages[0].content) > 100 else messages[0].content
-            last_msg = messages[-1].content[:100] + "..." if len(messages[-1].content) > 100 else messages[-1].content
+            first_msg = first[:100] + "..." if len(first) > 100 else first
+            last_msg = last[:100] + "..." if len(last) > 100 else last
             
             return f"Cuộc hội thoại bắt đầu với: '{first_msg}' và kết thúc với: '{last_msg}'"
             
@@ -113,31 +158,105 @@ class ConversationService:
         query: str, 
         limit: int = 10
     ) -> List[Dict[str, Any]]:
-        """Search conversations by content"""
+        """Search conversations by content.
+        
+        Uses the full-text index (Postgres tsvector/GIN, SQLite FTS5). One
+        query ranks the matching messages, keeps the best message per
+        conversation, joins the conversation and highlights a snippet.
+        Other databases fall back to a substring scan.
+        """
         try:
-            # Search in message content
-            messages = self.db.query(Message).join(Conversation).filter(
-                Conversation.user_id == user_id,
-                Message.content.ilike(f"%{query}%")
-            ).limit(limit).all()
-            
-            # Group by conversation
-            conversation_ids = set()
-            for msg in messages:
-                conversation_ids.add(msg.conversation_id)
+            dialect = self.db.get_bind().dialect.name
+            if dialect == "postgresql":
+                rows = await self._search_postgres(user_id, query, limit)
+            elif dialect == "sqlite":
+                rows = await self._search_sqlite(user_id, query, limit)
+            else:
+                rows = await self._search_substring(user_id, query, limit)
             
-            # Get conversation details
-            conversations = []
-            for conv_id in conversation_ids:
-                conv = self.db.query(Conversation).filter(Conversation.id == conv_id).first()
-                if conv:
-                    conversations.append({
-                        "id": conv.id,
-                        "title": conv.title,
-                        "created_at": conv.created_at.isoformat()
-                    })
-            
-            return conversations
+            results = []
+            for row in rows:
+                # Raw SQL on SQLite returns timestamps as text
+                created_at = row.created_at
+                if isinstance(created_at, str):
+                    created_at = datetime.fromisoformat(created_at)
+                results.append({
+                    "id": row.conversation_id,
+                    "title": row.title,
+                    "created_at": created_at.isoformat(),
+                    "message_id": row.message_id,
+                    "snippet": row.snippet,
+                    "rank": row.rank
+                })
+            return results
             
         except Exception as e:
+            print(f"Conversation search error: {e}")
             return []
+    
+    async def _search_postgres(self, user_id: int, query: str, limit: int):
+        return (await self.db.execute(text("""
+            SELECT best.conversation_id, best.message_id, best.title, best.created_at, best.rank,
+                   ts_headline('simple', m.content, websearch_to_tsquery('simple', :query),
+                               'StartSel=<mark>, StopSel=</mark>, MaxWords=24, MinWords=8') AS snippet
+            FROM (
+                SELECT m.conversation_id, m.id AS message_id, c.title, c.created_at,
+                       ts_rank(m.search_vector, q) AS rank,
+                       row_number() OVER (PARTITION BY m.conversation_id
+                                          ORDER BY ts_rank(m.search_vector, q) DESC) AS position
+                FROM messages m
+                JOIN conversations c ON c.id = m.conversation_id,
+                     websearch_to_tsquery('simple', :query) q
+                WHERE c.user_id = :user_id AND m.search_vector @@ q
+            ) best
+            JOIN messages m ON m.id = best.message_id
+            WHERE best.position = 1
+            ORDER BY best.rank DESC
+            LIMIT :limit
+        """), {"query": query, "user_id": user_id, "limit": limit})).all()
+    
+    async def _search_sqlite(self, user_id: int, query: str, limit: int):
+        # Quote each term so user input can't inject FTS5 query syntax
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+        match = " ".join(f'"{term}"' for term in terms)
+        # FTS5 auxiliary functions can't sit under a window function, so rank
+        # via the hidden rank column and build snippets for the final rows only
+        return (await self.db.execute(text("""
+            WITH hits AS (
+                SELECT rowid AS message_id, rank FROM messages_fts WHERE messages_fts MATCH :match
+            ), best AS (
+                SELECT m.conversation_id, hits.message_id, c.title, c.created_at, hits.rank,
+                       row_number() OVER (PARTITION BY m.conversation_id ORDER BY hits.rank) AS position
+                FROM hits
+                JOIN messages m ON m.id = hits.message_id
+                JOIN conversations c ON c.id = m.conversation_id
+                WHERE c.user_id = :user_id
+            ), top AS (
+                SELECT * FROM best WHERE position = 1 ORDER BY rank LIMIT :limit
+            )
+            SELECT top.conversation_id, top.message_id, top.title, top.created_at,
+                   -top.rank AS rank,
+                   snippet(messages_fts, 0, '<mark>', '</mark>', '…', 24) AS snippet
+            FROM top
+            JOIN messages_fts ON messages_fts.rowid = top.message_id
+            WHERE messages_fts MATCH :match
+            ORDER BY top.rank
+        """), {"match": match, "user_id": user_id, "limit": limit})).all()
+    
+    async def _search_substring(self, user_id: int, query: str, limit: int):
+        # Unindexed: matching messages and their conversations in one query
+        return (await self.db.execute(select(
+            Message.conversation_id,
+            func.max(Message.id).label("message_id"),
+            Conversation.title,
+            Conversation.created_at,
+            literal(0.0).label("rank"),
+            literal(None).label("snippet")
+        ).join(Conversation).where(
+            Conversation.user_id == user_id,
+            Message.content.ilike(f"%{query}%")
+        ).group_by(
+            Message.conversation_id, Conversation.title, Conversation.created_at
+        ).limit(limit))).all()
@@ -1,159 +1,528 @@
+import asyncio
+import base64
+import codecs
+import json
 import os
-import PyPDF2
-from typing import List, Dict, Any
-from sqlalchemy.orm import Session
+import tempfile
+import weakref
+from contextlib import aclosing, nullcontext
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Callable, Awaitable, AsyncIterator, Tuple
+from sqlalchemy import delete, func, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import UploadFile
+from app.core.config import settings
 from app.models.document import Document
-from app.services.vector_service import VectorService
-import re
+from app.models.source import Source
+from app.services.vector_service import VectorService, get_vector_service
+from app.services.embedding_cache import content_hash
+from app.services.answer_cache import get_answer_cache
+from app.services.lexical_index import get_lexical_index
+from app.services.chunker import Chunk, MarkdownChunker
+from app.services.pdf_extractor import iter_pdf_pages, spool_upload
+
+TEXT_READ_BYTES = 256 * 1024
+
+# Ingestions and deletions of one source run one at a time in this process.
+# Across processes the Source row lock (SELECT ... FOR UPDATE, on Postgres)
+# serialises them, and the unique (source_id, embedding_id) index turns a
+# race that slips through (SQLite) into a failed ingestion, not duplicates.
+_source_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def _source_lock(name: str) -> asyncio.Lock:
+    lock = _source_locks.get(name)
+    if lock is None:
+        lock = _source_locks[name] = asyncio.Lock()
+    return lock
 
 class DocumentService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession, vector_service: Optional[VectorService] = None):
         self.db = db
-        self.vector_service = VectorService()
+        self.vector_service = vector_service or get_vector_service()
+        self.answer_cache = get_answer_cache()
+        self.lexical_index = get_lexical_index()
         
     async def ingest_document(self, file: UploadFile) -> Dict[str, Any]:
-        """Ingest a document file into the system"""
+        """Ingest a document file into the system.
+        
+        The upload is spooled to a temp file, so it is never held in memory
+        (and PDFs are extracted from disk page by page).
+        """
         try:
-            # Read file content
-            content = await self._read_file_content(file)
-            
-            # Split into chunks
-            chunks = self._split_into_chunks(content, chunk_size=1000)
-            
-            # Store in database and vector store
-            document_ids = []
-            for i, chunk in enumerate(chunks):
-                # Save to database
-                doc = Document(
-                    title=f"{file.filename} - Chunk {i+1}",
-                    content=chunk,
+            self._check_type(file.filename)
+            path = await spool_upload(file, suffix=os.path.splitext(file.filename)[1])
+            try:
+                return await self._sync_chunks(
                     source=file.filename,
-                    file_path=file.filename,
                     document_type=file.filename.split('.')[-1],
-                    chunk_index=i
+                    read_chunks=lambda: self._iter_file_chunks(path, file.filename),
+                    size=os.path.getsize(path)
                 )
-                self.db.add(doc)
-                self.db.commit()
-                self.db.refresh(doc)
-                
-                # Add to vector store
-                metadata = {
-                    "document_id": doc.id,
-                    "title": doc.title,
-                    "source": doc.source,
-                    "chunk_index": i
-                }
-                
-                vector_id = await self.vector_service.add_document(chunk, metadata)
-                
-                # Update document with vector store reference
-                doc.embedding_id = vector_id
-                self.db.commit()
-                
-                document_ids.append(doc.id)
+            finally:
+                os.unlink(path)
             
-            return {
-                "document_id": document_ids[0],  # Return first chunk ID
-                "chunks_created": len(chunks),
-                "total_chunks": len(chunks)
-            }
+        except Exception as e:
+            await self.db.rollback()
+            raise Exception(f"Document ingestion failed: {str(e)}")
+    
+    async def ingest_file(
+        self,
+        path: str,
+        filename: str,
+        progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """Ingest a file already on disk (a queued upload) as the document `filename`.
+        
+        `progress(chunks_done, chunks_total)` is awaited once the file is
+        chunked and after each embedding batch.
+        """
+        try:
+            self._check_type(filename)
+            return await self._sync_chunks(
+                source=filename,
+                document_type=filename.split('.')[-1],
+                read_chunks=lambda: self._iter_file_chunks(path, filename),
+                size=os.path.getsize(path),
+                progress=progress
+            )
             
         except Exception as e:
-            self.db.rollback()
+            await self.db.rollback()
             raise Exception(f"Document ingestion failed: {str(e)}")
     
-    async def _read_file_content(self, file: UploadFile) -> str:
-        """Read content from uploaded file"""
-        if file.filename.endswith('.txt') or file.filename.endswith('.md'):
-            content = await file.read()
-            return content.decode('utf-8')
+    async def _sync_chunks(
+        self,
+        source: str,
+        document_type: str,
+        read_chunks: Callable[[], AsyncIterator[Chunk]],
+        size: int,
+        progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """Make the stored chunks of a source match the chunks of a file of
+        `size` bytes.
+        
+        Chunks are matched to what is already stored by content hash (as a
+        multiset, so repeated chunks are handled): only new chunks are
+        embedded and inserted, vanished ones are deleted, unchanged ones
+        keep their rows and vectors.
+        
+        `read_chunks()` streams the file's chunks, once (a PDF is extracted
+        once): each chunk's hash and position are kept, and its text is
+        spooled to a temp file from which the new chunks are read back a
+        batch at a time. Memory stays bounded by the batch size, not the
+        file size.
+        """
+        async with _source_lock(source):
+            spool = tempfile.TemporaryFile("w+", encoding="utf-8", dir=settings.UPLOAD_SPOOL_DIRECTORY or None)
+            with self._changing_chunks(), spool:
+                return await self._sync_source_chunks(source, document_type, read_chunks, size, progress, spool)
+    
+    async def _sync_source_chunks(
+        self,
+        source: str,
+        document_type: str,
+        read_chunks: Callable[[], AsyncIterator[Chunk]],
+        size: int,
+        progress: Optional[Callable[[int, int], Awaitable[None]]],
+        spool
+    ) -> Dict[str, Any]:
+        hashes: List[str] = []
+        page_numbers: List[Optional[int]] = []
+        heading_paths: List[Optional[str]] = []
+        async with aclosing(read_chunks()) as chunks:
+            async for chunk in chunks:
+                hashes.append(content_hash(chunk.text))
+                page_numbers.append(chunk.page_number)
+                heading_paths.append(" > ".join(chunk.heading_path) or None)
+                # One JSON string per line: chunk texts contain newlines
+                spool.write(json.dumps(chunk.text, ensure_ascii=False) + "\n")
+        if not hashes:
+            raise ValueError(f"No text content found in {source}")
+        
+        source_row = await self._get_source(source, document_type)
+        existing = (await self.db.execute(
+            select(
+                Document.id, Document.content_hash, Document.chunk_index,
+                Document.page_number, Document.heading_path, Document.embedding_id
+            )
+            .where(Document.source_id == source_row.id).order_by(Document.chunk_index)
+        )).all()
+        
+        # Pair each new chunk with a stored chunk of the same content, in order
+        stored_by_hash: Dict[str, List[Any]] = {}
+        for row in existing:
+            # Rows ingested before hashes were stored can't be matched; they get replaced
+            stored_by_hash.setdefault(row.content_hash, []).append(row)
+        kept: List[Any] = []
+        new_positions: List[int] = []
+        for i, chunk_hash in enumerate(hashes):
+            matches = stored_by_hash.get(chunk_hash)
+            if matches:
+                kept.append((i, matches.pop(0)))
+            else:
+                new_positions.append(i)
+        vanished = [row for rows in stored_by_hash.values() for row in rows]
+        
+        # Vector ids are unique per (source, content, occurrence) so identical
+        # chunks never collide, within a file or across files
+        used_ids = {row.embedding_id for row in existing if row.embedding_id}
+        new_vector_ids: Dict[int, str] = {}
+        for i in new_positions:
+            occurrence = 0
+            vector_id = content_hash(f"{source}\x00{hashes[i]}\x00{occurrence}")
+            while vector_id in used_ids:
+                occurrence += 1
+                vector_id = content_hash(f"{source}\x00{hashes[i]}\x00{occurrence}")
+            used_ids.add(vector_id)
+            new_vector_ids[i] = vector_id
+        
+        # Second pass, over the spool: embed, insert and add the new chunks one
+        # batch at a time. Rows are only flushed, so the file still lands in one commit.
+        added: List[str] = []
+        batch: List[Document] = []
+        batch_size = max(1, settings.EMBEDDING_BATCH_SIZE)
+        if progress is not None:
+            await progress(len(kept), len(hashes))
+        try:
+            if new_positions:
+                spool.seek(0)
+                for i, line in enumerate(spool):
+                    if i not in new_vector_ids:
+                        continue
+                    batch.append(Document(
+                        title=f"{source} - Chunk {i+1}",
+                        content=json.loads(line),
+                        content_hash=hashes[i],
+                        source=source,
+                        source_id=source_row.id,
+                        file_path=source,
+                        document_type=document_type,
+                        chunk_index=i,
+                        page_number=page_numbers[i],
+                        heading_path=heading_paths[i],
+                        embedding_id=new_vector_ids[i]
+                    ))
+                    if len(batch) == batch_size or len(added) + len(batch) == len(new_vector_ids):
+                        await self._store_batch(batch, added)
+                        batch = []
+                        if progress is not None:
+                            await progress(len(kept) + len(added), len(hashes))
             
-        elif file.filename.endswith('.pdf'):
-            content = await file.read()
-            pdf_reader = PyPDF2.PdfReader(content)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+            # Unchanged chunks that moved only get their position updated
+            moved = [
+                {
+                    "id": row.id,
+                    "chunk_index": i,
+                    "page_number": page_numbers[i],
+                    "heading_path": heading_paths[i],
+                    "title": f"{source} - Chunk {i+1}"
+                }
+                for i, row in kept
+                if row.chunk_index != i or row.page_number != page_numbers[i] or row.heading_path != heading_paths[i]
+            ]
+            if moved:
+                await self.db.execute(update(Document), moved)
+            if vanished:
+                await self.db.execute(
+                    delete(Document).where(Document.id.in_([row.id for row in vanished]))
+                )
             
-        else:
-            raise ValueError(f"Unsupported file type: {file.filename}")
-    
-    def _split_into_chunks(self, text: str, chunk_size: int = 1000) -> List[str]:
-        """Split text into chunks of specified size"""
-        # Simple splitting by sentences
-        sentences = re.split(r'[.!?]+', text)
-        chunks = []
-        current_chunk = ""
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-                
-            if len(current_chunk) + len(sentence) < chunk_size:
-                current_chunk += sentence + ". "
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence + ". "
+            # Keep the source's aggregates in step with its chunks (same transaction)
+            source_row.chunk_count = len(hashes)
+            source_row.total_bytes = size
+            source_row.last_ingested_at = datetime.utcnow()
+            
+            await self.db.commit()
+        except Exception:
+            if added:
+                await self._discard_vectors(added)
+            raise
+        
+        vanished_vector_ids = [row.embedding_id for row in vanished if row.embedding_id]
+        if vanished_vector_ids:
+            self.vector_service.delete_documents(vanished_vector_ids)
+        if self.lexical_index is not None:
+            self.lexical_index.remove(vanished_vector_ids)
         
-        # Add remaining chunk
-        if current_chunk:
-            chunks.append(current_chunk.strip())
+        # Answers and search results from an earlier version of this file are stale
+        if added or vanished:
+            if self.answer_cache is not None:
+                self.answer_cache.invalidate_sources([source])
+            await self._corpus_changed()
         
-        return chunks
+        return {
+            "document_id": source_row.id,
+            "chunks_created": len(added),
+            "chunks_deleted": len(vanished),
+            "chunks_unchanged": len(kept),
+            "total_chunks": len(hashes)
+        }
     
-    async def list_documents(self, skip: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
-        """List documents with pagination"""
-        documents = self.db.query(Document).offset(skip).limit(limit).all()
+    async def _store_batch(self, docs: List[Document], added: List[str]) -> None:
+        """Embed a batch of new chunk rows, flush them and add their vectors;
+        their vector ids are appended to `added`"""
+        texts = [doc.content for doc in docs]
+        ids = [doc.embedding_id for doc in docs]
+        # Embed before writing, so API errors leave nothing behind for this batch
+        embeddings = await self.vector_service.embed_documents(texts)
+        
+        self.db.add_all(docs)
+        # Flush assigns the ids the vector metadata points at
+        await self.db.flush()
         
-        return [
+        metadatas = [
             {
-                "id": doc.id,
+                "document_id": doc.id,
                 "title": doc.title,
                 "source": doc.source,
-                "document_type": doc.document_type,
-                "created_at": doc.created_at.isoformat()
+                "chunk_index": doc.chunk_index,
+                # The vector store rejects None metadata values
+                **({"page_number": doc.page_number} if doc.page_number is not None else {}),
+                **({"heading_path": doc.heading_path} if doc.heading_path is not None else {})
             }
-            for doc in documents
+            for doc in docs
         ]
+        added.extend(ids)
+        await self.vector_service.add_documents(texts, metadatas, ids=ids, embeddings=embeddings)
+        if self.lexical_index is not None:
+            self.lexical_index.add(ids, texts)
+            self.lexical_index.touch_source(docs[0].source_id, ids)
+    
+    async def _discard_vectors(self, vector_ids: List[str]) -> None:
+        """Undo the vectors of an ingestion that failed before its commit"""
+        await self.db.rollback()
+        if self.lexical_index is not None:
+            self.lexical_index.remove(vector_ids)
+        # Keep vectors a concurrent ingestion of the same chunks committed
+        stored = set((await self.db.scalars(
+            select(Document.embedding_id).where(Document.embedding_id.in_(vector_ids))
+        )).all())
+        orphans = [vector_id for vector_id in vector_ids if vector_id not in stored]
+        if orphans:
+            self.vector_service.delete_documents(orphans)
+        await self._corpus_changed()
+    
+    async def _get_source(self, name: str, document_type: str) -> Source:
+        """The Source row for `name`, created on first ingestion and locked
+        until the transaction ends"""
+        query = select(Source).where(Source.name == name).with_for_update()
+        source = await self.db.scalar(query)
+        if source is None:
+            try:
+                source = Source(name=name, document_type=document_type)
+                self.db.add(source)
+                await self.db.flush()
+            except IntegrityError:
+                # Another worker created it first
+                await self.db.rollback()
+                source = await self.db.scalar(query)
+        if source.status == "deleting":
+            raise ValueError(f"{name} is being deleted; retry once the deletion finishes")
+        source.document_type = document_type
+        return source
+    
+    @staticmethod
+    def _check_type(filename: str) -> None:
+        if not filename.endswith(('.txt', '.md', '.pdf')):
+            raise ValueError(f"Unsupported file type: {filename}")
+    
+    def _iter_file_chunks(self, path: str, filename: str) -> AsyncIterator[Chunk]:
+        """Stream the chunks of a file on disk typed by `filename`.
+        
+        Text is decoded and chunked as it is read. PDFs are extracted page
+        by page in the extraction process pool.
+        """
+        if filename.endswith('.pdf'):
+            return self._chunk_pdf(path)
+        return self._chunk_text(path, markdown=filename.endswith('.md'))
+    
+    async def _chunk_text(self, path: str, markdown: bool) -> AsyncIterator[Chunk]:
+        """Chunk a UTF-8 text file read in TEXT_READ_BYTES pieces"""
+        chunker = MarkdownChunker(markdown=markdown)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        with open(path, "rb") as f:
+            while True:
+                data = await asyncio.to_thread(f.read, TEXT_READ_BYTES)
+                if not data:
+                    break
+                for chunk in chunker.feed(decoder.decode(data)):
+                    yield chunk
+        for chunk in chunker.feed(decoder.decode(b"", final=True)):
+            yield chunk
+        for chunk in chunker.close():
+            yield chunk
+    
+    async def _chunk_pdf(self, path: str) -> AsyncIterator[Chunk]:
+        # Extracted pages carry no Markdown; a page break ends a line
+        chunker = MarkdownChunker(markdown=False)
+        async with aclosing(iter_pdf_pages(path)) as pages:
+            async for page_number, text in pages:
+                for chunk in chunker.feed(text + "\n", page_number):
+                    yield chunk
+        for chunk in chunker.close():
+            yield chunk
+    
+    async def list_documents(self, limit: int = 100, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Get a page of documents (ingested files), most recently ingested first.
+        
+        Served from the sources table and its aggregates in one query on the
+        (last_ingested_at, id) index; chunk rows are never read. Pass the
+        returned `next_cursor` to get the following page.
+        """
+        query = select(Source).options(load_only(
+            Source.id, Source.name, Source.document_type, Source.created_at,
+            Source.chunk_count, Source.total_bytes, Source.last_ingested_at
+        )).where(Source.status == "active")
+        
+        if cursor:
+            last_ingested_at, source_id = self._decode_cursor(cursor)
+            query = query.where(
+                tuple_(Source.last_ingested_at, Source.id) < (last_ingested_at, source_id)
+            )
+        
+        sources = (await self.db.scalars(query.order_by(
+            Source.last_ingested_at.desc(), Source.id.desc()
+        ).limit(limit + 1))).all()
+        
+        page = sources[:limit]
+        next_cursor = None
+        if len(sources) > limit:
+            next_cursor = self._encode_cursor(page[-1].last_ingested_at, page[-1].id)
+        
+        return {
+            "documents": [
+                {
+                    "id": source.id,
+                    "title": source.name,
+                    "source": source.name,
+                    "document_type": source.document_type,
+                    "created_at": source.created_at.isoformat(),
+                    "last_ingested_at": source.last_ingested_at.isoformat(),
+                    "chunk_count": source.chunk_count,
+                    "total_bytes": source.total_bytes
+                }
+                for source in page
+            ],
+            "next_cursor": next_cursor
+        }
+    
+    @staticmethod
+    def _encode_cursor(last_ingested_at: datetime, source_id: int) -> str:
+        raw = f"{last_ingested_at.isoformat()}|{source_id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+        try:
+            timestamp, source_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            return datetime.fromisoformat(timestamp), int(source_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
     
     async def delete_document(self, document_id: int) -> bool:
-        """Delete a document and its chunks"""
+        """Delete a document (an ingested file, by its listing id) and all its chunks.
+        
+        Returns False if there is no such document.
+        """
         try:
-            # Find all chunks of this document
-            chunks = self.db.query(Document).filter(
-                Document.source == self.db.query(Document.source).filter(
-                    Document.id == document_id
-                ).first().source
-            ).all()
-            
-            # Delete from vector store
-            for chunk in chunks:
-                if chunk.embedding_id:
-                    self.vector_service.delete_document(chunk.embedding_id)
-            
-            # Delete from database
-            for chunk in chunks:
-                self.db.delete(chunk)
-            
-            self.db.commit()
+            if await self.db.get(Source, document_id) is None:
+                return False
+            await self.delete_source(document_id)
             return True
             
         except Exception as e:
-            self.db.rollback()
+            await self.db.rollback()
             raise Exception(f"Document deletion failed: {str(e)}")
     
-    def get_document_stats(self) -> Dict[str, Any]:
-        """Get statistics about documents"""
+    async def delete_source(self, source_id: int) -> None:
+        """Delete a source with its chunks and vectors, in two phases.
+        
+        First the source is marked "deleting" and committed, so ingestion
+        of it is refused from then on. Then its vectors are deleted by
+        metadata filter in one call, and its chunk rows and the source row
+        in one transaction. A crash in between leaves the marker behind,
+        and reconcile_deletions() finishes the job; both steps are safe to
+        repeat.
+        """
+        source = await self.db.get(Source, source_id)
+        if source is None:
+            return
+        # Wait for an ingestion of this source to finish first
+        async with _source_lock(source.name):
+            source = await self.db.get(Source, source_id, with_for_update=True, populate_existing=True)
+            if source is None:
+                return
+            if source.status != "deleting":
+                source.status = "deleting"
+                await self.db.commit()
+            await self._purge_source(source)
+    
+    async def _purge_source(self, source: Source) -> None:
+        with self._changing_chunks():
+            vector_ids = (await self.db.scalars(
+                select(Document.embedding_id)
+                .where(Document.source_id == source.id, Document.embedding_id.isnot(None))
+            )).all()
+            
+            # Every chunk vector carries its source name in its metadata
+            self.vector_service.delete_where({"source": source.name})
+            if self.lexical_index is not None:
+                self.lexical_index.remove(vector_ids)
+            if self.answer_cache is not None:
+                self.answer_cache.invalidate_chunks(list(vector_ids))
+                self.answer_cache.invalidate_sources([source.name])
+            
+            await self.db.execute(delete(Document).where(Document.source_id == source.id))
+            await self.db.execute(delete(Source).where(Source.id == source.id))
+            await self.db.commit()
+            # After the commit: a process catching its BM25 index up to the
+            # new version must no longer read these chunks
+            await self._corpus_changed()
+    
+    def _changing_chunks(self):
+        """Mark a change to the chunks running here, so a refresh of the BM25
+        index from the database doesn't undo its uncommitted part"""
+        if self.lexical_index is None:
+            return nullcontext()
+        return self.lexical_index.changing()
+    
+    async def _corpus_changed(self) -> None:
+        """Retire cached search results once vectors and the BM25 index changed"""
+        if self.vector_service.retrieval_cache is not None:
+            before, after = await self.vector_service.retrieval_cache.bump()
+            if self.lexical_index is not None:
+                # The index here already has the change
+                self.lexical_index.advance(before, after)
+    
+    async def reconcile_deletions(self) -> int:
+        """Finish deletions interrupted by a crash (called at startup)"""
+        sources = (await self.db.scalars(
+            select(Source).where(Source.status == "deleting")
+        )).all()
+        for source in sources:
+            await self._purge_source(source)
+        return len(sources)
+    
+    async def get_document_stats(self) -> Dict[str, Any]:
+        """Get statistics about documents, from the per-source aggregates"""
         try:
-            total_docs = self.db.query(Document).count()
-            doc_types = self.db.query(Document.document_type).distinct().all()
+            totals = (await self.db.execute(
+                select(
+                    func.count(Source.id),
+                    func.coalesce(func.sum(Source.chunk_count), 0),
+                    func.coalesce(func.sum(Source.total_bytes), 0)
+                ).where(Source.status == "active")
+            )).one()
+            doc_types = (await self.db.execute(
+                select(Source.document_type).where(Source.status == "active").distinct()
+            )).all()
             
             return {
-                "total_documents": total_docs,
+                "total_documents": totals[0],
+                "total_chunks": totals[1],
+                "total_bytes": totals[2],
                 "document_types": [dt[0] for dt in doc_types if dt[0]],
                 "vector_store_stats": self.vector_service.get_collection_stats()
             }
@@ -0,0 +1,200 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import hashlib
+from array import array
+from typing import List, Dict, Any, Optional
+from app.core.config import settings
+from app.core.cache import LRUCache
+
+def content_hash(text: str) -> str:
+    """Content address of a text (same md5 the vector store uses for ids)"""
+    return hashlib.md5(text.encode()).hexdigest()
+
+def _pack(vector: array) -> bytes:
+    return vector.tobytes()
+
+def _unpack(data: bytes) -> array:
+    vector = array('f')
+    vector.frombytes(data)
+    return vector
+
+
+class SQLiteEmbeddingStore:
+    """Persistent embedding tier in a local SQLite file, read and written
+    in worker threads so a slow disk or a concurrent writer doesn't stall
+    the event loop"""
+    
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+    
+    async def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        return await asyncio.to_thread(self._get_many, keys)
+    
+    def _get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+        return found
+    
+    async def set_many(self, items: Dict[str, bytes]) -> None:
+        await asyncio.to_thread(self._set_many, items)
+    
+    def _set_many(self, items: Dict[str, bytes]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", items.items()
+            )
+            self._conn.commit()
+    
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisEmbeddingStore:
+    """Persistent embedding tier in Redis at settings.REDIS_URL, through redis.asyncio"""
+    
+    prefix = "emb:"
+    
+    def __init__(self):
+        from app.core.redis_client import get_async_redis
+        self._redis = get_async_redis()
+    
+    async def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        values = await self._redis.mget([self.prefix + key for key in keys])
+        return {key: value for key, value in zip(keys, values) if value is not None}
+    
+    async def set_many(self, items: Dict[str, bytes]) -> None:
+        await self._redis.mset({self.prefix + key: value for key, value in items.items()})
+    
+    def close(self) -> None:
+        pass
+
+
+class EmbeddingCache:
+    """Two-tier embedding cache keyed by (model, text hash): in-memory LRU, then a persistent store.
+    
+    After a store error the cache runs on memory alone and retries the
+    store every `retry_seconds`, so an unreachable Redis costs one socket
+    timeout per interval rather than one per query.
+    """
+    
+    def __init__(self, max_bytes: int, store=None, retry_seconds: float = 30.0):
+        # array('f') keeps each vector at 4 bytes per dimension
+        self.memory = LRUCache(max_bytes, sizeof=lambda vector: vector.itemsize * len(vector) + 64)
+        self.store = store
+        self.retry_seconds = retry_seconds
+        self.store_hits = 0
+        self.misses = 0
+        self.store_errors = 0
+        self._store_down_until = 0.0
+    
+    def _store(self):
+        """The persistent store, unless there is none or it failed recently"""
+        if self.store is None or time.monotonic() < self._store_down_until:
+            return None
+        return self.store
+    
+    def _store_failed(self, e: Exception) -> None:
+        self.store_errors += 1
+        self._store_down_until = time.monotonic() + self.retry_seconds
+        print(f"Embedding cache store error, using memory only: {e}")
+    
+    @staticmethod
+    def make_key(model: str, text_hash: str) -> str:
+        return f"{model}:{text_hash}"
+    
+    async def get_many(self, model: str, text_hashes: List[str]) -> List[Optional[List[float]]]:
+        """Look up embeddings; None marks a miss in both tiers"""
+        keys = [self.make_key(model, h) for h in text_hashes]
+        results: List[Optional[List[float]]] = [None] * len(keys)
+        pending: Dict[str, List[int]] = {}
+        
+        for i, key in enumerate(keys):
+            vector = self.memory.get(key)
+            if vector is not None:
+                results[i] = vector.tolist()
+            else:
+                pending.setdefault(key, []).append(i)
+        
+        store = self._store()
+        if pending and store is not None:
+            try:
+                found = await store.get_many(list(pending))
+            except Exception as e:
+                self._store_failed(e)
+                found = {}
+            for key, data in found.items():
+                vector = _unpack(data)
+                self.memory.set(key, vector)
+                for i in pending.pop(key):
+                    results[i] = vector.tolist()
+                self.store_hits += 1
+        
+        self.misses += sum(len(indices) for indices in pending.values())
+        return results
+    
+    async def set_many(self, model: str, text_hashes: List[str], embeddings: List[List[float]]) -> None:
+        items: Dict[str, bytes] = {}
+        for text_hash, embedding in zip(text_hashes, embeddings):
+            key = self.make_key(model, text_hash)
+            vector = array('f', embedding)
+            self.memory.set(key, vector)
+            items[key] = _pack(vector)
+        
+        store = self._store()
+        if items and store is not None:
+            try:
+                await store.set_many(items)
+            except Exception as e:
+                self._store_failed(e)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory": self.memory.stats(),
+            "store": type(self.store).__name__ if self.store is not None else None,
+            "store_available": self._store() is not None,
+            "store_hits": self.store_hits,
+            "store_errors": self.store_errors,
+            "misses": self.misses
+        }
+    
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+
+
+def create_embedding_cache() -> Optional[EmbeddingCache]:
+    """Build the embedding cache configured in settings"""
+    backend = settings.EMBEDDING_CACHE_BACKEND
+    if backend == "none":
+        return None
+    if backend == "sqlite":
+        store = SQLiteEmbeddingStore(settings.EMBEDDING_CACHE_PATH)
+    elif backend == "redis":
+        store = RedisEmbeddingStore()
+    elif backend == "memory":
+        store = None
+    else:
+        raise ValueError(f"Unknown EMBEDDING_CACHE_BACKEND: {backend}")
+    return EmbeddingCache(settings.EMBEDDING_CACHE_MAX_BYTES, store)
@@ -0,0 +1,196 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from app.core.config import settings
+from app.core.openai_client import get_openai_client
+
+# Output sizes of the OpenAI embedding models we know about
+OPENAI_EMBEDDING_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+class EmbeddingProvider:
+    """Interface for turning texts into embedding vectors"""
+    
+    model_name: str = ""
+    dimension: Optional[int] = None
+    
+    def warmup(self) -> None:
+        """Load whatever the provider needs before the first request"""
+    
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts, preserving input order"""
+        raise NotImplementedError
+    
+    def close(self) -> None:
+        """Release provider resources"""
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the OpenAI API, one request per batch"""
+    
+    def __init__(self):
+        self.model_name = settings.OPENAI_EMBEDDING_MODEL
+        self.dimension = OPENAI_EMBEDDING_DIMENSIONS.get(self.model_name)
+        self._rate_lock = asyncio.Lock()
+        self._last_call = 0.0
+    
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        await self._throttle()
+        return await get_openai_client().embeddings(texts, model=self.model_name)
+    
+    async def _throttle(self) -> None:
+        """Space API calls to stay under EMBEDDING_REQUESTS_PER_MINUTE"""
+        if settings.EMBEDDING_REQUESTS_PER_MINUTE <= 0:
+            return
+        interval = 60.0 / settings.EMBEDDING_REQUESTS_PER_MINUTE
+        async with self._rate_lock:
+            wait = self._last_call + interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_call = time.monotonic()
+
+
+class SentenceTransformerEmbeddingProvider(EmbeddingProvider):
+    """Local, offline embeddings from a sentence-transformers model.
+    
+    Encoding runs on a thread pool (torch releases the GIL) so it never
+    blocks the event loop; large inputs are split into batches that are
+    encoded in parallel.
+    """
+    
+    def __init__(self):
+        self.model_name = settings.LOCAL_EMBEDDING_MODEL
+        self.batch_size = max(1, settings.LOCAL_EMBEDDING_BATCH_SIZE)
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.LOCAL_EMBEDDING_WORKERS),
+            thread_name_prefix="embedding"
+        )
+    
+    def warmup(self) -> None:
+        with self._load_lock:
+            if self._model is not None:
+                return
+            # Imported lazily: torch is heavy and only needed for this provider
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(self.model_name, device=settings.LOCAL_EMBEDDING_DEVICE)
+            self.dimension = model.get_sentence_embedding_dimension()
+            self._model = model
+    
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self._model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return embeddings.tolist()
+    
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        if self._model is None:
+            await loop.run_in_executor(self._executor, self.warmup)
+        
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*[
+            loop.run_in_executor(self._executor, self._encode, batch)
+            for batch in batches
+        ])
+        return [embedding for batch in results for embedding in batch]
+    
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class BatchingEmbeddingProvider(EmbeddingProvider):
+    """Coalesce concurrent embed calls into full batches.
+    
+    Callers that each embed a few texts (one small file's chunks) wait up
+    to `max_wait_ms` for one another, and their texts go to the wrapped
+    provider together in batches of up to `batch_size`. Bulk ingestion
+    uses it so thousands of small files don't cost one request each.
+    """
+    
+    def __init__(self, provider: EmbeddingProvider, batch_size: Optional[int] = None, max_wait_ms: float = 50):
+        self.provider = provider
+        self.model_name = provider.model_name
+        self.batch_size = max(1, batch_size or settings.EMBEDDING_BATCH_SIZE)
+        self.max_wait = max_wait_ms / 1000
+        self._queue: List[Tuple[List[str], asyncio.Future]] = []
+        self._queued_texts = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.requests = 0
+        self.texts = 0
+    
+    @property
+    def dimension(self) -> Optional[int]:
+        return self.provider.dimension
+    
+    def warmup(self) -> None:
+        self.provider.warmup()
+    
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        if len(texts) >= self.batch_size:
+            return await self._send(texts)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((texts, future))
+        self._queued_texts += len(texts)
+        if self._queued_texts >= self.batch_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._dispatch)
+        return await future
+    
+    def _dispatch(self) -> None:
+        """Send queued callers, whole, in batches of at most batch_size texts"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queue:
+            items, size = [], 0
+            while self._queue and (not items or size + len(self._queue[0][0]) <= self.batch_size):
+                texts, future = self._queue.pop(0)
+                items.append((texts, future))
+                size += len(texts)
+            self._queued_texts -= size
+            asyncio.ensure_future(self._run(items))
+    
+    async def _run(self, items: List[Tuple[List[str], asyncio.Future]]) -> None:
+        try:
+            embeddings = await self._send([text for texts, _ in items for text in texts])
+        except Exception as e:
+            # Each caller sees the failure and retries on its own
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        offset = 0
+        for texts, future in items:
+            if not future.done():
+                future.set_result(embeddings[offset:offset + len(texts)])
+            offset += len(texts)
+    
+    async def _send(self, texts: List[str]) -> List[List[float]]:
+        self.requests += 1
+        self.texts += len(texts)
+        return await self.provider.embed(texts)
+    
+    def close(self) -> None:
+        self.provider.close()
+
+
+def create_embedding_provider() -> EmbeddingProvider:
+    """Build the embedding provider selected by settings.EMBEDDING_PROVIDER"""
+    provider = settings.EMBEDDING_PROVIDER
+    if provider == "openai":
+        return OpenAIEmbeddingProvider()
+    if provider == "local":
+        return SentenceTransformerEmbeddingProvider()
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER: {provider}")
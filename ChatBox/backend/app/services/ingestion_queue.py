@@ -0,0 +1,448 @@
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Dict, Any, Optional
+from fastapi import UploadFile
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.pdf_extractor import spool_upload
+
+# Job fields: id, status (queued, running, done, failed), priority (higher
+# runs first), filename, path (spooled upload), chunks_done, chunks_total,
+# result, error, created_at, started_at, finished_at (epoch seconds)
+JOB_COLUMNS = (
+    "id", "status", "priority", "filename", "path", "chunks_done", "chunks_total",
+    "result", "error", "created_at", "started_at", "finished_at"
+)
+
+class IngestionQueueFull(Exception):
+    """Raised by submit when INGEST_MAX_QUEUED jobs are already waiting"""
+
+
+class SQLiteJobStore:
+    """Ingestion jobs in a local SQLite file.
+
+    Each call runs in a worker thread: a write can wait on the file lock
+    (another process claiming) and must not stall the event loop.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit; claim opens its own write transaction
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, priority INTEGER NOT NULL, "
+            "filename TEXT NOT NULL, path TEXT NOT NULL, chunks_done INTEGER NOT NULL DEFAULT 0, "
+            "chunks_total INTEGER, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_jobs_queue ON jobs (status, priority DESC, created_at)"
+        )
+        self._lock = threading.Lock()
+
+    async def create(self, job: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self._create, job)
+
+    def _create(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(JOB_COLUMNS)}) VALUES ({', '.join('?' * len(JOB_COLUMNS))})",
+                [_encode(column, job.get(column)) for column in JOB_COLUMNS]
+            )
+
+    async def claim(self) -> Optional[Dict[str, Any]]:
+        """Mark the highest-priority, oldest queued job running and return it"""
+        return await asyncio.to_thread(self._claim)
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            # A plain read first, so idle workers never take the write lock
+            if self._conn.execute("SELECT 1 FROM jobs WHERE status = 'queued' LIMIT 1").fetchone() is None:
+                return None
+            # IMMEDIATE takes the write lock up front, so two processes
+            # sharing the file can't claim the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority DESC, created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                started_at = time.time()
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (started_at, row["id"])
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {**_decode(dict(row)), "status": "running", "started_at": started_at}
+
+    async def wait(self, timeout: float) -> None:
+        """Jobs queued by another process sharing the file aren't signalled;
+        claim looks again (with a read) after `timeout`"""
+        await asyncio.sleep(timeout)
+
+    async def update(self, job_id: str, **fields: Any) -> None:
+        await asyncio.to_thread(self._update, job_id, fields)
+
+    def _update(self, job_id: str, fields: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{column} = ?' for column in fields)} WHERE id = ?",
+                [_encode(column, value) for column, value in fields.items()] + [job_id]
+            )
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _decode(dict(row)) if row is not None else None
+
+    async def count_queued(self) -> int:
+        return await asyncio.to_thread(self._count_queued)
+
+    def _count_queued(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    async def requeue_running(self) -> List[str]:
+        """Put jobs interrupted by a shutdown or crash back in the queue"""
+        return await asyncio.to_thread(self._requeue_running)
+
+    def _requeue_running(self) -> List[str]:
+        with self._lock:
+            ids = [row[0] for row in self._conn.execute("SELECT id FROM jobs WHERE status = 'running'")]
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, chunks_done = 0 WHERE status = 'running'"
+            )
+        return ids
+
+    async def prune(self, finished_before: float) -> None:
+        await asyncio.to_thread(self._prune, finished_before)
+
+    def _prune(self, finished_before: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (finished_before,)
+            )
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._close)
+
+    def _close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisJobStore:
+    """Ingestion jobs in Redis at settings.REDIS_URL: one hash per job and a
+    sorted set of queued ids ordered by (priority, age), read through
+    redis.asyncio.
+
+    Each new job also pushes its id on a notify list; idle workers, in any
+    process, block on that list instead of polling.
+    """
+
+    prefix = "ingest:"
+
+    # Pop the next queued id, add it to the running set and mark its hash
+    # running in one step: a crash leaves the job either still queued or
+    # running (and requeued on the next start), never lost in between
+    claim_script = """
+local popped = redis.call('ZPOPMIN', KEYS[1])
+if #popped == 0 then
+    return false
+end
+local job_id = popped[1]
+redis.call('SADD', KEYS[2], job_id)
+redis.call('HSET', ARGV[1] .. job_id, 'status', 'running', 'started_at', ARGV[2])
+return job_id
+"""
+
+    def __init__(self):
+        import redis.asyncio
+        from app.core.redis_client import get_async_redis
+        self._redis = get_async_redis()
+        # Blocking pops outlast the shared client's socket timeout
+        self._blocking = redis.asyncio.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1)
+        self._claim = self._redis.register_script(self.claim_script)
+        self.queue_key = self.prefix + "queue"
+        self.running_key = self.prefix + "running"
+        self.notify_key = self.prefix + "notify"
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}job:{job_id}"
+
+    @staticmethod
+    def _score(job: Dict[str, Any]) -> float:
+        # Priority dominates; creation time breaks ties (oldest first)
+        return -job["priority"] * 1e10 + job["created_at"]
+
+    async def create(self, job: Dict[str, Any]) -> None:
+        fields = {column: _encode(column, job.get(column)) for column in JOB_COLUMNS}
+        pipe = self._redis.pipeline()
+        pipe.hset(self._job_key(job["id"]), mapping={k: v for k, v in fields.items() if v is not None})
+        pipe.zadd(self.queue_key, {job["id"]: self._score(job)})
+        # Wakes one idle worker; tokens left over while all were busy only
+        # cost a claim that finds nothing
+        pipe.lpush(self.notify_key, job["id"])
+        pipe.ltrim(self.notify_key, 0, settings.INGEST_MAX_QUEUED)
+        await pipe.execute()
+
+    async def claim(self) -> Optional[Dict[str, Any]]:
+        job_id = await self._claim(
+            keys=[self.queue_key, self.running_key],
+            args=[self._job_key(""), time.time()]
+        )
+        if job_id is None:
+            return None
+        return await self.get(job_id.decode())
+
+    async def wait(self, timeout: float) -> None:
+        """Block until a job is queued (by any process) or `timeout` passes"""
+        await self._blocking.blpop([self.notify_key], timeout=max(1, math.ceil(timeout)))
+
+    async def update(self, job_id: str, **fields: Any) -> None:
+        encoded = {column: _encode(column, value) for column, value in fields.items()}
+        pipe = self._redis.pipeline()
+        pipe.hset(self._job_key(job_id), mapping={k: v for k, v in encoded.items() if v is not None})
+        if fields.get("status") in ("done", "failed"):
+            pipe.srem(self.running_key, job_id)
+            pipe.expire(self._job_key(job_id), settings.INGEST_JOB_RETENTION_HOURS * 3600)
+        await pipe.execute()
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        data = await self._redis.hgetall(self._job_key(job_id))
+        if not data:
+            return None
+        row = {column: None for column in JOB_COLUMNS}
+        row.update({key.decode(): value.decode() for key, value in data.items()})
+        return _decode(row)
+
+    async def count_queued(self) -> int:
+        return await self._redis.zcard(self.queue_key)
+
+    async def requeue_running(self) -> List[str]:
+        ids = [job_id.decode() for job_id in await self._redis.smembers(self.running_key)]
+        for job_id in ids:
+            job = await self.get(job_id)
+            pipe = self._redis.pipeline()
+            pipe.srem(self.running_key, job_id)
+            if job is not None:
+                pipe.hset(self._job_key(job_id), mapping={"status": "queued", "chunks_done": 0})
+                pipe.hdel(self._job_key(job_id), "started_at")
+                pipe.zadd(self.queue_key, {job_id: self._score(job)})
+            await pipe.execute()
+        return ids
+
+    async def prune(self, finished_before: float) -> None:
+        # Finished jobs expire on their own
+        pass
+
+    async def close(self) -> None:
+        await self._blocking.close()
+
+
+def _encode(column: str, value: Any) -> Any:
+    if column == "result" and value is not None:
+        return json.dumps(value)
+    return value
+
+def _decode(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Typed job dict from a stored row (Redis hands every field back as a string)"""
+    for column in ("priority", "chunks_done", "chunks_total"):
+        if row[column] is not None:
+            row[column] = int(row[column])
+    for column in ("created_at", "started_at", "finished_at"):
+        if row[column] is not None:
+            row[column] = float(row[column])
+    if row["result"] is not None:
+        row["result"] = json.loads(row["result"])
+    return row
+
+
+class IngestionQueue:
+    """Uploads spooled to disk and ingested by a fixed pool of background workers.
+
+    `submit` refuses new jobs once `max_queued` are waiting, so a burst of
+    uploads fills the disk spool only up to a bound instead of piling up.
+    Workers take the highest-priority job first and record chunk progress
+    as embedding batches complete. Jobs interrupted by a shutdown keep
+    their spooled file and are requeued on the next start.
+
+    Requeueing assumes one process runs the jobs of a store: with several
+    server processes, set INGEST_WORKERS=0 on all but one (the others only
+    enqueue and report status).
+
+    Idle workers wake on a submit in this process, on the store's signal
+    for jobs queued elsewhere (Redis), or after `poll_interval` (SQLite).
+    """
+
+    def __init__(
+        self,
+        store,
+        workers: Optional[int] = None,
+        max_queued: Optional[int] = None,
+        spool_directory: Optional[str] = None,
+        poll_interval: float = 1.0,
+        session_factory=AsyncSessionLocal
+    ):
+        self.store = store
+        self.workers = settings.INGEST_WORKERS if workers is None else workers
+        self.max_queued = max_queued or settings.INGEST_MAX_QUEUED
+        self.spool_directory = spool_directory or settings.INGEST_SPOOL_DIRECTORY
+        # Longest idle wait before looking at the store again
+        self.poll_interval = poll_interval
+        self.session_factory = session_factory
+        self._wake = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        os.makedirs(self.spool_directory, exist_ok=True)
+        await self.store.prune(time.time() - settings.INGEST_JOB_RETENTION_HOURS * 3600)
+        if self.workers > 0:
+            requeued = await self.store.requeue_running()
+            if requeued:
+                print(f"Ingestion queue: requeued {len(requeued)} interrupted jobs")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        """Stop the workers; a job cut short stays running in the store and is requeued on start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.store.close()
+
+    async def submit(self, file: UploadFile, priority: int = 0) -> Dict[str, Any]:
+        """Spool an upload and queue it; returns the new job"""
+        if await self.store.count_queued() >= self.max_queued:
+            raise IngestionQueueFull(f"{self.max_queued} ingestion jobs already queued")
+        suffix = os.path.splitext(file.filename)[1]
+        path = await spool_upload(file, suffix=suffix, directory=self.spool_directory)
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "priority": priority,
+            "filename": file.filename,
+            "path": path,
+            "chunks_done": 0,
+            "created_at": time.time()
+        }
+        try:
+            await self.store.create(job)
+        except Exception:
+            os.unlink(path)
+            raise
+        self._wake.set()
+        return {**{column: None for column in JOB_COLUMNS}, **job}
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.store.get(job_id)
+
+    async def _worker(self) -> None:
+        while True:
+            # Cleared before the claim, so a submit made while it runs
+            # still wakes this worker
+            self._wake.clear()
+            try:
+                job = await self.store.claim()
+            except Exception as e:
+                print(f"Ingestion queue claim failed: {e}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+            if job is None:
+                await self._idle()
+                continue
+            await self._process(job)
+
+    async def _idle(self) -> None:
+        """Wait for a submit here or the store's signal, at most poll_interval"""
+        waits = [asyncio.ensure_future(self._wake.wait()), asyncio.ensure_future(self._store_wait())]
+        try:
+            await asyncio.wait(waits, timeout=self.poll_interval + 1, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waits:
+                waiter.cancel()
+
+    async def _store_wait(self) -> None:
+        try:
+            await self.store.wait(self.poll_interval)
+        except Exception as e:
+            print(f"Ingestion queue wait failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _process(self, job: Dict[str, Any]) -> None:
+        from app.services.document_service import DocumentService
+
+        async def progress(done: int, total: int) -> None:
+            await self.store.update(job["id"], chunks_done=done, chunks_total=total)
+
+        try:
+            async with self.session_factory() as db:
+                result = await DocumentService(db).ingest_file(job["path"], job["filename"], progress=progress)
+        except Exception as e:
+            await self.store.update(job["id"], status="failed", error=str(e), finished_at=time.time())
+        else:
+            await self.store.update(
+                job["id"],
+                status="done",
+                result=result,
+                chunks_done=result["total_chunks"],
+                chunks_total=result["total_chunks"],
+                finished_at=time.time()
+            )
+        # Not reached on cancellation: the file is kept for the requeued job
+        try:
+            os.unlink(job["path"])
+        except FileNotFoundError:
+            pass
+
+
+def create_job_store():
+    """Build the job store configured in settings"""
+    backend = settings.INGEST_QUEUE_BACKEND
+    if backend == "sqlite":
+        return SQLiteJobStore(settings.INGEST_QUEUE_PATH)
+    if backend == "redis":
+        return RedisJobStore()
+    raise ValueError(f"Unknown INGEST_QUEUE_BACKEND: {backend}")
+
+
+# Process-wide queue, started with the app
+_ingestion_queue: Optional[IngestionQueue] = None
+
+async def init_ingestion_queue() -> IngestionQueue:
+    """Create the shared queue and start its workers (called at startup)"""
+    global _ingestion_queue
+    if _ingestion_queue is None:
+        queue = IngestionQueue(create_job_store())
+        await queue.start()
+        _ingestion_queue = queue
+    return _ingestion_queue
+
+async def shutdown_ingestion_queue() -> None:
+    """Stop the workers (called at shutdown)"""
+    global _ingestion_queue
+    queue, _ingestion_queue = _ingestion_queue, None
+    if queue is not None:
+        await queue.close()
+
+def get_ingestion_queue() -> Optional[IngestionQueue]:
+    return _ingestion_queue
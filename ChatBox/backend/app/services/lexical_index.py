@@ -0,0 +1,512 @@
+import asyncio
+import math
+import re
+import threading
+import unicodedata
+from array import array
+from contextlib import contextmanager
+from typing import Any, List, Dict, Tuple, Optional, Iterable, Iterator, Set
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.document import Document
+from app.models.source import Source
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*[a-z]*")
+
+def fold_diacritics(text: str) -> str:
+    """Lowercase and strip Vietnamese diacritics ("Mật khẩu" -> "mat khau")"""
+    text = text.lower().replace("đ", "d")
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+
+def tokenize(text: str) -> List[str]:
+    """Split text into folded syllables plus adjacent-syllable bigrams.
+    
+    Vietnamese words are usually two syllables ("mat khau"), so bigrams
+    carry most of the phrase signal. Numbers lose their thousands
+    separators, so "99,000đ" and "99000d" both index as "99000d" (and "99000").
+    """
+    syllables, numbers = [], []
+    for token in _TOKEN_RE.findall(fold_diacritics(text)):
+        token = token.replace(",", "").replace(".", "")
+        syllables.append(token)
+        # Also index the bare number of amounts like "99000d"
+        digits = token.rstrip("abcdefghijklmnopqrstuvwxyz")
+        if digits and digits != token and digits.isdigit():
+            numbers.append(digits)
+    bigrams = [f"{a}_{b}" for a, b in zip(syllables, syllables[1:])]
+    return syllables + numbers + bigrams
+
+
+class LexicalIndex:
+    """In-memory BM25 inverted index over chunk texts, keyed by vector-store id.
+    
+    Postings are parallel array('i') doc numbers (ascending) and array('H')
+    term frequencies, read as NumPy arrays without copying when searching.
+    Per-document length norms are kept as one float32 array, recomputed
+    after the corpus changes, and the BM25 weight of each posting of
+    recently searched terms is cached until then. Removals tombstone the
+    document (its norm becomes infinite, so it scores 0) and postings are
+    compacted once enough of them pile up.
+    
+    Search is term-at-a-time with MaxScore pruning: terms are scored in
+    decreasing order of their best possible contribution, and once the
+    remaining terms together can't lift an unseen document into the top k,
+    they are only looked up (by binary search) for the current candidates.
+    
+    `version` is the corpus version (see RetrievalCache) the index
+    reflects. Changes made in this process run inside `changing()` and
+    move it along; changes made elsewhere are applied by
+    refresh_lexical_index() once the version moves without it.
+    """
+    
+    k1 = 1.2
+    b = 0.75
+    # Docs tracked (to tighten the pruning threshold) before falling back
+    # to a scan of the score array
+    threshold_sample = 16384
+    # Most posting weights kept between searches (4 bytes each)
+    weight_cache_size = 4_000_000
+    
+    def __init__(self):
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._doc_keys: List[Optional[str]] = []
+        self._doc_lengths = array('I')
+        self._doc_of: Dict[str, int] = {}
+        self._total_length = 0
+        self._deleted: List[int] = []
+        # k1 * (1 - b + b * length / average length) per doc, inf once deleted
+        self._norms: Optional[np.ndarray] = None
+        # tf * (k1 + 1) / (tf + norm) per posting of recently searched terms,
+        # and its maximum; valid until the norms change
+        self._weights: Dict[str, Tuple[np.ndarray, float]] = {}
+        self._cached_weights = 0
+        self.version: Optional[str] = None
+        # Per source id, its (last_ingested_at, chunk_count) and chunk ids as
+        # of `version`: a refresh re-reads only the sources whose state moved
+        self.sources: Dict[int, Tuple[Optional[Tuple[Any, int]], Set[str]]] = {}
+        # Chunk changes started and finished in this process, and how many are running
+        self._changes = 0
+        self._changing = 0
+        self._lock = threading.RLock()
+    
+    def __len__(self) -> int:
+        return len(self._doc_of)
+    
+    def add(self, keys: List[str], texts: List[str]) -> None:
+        """Index (or re-index) chunks"""
+        analyzed = [self._analyze(text) for text in texts]
+        with self._lock:
+            self._insert(keys, analyzed)
+    
+    @staticmethod
+    def _analyze(text: str) -> Tuple[int, Dict[str, int]]:
+        """Length and term frequencies of a text (done outside the lock)"""
+        terms = tokenize(text)
+        frequencies: Dict[str, int] = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+        return len(terms), frequencies
+    
+    def _insert(self, keys: List[str], analyzed: List[Tuple[int, Dict[str, int]]]) -> None:
+        self._norms = None
+        for key, (length, frequencies) in zip(keys, analyzed):
+            if key in self._doc_of:
+                self._tombstone(key)
+            doc = len(self._doc_keys)
+            self._doc_keys.append(key)
+            self._doc_lengths.append(length)
+            self._doc_of[key] = doc
+            self._total_length += length
+            
+            for term, tf in frequencies.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = (array('i'), array('H'))
+                try:
+                    postings[0].append(doc)
+                    postings[1].append(min(tf, 65535))
+                except BufferError:
+                    # A search that raised can leave a NumPy view of the
+                    # postings alive for a moment; grow a copy instead
+                    docs, tfs = array('i', postings[0][:len(postings[1])]), array('H', postings[1])
+                    docs.append(doc)
+                    tfs.append(min(tf, 65535))
+                    self._postings[term] = (docs, tfs)
+    
+    def remove(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            self._delete(keys)
+    
+    def _delete(self, keys: Iterable[str]) -> None:
+        self._norms = None
+        for key in keys:
+            if key in self._doc_of:
+                self._tombstone(key)
+        if len(self._deleted) > 0.25 * len(self._doc_keys):
+            self._compact()
+    
+    @contextmanager
+    def changing(self) -> Iterator[None]:
+        """Wrap a change to the stored chunks made in this process, from its
+        first add/remove until it is committed and the version bumped"""
+        with self._lock:
+            self._changes += 1
+            self._changing += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._changes += 1
+                self._changing -= 1
+    
+    def advance(self, before: str, after: str) -> None:
+        """A change made here moved the corpus from version `before` to `after`"""
+        with self._lock:
+            # Otherwise a change made elsewhere is still missing
+            if self.version == before:
+                self.version = after
+    
+    def change_count(self) -> Optional[int]:
+        """Changes made in this process so far; None while one is running"""
+        with self._lock:
+            return None if self._changing else self._changes
+    
+    def touch_source(self, source_id: int, keys: Iterable[str]) -> None:
+        """Chunks added here to a source: the next refresh re-reads it, and
+        knows these ids in case the source has lost them by then"""
+        with self._lock:
+            _, known = self.sources.get(source_id, (None, set()))
+            known.update(keys)
+            self.sources[source_id] = (None, known)
+    
+    def missing(self, keys: Iterable[str]) -> List[str]:
+        """The keys not indexed"""
+        with self._lock:
+            return [key for key in keys if key not in self._doc_of]
+    
+    def sync(
+        self,
+        since: int,
+        remove: Iterable[str] = (),
+        keys: List[str] = (),
+        texts: List[str] = (),
+        version: Optional[str] = None,
+        sources: Optional[Dict[int, Tuple[Optional[Tuple[Any, int]], Set[str]]]] = None
+    ) -> bool:
+        """Apply changes read from the database (see refresh_lexical_index),
+        then adopt `version` and `sources` if given. Nothing is applied, and
+        False is returned, once this process changed chunks itself after
+        change_count() returned `since`: the database read may predate it."""
+        analyzed = [self._analyze(text) for text in texts]
+        with self._lock:
+            if self._changing or self._changes != since:
+                return False
+            self._delete(remove)
+            self._insert(keys, analyzed)
+            if version is not None:
+                self.version = version
+            if sources is not None:
+                self.sources = sources
+            return True
+    
+    def _tombstone(self, key: str) -> None:
+        doc = self._doc_of.pop(key)
+        self._doc_keys[doc] = None
+        self._total_length -= self._doc_lengths[doc]
+        self._deleted.append(doc)
+    
+    def _compact(self) -> None:
+        """Renumber live documents and drop tombstoned postings"""
+        alive = np.ones(len(self._doc_keys), dtype=bool)
+        alive[self._deleted] = False
+        # New number of each live doc; postings stay in ascending order
+        remap = np.cumsum(alive, dtype=np.int32) - 1
+        doc_keys = [key for key in self._doc_keys if key is not None]
+        doc_lengths = array('I', np.frombuffer(self._doc_lengths, dtype=np.uint32)[alive].tobytes())
+        
+        postings: Dict[str, Tuple[array, array]] = {}
+        for term, (docs, tfs) in self._postings.items():
+            docs = np.frombuffer(docs, dtype=np.int32)
+            keep = alive[docs]
+            if keep.any():
+                postings[term] = (
+                    array('i', remap[docs[keep]].tobytes()),
+                    array('H', np.frombuffer(tfs, dtype=np.uint16)[keep].tobytes())
+                )
+        
+        self._postings = postings
+        self._doc_keys = doc_keys
+        self._doc_lengths = doc_lengths
+        self._doc_of = {key: doc for doc, key in enumerate(doc_keys)}
+        self._deleted = []
+    
+    def _length_norms(self) -> np.ndarray:
+        if self._norms is None:
+            lengths = np.frombuffer(self._doc_lengths, dtype=np.uint32).astype(np.float32)
+            average_length = self._total_length / len(self._doc_of)
+            norms = self.k1 * (1 - self.b + self.b * lengths / average_length)
+            norms[self._deleted] = np.inf
+            self._norms = norms
+            self._weights, self._cached_weights = {}, 0
+        return self._norms
+    
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """Return (key, BM25 score) pairs for the best matching chunks"""
+        with self._lock:
+            live = len(self._doc_of)
+            if live == 0 or top_k <= 0:
+                return []
+            norms = self._length_norms()
+            
+            # (upper bound, idf, doc numbers, posting weights) per query term
+            terms = []
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                docs = np.frombuffer(postings[0], dtype=np.int32)
+                # df includes not-yet-compacted tombstones; close enough for
+                # ranking, but capped so idf (and the pruning bounds) stay positive
+                df = min(len(docs), live)
+                idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+                weights, max_weight = self._term_weights(term, postings, docs, norms)
+                if max_weight > 0:  # 0 once all its chunks are deleted
+                    terms.append((idf * max_weight, idf, docs, weights))
+            if not terms:
+                return []
+            terms.sort(key=lambda entry: entry[0], reverse=True)
+            # remaining[i]: the most terms i.. can add to any document
+            remaining = [0.0]
+            for entry in reversed(terms):
+                remaining.append(remaining[-1] + entry[0])
+            remaining.reverse()
+            
+            scores = np.zeros(len(self._doc_keys), dtype=np.float32)
+            threshold = 0.0  # a lower bound on the k-th best final score
+            # Every doc scored so far (in parts), while that is only a few thousand
+            touched, touched_count = [], 0
+            candidates = None
+            for i, (_, idf, docs, weights) in enumerate(terms):
+                if candidates is None and remaining[i] <= threshold:
+                    # No unseen document can reach the top k any more
+                    if touched is not None:
+                        touched = np.concatenate(touched)
+                        candidates = touched[scores[touched] > threshold - remaining[i]]
+                    else:
+                        # int32 like the postings, or searchsorted copies them to int64
+                        candidates = np.flatnonzero(scores > threshold - remaining[i]).astype(np.int32)
+                if candidates is None:
+                    if touched is not None and touched_count + len(docs) <= self.threshold_sample:
+                        # Docs seen for the first time (deleted ones score 0 and may
+                        # repeat, which only lowers the threshold)
+                        touched.append(docs[scores[docs] == 0])
+                        touched_count += len(touched[-1])
+                    else:
+                        touched = None
+                    scores[docs] += idf * weights
+                    if remaining[0] - remaining[i + 1] < remaining[i + 1]:
+                        # Nothing can outscore the remaining terms yet: no switch next
+                        continue
+                    if touched is not None:
+                        threshold = max(threshold, self._kth_best(scores[np.concatenate(touched)], top_k))
+                    elif len(docs) <= self.threshold_sample:
+                        threshold = max(threshold, self._kth_best(scores[docs], top_k))
+                    continue
+                
+                if len(candidates) * 16 < len(docs):
+                    # Only look the term up for the candidates still in the race
+                    positions = docs.searchsorted(candidates)
+                    hit = docs.take(positions, mode="clip") == candidates
+                    scores[candidates[hit]] += idf * weights[positions[hit]]
+                else:
+                    # Scoring the whole list is cheaper than binary searches;
+                    # non-candidates gain score but are never read again
+                    scores[docs] += idf * weights
+                candidate_scores = scores[candidates]
+                threshold = max(threshold, self._kth_best(candidate_scores, top_k))
+                candidates = candidates[candidate_scores >= threshold - remaining[i + 1]]
+            
+            if candidates is None:
+                candidates = np.concatenate(touched) if touched is not None else np.flatnonzero(scores > 0)
+            candidate_scores = scores[candidates]
+            if len(candidates) > top_k:
+                best = np.argpartition(candidate_scores, len(candidates) - top_k)[-top_k:]
+                candidates, candidate_scores = candidates[best], candidate_scores[best]
+            order = np.argsort(-candidate_scores, kind="stable")
+            return [
+                (self._doc_keys[doc], float(score))
+                for doc, score in zip(candidates[order].tolist(), candidate_scores[order].tolist())
+                if score > 0
+            ]
+    
+    def _term_weights(self, term: str, postings: Tuple[array, array], docs: np.ndarray, norms: np.ndarray) -> Tuple[np.ndarray, float]:
+        cached = self._weights.get(term)
+        if cached is not None:
+            return cached
+        tf = np.frombuffer(postings[1], dtype=np.uint16).astype(np.float32)
+        weights = tf * (self.k1 + 1) / (tf + norms[docs])
+        cached = (weights, float(weights.max()))
+        if self._cached_weights + len(weights) > self.weight_cache_size:
+            self._weights, self._cached_weights = {}, 0
+        self._weights[term] = cached
+        self._cached_weights += len(weights)
+        return cached
+    
+    @staticmethod
+    def _kth_best(values: np.ndarray, k: int) -> float:
+        if len(values) < k:
+            return 0.0
+        return float(np.partition(values, len(values) - k)[len(values) - k])
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._postings = {}
+            self._doc_keys = []
+            self._doc_lengths = array('I')
+            self._doc_of = {}
+            self._total_length = 0
+            self._deleted = []
+            self._norms = None
+            self._weights, self._cached_weights = {}, 0
+            self.version = None
+            self.sources = {}
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists: score(d) = sum over lists of 1 / (k + rank)"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+# Process-wide instance shared by all requests
+_lexical_index: Optional[LexicalIndex] = None
+_lexical_index_lock = threading.Lock()
+
+def get_lexical_index() -> Optional[LexicalIndex]:
+    """Return the shared lexical index (None when hybrid search is disabled)"""
+    global _lexical_index
+    if not settings.HYBRID_SEARCH_ENABLED:
+        return None
+    with _lexical_index_lock:
+        if _lexical_index is None:
+            _lexical_index = LexicalIndex()
+        return _lexical_index
+
+async def _source_states(db: AsyncSession) -> Dict[int, Tuple[Any, int]]:
+    """(last_ingested_at, chunk_count) of every source. An ingestion that
+    changes chunks commits a new state with them, and a deletion removes
+    the row along with its chunks."""
+    rows = await db.execute(select(Source.id, Source.last_ingested_at, Source.chunk_count))
+    return {row.id: (row.last_ingested_at, row.chunk_count) for row in rows}
+
+async def init_lexical_index(db: AsyncSession, version: Optional[str] = None) -> Optional[LexicalIndex]:
+    """Build the shared lexical index from the stored chunks (called at
+    startup); `version` is the corpus version read just before"""
+    index = get_lexical_index()
+    if index is None:
+        return None
+    index.clear()
+    # Read before the chunks: a source changed in between is re-read by the next refresh
+    states = await _source_states(db)
+    source_keys: Dict[int, Set[str]] = {source_id: set() for source_id in states}
+    keys, texts = [], []
+    rows = await db.stream(
+        select(Document.embedding_id, Document.content, Document.source_id)
+        .where(Document.embedding_id.isnot(None))
+        .execution_options(yield_per=1000)
+    )
+    async for embedding_id, content, source_id in rows:
+        keys.append(embedding_id)
+        texts.append(content)
+        if source_id in source_keys:
+            source_keys[source_id].add(embedding_id)
+        if len(keys) >= 1000:
+            index.add(keys, texts)
+            keys, texts = [], []
+    index.add(keys, texts)
+    index.version = version
+    index.sources = {source_id: (states[source_id], ids) for source_id, ids in source_keys.items()}
+    return index
+
+async def refresh_lexical_index(index: LexicalIndex, version: str) -> bool:
+    """Catch the index up with chunks stored or deleted by another process
+    (the ingestion CLI, another worker) once the corpus reached `version`.
+    
+    Only sources whose state moved since the index last caught up are
+    read (see _source_states): chunk ids a source no longer has are
+    removed, and new chunks are read and tokenized a batch at a time off
+    the event loop. Returns False without adopting `version` when a change
+    made in this process gets in the way; the next search retries.
+    """
+    since = index.change_count()
+    if since is None:
+        return False
+    async with AsyncSessionLocal() as db:
+        states = await _source_states(db)
+        previous = index.sources
+        sources = {source_id: entry for source_id, entry in previous.items() if source_id in states}
+        stale: Set[str] = set()
+        for source_id in previous.keys() - states.keys():
+            stale |= previous[source_id][1]
+        changed = [
+            source_id for source_id, state in states.items()
+            if source_id not in previous or previous[source_id][0] != state
+        ]
+        added: List[str] = []
+        for start in range(0, len(changed), 500):
+            batch = changed[start:start + 500]
+            source_keys: Dict[int, Set[str]] = {source_id: set() for source_id in batch}
+            rows = await db.execute(
+                select(Document.source_id, Document.embedding_id)
+                .where(Document.source_id.in_(batch), Document.embedding_id.isnot(None))
+            )
+            for source_id, embedding_id in rows:
+                source_keys[source_id].add(embedding_id)
+            for source_id, keys in source_keys.items():
+                if source_id in previous:
+                    stale |= previous[source_id][1] - keys
+                sources[source_id] = (states[source_id], keys)
+                added.extend(keys)
+        added = index.missing(added)
+        
+        removed: Set[str] = set()
+        stale_keys = list(stale)
+        for start in range(0, len(stale_keys), 500):
+            batch = stale_keys[start:start + 500]
+            # An id still stored (under another source) stays
+            stored = set((await db.scalars(
+                select(Document.embedding_id).where(Document.embedding_id.in_(batch))
+            )).all())
+            removed.update(key for key in batch if key not in stored)
+        
+        batches = [added[start:start + 500] for start in range(0, len(added), 500)]
+        if not await asyncio.to_thread(
+            index.sync, since, removed,
+            version=None if batches else version,
+            sources=None if batches else sources
+        ):
+            return False
+        for i, batch in enumerate(batches):
+            rows = (await db.execute(
+                select(Document.embedding_id, Document.content).where(Document.embedding_id.in_(batch))
+            )).all()
+            last = i == len(batches) - 1
+            applied = await asyncio.to_thread(
+                index.sync, since,
+                keys=[row.embedding_id for row in rows],
+                texts=[row.content for row in rows],
+                version=version if last else None,
+                sources=sources if last else None
+            )
+            if not applied:
+                return False
+    if added or removed:
+        print(f"Lexical index refreshed to corpus version {version}: +{len(added)} -{len(removed)} chunks")
+    return True
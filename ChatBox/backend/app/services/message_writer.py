@@ -0,0 +1,276 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import select
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.conversation import Conversation
+from app.models.message import Message, MessageRole
+
+class MessageWriter:
+    """Write-behind persistence for chat messages.
+
+    `enqueue` appends message rows to a local journal in one write off the
+    event loop (flushed to the OS, and fsynced when
+    MESSAGE_WRITE_BEHIND_FSYNC is set) and returns; a background task
+    inserts pending rows in one transaction every `interval_ms`, or as
+    soon as `batch_rows` are waiting. A checkpoint
+    file records how much of the journal is in the database, so rows
+    accepted before a crash are replayed on the next start. Replay skips
+    rows already stored (same conversation, role and timestamp), which
+    covers a crash between a commit and its checkpoint.
+
+    The journal belongs to one process: run a single worker, or give
+    each worker its own MESSAGE_WRITE_BEHIND_JOURNAL.
+    """
+
+    def __init__(
+        self,
+        journal_path: Optional[str] = None,
+        interval_ms: Optional[int] = None,
+        batch_rows: Optional[int] = None,
+        fsync: Optional[bool] = None,
+        session_factory=AsyncSessionLocal
+    ):
+        self.journal_path = journal_path or settings.MESSAGE_WRITE_BEHIND_JOURNAL
+        self.checkpoint_path = self.journal_path + ".checkpoint"
+        self.interval = (interval_ms if interval_ms is not None else settings.MESSAGE_WRITE_BEHIND_INTERVAL_MS) / 1000
+        self.batch_rows = batch_rows or settings.MESSAGE_WRITE_BEHIND_BATCH_ROWS
+        self.fsync = settings.MESSAGE_WRITE_BEHIND_FSYNC if fsync is None else fsync
+        self.session_factory = session_factory
+        # (row, journal offset just past it), in journal order
+        self._pending: List[Tuple[Dict[str, Any], int]] = []
+        self._journal = None
+        # Serialises journal appends with each other and with rotation
+        self._journal_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.rows_written = 0
+        self.batches_written = 0
+        self.errors = 0
+
+    async def start(self) -> None:
+        """Replay rows left in the journal, then start the background flusher"""
+        directory = os.path.dirname(self.journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        replayed = self._read_journal()
+        # No newline translation: pending offsets are counted in bytes
+        self._journal = open(self.journal_path, "a", encoding="utf-8", newline="")
+        if replayed:
+            try:
+                await self._replay(replayed)
+            except Exception:
+                # Leave the journal for the next start
+                self._journal.close()
+                self._journal = None
+                raise
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the flusher and write everything still pending (called at shutdown)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            while await self.flush():
+                pass
+        except Exception as e:
+            # Still journaled: replayed on the next start
+            print(f"Message write-behind final flush failed, {len(self._pending)} rows left in journal: {e}")
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    @staticmethod
+    def make_row(
+        conversation_id: int,
+        role: MessageRole,
+        content: str,
+        tokens_used: Optional[int] = None,
+        created_at: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        return {
+            "conversation_id": conversation_id,
+            "role": role.name,
+            "content": content,
+            "tokens_used": tokens_used,
+            "created_at": (created_at or datetime.utcnow()).isoformat()
+        }
+
+    async def enqueue(self, rows: List[Dict[str, Any]]) -> None:
+        """Accept message rows (both of a turn) with one write and one fsync;
+        they are durable once this returns"""
+        lines = [json.dumps(row, ensure_ascii=False) + "\n" for row in rows]
+        async with self._journal_lock:
+            offset = await asyncio.to_thread(self._append, "".join(lines))
+            for row, line in zip(rows, lines):
+                offset += len(line.encode("utf-8"))
+                self._pending.append((row, offset))
+        if len(self._pending) >= self.batch_rows:
+            self._wake.set()
+
+    def _append(self, data: str) -> int:
+        """Write to the journal; returns the offset the data starts at"""
+        offset = self._journal.tell()
+        self._journal.write(data)
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        return offset
+
+    def pending(self, conversation_id: int) -> List[Dict[str, Any]]:
+        """Rows of a conversation not yet in the database, oldest first"""
+        return [row for row, _ in self._pending if row["conversation_id"] == conversation_id]
+
+    async def flush(self) -> int:
+        """Insert pending rows in one transaction; returns how many were written"""
+        async with self._flush_lock:
+            batch = self._pending[:self.batch_rows]
+            if not batch:
+                return 0
+            rows = [row for row, _ in batch]
+            await self._insert(rows)
+            del self._pending[:len(batch)]
+            # Checkpoint and rotate fsync and truncate: in a thread, as appends are
+            await asyncio.to_thread(self._write_checkpoint, batch[-1][1])
+            self.rows_written += len(rows)
+            self.batches_written += 1
+            if not self._pending:
+                async with self._journal_lock:
+                    # Rows appended while we waited are not stored yet
+                    if not self._pending:
+                        await asyncio.to_thread(self._rotate)
+            return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "rows_written": self.rows_written,
+            "batches_written": self.batches_written,
+            "errors": self.errors
+        }
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                while await self.flush() >= self.batch_rows:
+                    pass
+            except Exception as e:
+                # Rows stay pending (and journaled); retry after a pause
+                self.errors += 1
+                print(f"Message write-behind flush failed: {e}")
+                await asyncio.sleep(min(self.interval * 20, 5))
+
+    async def _insert(self, rows: List[Dict[str, Any]]) -> None:
+        async with self.session_factory() as db:
+            # Rows of conversations deleted meanwhile would fail the whole batch
+            conversation_ids = {row["conversation_id"] for row in rows}
+            existing = set((await db.scalars(
+                select(Conversation.id).where(Conversation.id.in_(conversation_ids))
+            )).all())
+            dropped = len([row for row in rows if row["conversation_id"] not in existing])
+            if dropped:
+                print(f"Message write-behind: dropped {dropped} rows of deleted conversations")
+            # ORM inserts, so the conversation counters stay in step
+            db.add_all([
+                Message(
+                    conversation_id=row["conversation_id"],
+                    role=MessageRole[row["role"]],
+                    content=row["content"],
+                    tokens_used=row["tokens_used"],
+                    created_at=datetime.fromisoformat(row["created_at"])
+                )
+                for row in rows if row["conversation_id"] in existing
+            ])
+            await db.commit()
+
+    async def _replay(self, rows: List[Dict[str, Any]]) -> None:
+        async with self.session_factory() as db:
+            stored = set((await db.execute(
+                select(Message.conversation_id, Message.role, Message.created_at).where(
+                    Message.conversation_id.in_({row["conversation_id"] for row in rows}),
+                    Message.created_at >= min(datetime.fromisoformat(row["created_at"]) for row in rows)
+                )
+            )).all())
+        missing = [
+            row for row in rows
+            if (row["conversation_id"], MessageRole[row["role"]], datetime.fromisoformat(row["created_at"])) not in stored
+        ]
+        print(f"Message write-behind: replaying {len(missing)} of {len(rows)} journaled rows")
+        for start in range(0, len(missing), self.batch_rows):
+            await self._insert(missing[start:start + self.batch_rows])
+        await asyncio.to_thread(self._rotate)
+
+    def _read_journal(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.journal_path):
+            return []
+        offset = 0
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                offset = int(f.read().strip() or 0)
+        rows = []
+        with open(self.journal_path, encoding="utf-8") as f:
+            f.seek(offset)
+            for line in f:
+                # A torn last line is a row whose enqueue never returned
+                if line.endswith("\n"):
+                    rows.append(json.loads(line))
+        return rows
+
+    def _write_checkpoint(self, offset: int) -> None:
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(offset))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _rotate(self) -> None:
+        """Empty the journal once everything in it is stored"""
+        # Checkpoint first: a crash in between replays (and skips) stored rows
+        # instead of skipping rows appended after a restart
+        self._write_checkpoint(0)
+        if self._journal is not None:
+            self._journal.truncate(0)
+            self._journal.seek(0)
+        else:
+            open(self.journal_path, "w").close()
+
+
+# Process-wide writer, only when MESSAGE_WRITE_BEHIND is enabled
+_message_writer: Optional[MessageWriter] = None
+
+async def init_message_writer() -> Optional[MessageWriter]:
+    """Create the shared writer and replay its journal (called at startup)"""
+    global _message_writer
+    if not settings.MESSAGE_WRITE_BEHIND:
+        return None
+    if _message_writer is None:
+        writer = MessageWriter()
+        await writer.start()
+        _message_writer = writer
+    return _message_writer
+
+async def shutdown_message_writer() -> None:
+    """Flush pending rows and stop the shared writer (called at shutdown)"""
+    global _message_writer
+    writer, _message_writer = _message_writer, None
+    if writer is not None:
+        await writer.close()
+
+def get_message_writer() -> Optional[MessageWriter]:
+    return _message_writer
@@ -0,0 +1,375 @@
+import os
+import json
+import glob
+import threading
+from typing import List, Dict, Any, Optional
+import numpy as np
+from app.core.config import settings
+from app.services.vector_store import VectorStore
+
+class VectorStoreLocked(RuntimeError):
+    """Raised by open when another process has the store's directory open"""
+
+class NumpyVectorStore(VectorStore):
+    """Exact cosine search over a contiguous, memory-mapped float32 matrix.
+    
+    Rows hold L2-normalized vectors, so a batch of queries is a single
+    matrix product followed by an argpartition top-k per query. Deletes
+    only tombstone a row; once dead rows exceed NUMPY_INDEX_COMPACT_RATIO
+    of the matrix, live rows are rewritten contiguously.
+    
+    Chunk text and metadata live in an append-only JSON-lines log that is
+    replayed on open. Vectors are written before their log record, so
+    every logged row has its vector on disk. Compaction writes a new
+    generation of both files and switches to it by atomically replacing
+    meta.json.
+    
+    One process at a time: open() takes an exclusive lock on the directory
+    and fails while another process (a server, the ingestion script) holds
+    it, since two writers would append over each other's rows.
+    """
+    
+    name = "numpy"
+    INITIAL_CAPACITY = 1024
+    
+    def __init__(self, path: Optional[str] = None, compact_ratio: Optional[float] = None):
+        self.path = path or settings.NUMPY_INDEX_DIRECTORY
+        self.compact_ratio = settings.NUMPY_INDEX_COMPACT_RATIO if compact_ratio is None else compact_ratio
+        self.metadata: Dict[str, Any] = {}
+        self.dimension = 0
+        self._generation = 0
+        self._vectors: Optional[np.memmap] = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._capacity = 0
+        self._size = 0  # rows in use, live or dead
+        self._dead = 0
+        self._ids: List[Optional[str]] = []
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Optional[Dict[str, Any]]] = []
+        self._row_of: Dict[str, int] = {}
+        self._log = None
+        self._lock_file = None
+        self._lock = threading.RLock()
+    
+    # Files
+    
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+    
+    def _vectors_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"vectors.{generation}.f32")
+    
+    def _log_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"records.{generation}.jsonl")
+    
+    def _write_meta(self) -> None:
+        tmp_path = self._meta_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({**self.metadata, "generation": self._generation}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._meta_path())
+    
+    def _lock_directory(self) -> None:
+        self._lock_file = open(os.path.join(self.path, "lock"), "a")
+        try:
+            if os.name == "nt":
+                import msvcrt
+                msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._unlock_directory()
+            raise VectorStoreLocked(
+                f"The numpy vector store at {self.path} is open in another process "
+                "(a server or the ingestion script); it allows one process at a time"
+            )
+    
+    def _unlock_directory(self) -> None:
+        # Closing the file releases the lock
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+    
+    def _remove_stale_generations(self) -> None:
+        current = {self._vectors_path(self._generation), self._log_path(self._generation)}
+        for path in glob.glob(os.path.join(self.path, "vectors.*.f32")) + glob.glob(os.path.join(self.path, "records.*.jsonl")):
+            if path not in current:
+                os.remove(path)
+    
+    def _map_vectors(self, capacity: int) -> None:
+        """(Re)map the vector file with room for at least capacity rows"""
+        path = self._vectors_path(self._generation)
+        row_bytes = self.dimension * 4
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(path, "ab") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < capacity * row_bytes:
+                f.truncate(capacity * row_bytes)
+        capacity = os.path.getsize(path) // row_bytes
+        self._vectors = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._alive = alive
+        self._capacity = capacity
+    
+    # Lifecycle
+    
+    def open(self, create_metadata: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            if self._lock_file is None:
+                self._lock_directory()
+            if os.path.exists(self._meta_path()):
+                with open(self._meta_path()) as f:
+                    stored = json.load(f)
+                self._generation = stored.pop("generation", 0)
+                self.metadata = stored
+            else:
+                if not create_metadata.get("embedding_dimension"):
+                    raise ValueError("The numpy vector store needs a known embedding dimension")
+                self.metadata = dict(create_metadata)
+                self._generation = 0
+                self._write_meta()
+            
+            self.dimension = int(self.metadata["embedding_dimension"])
+            self._remove_stale_generations()
+            self._replay_log()
+            self._map_vectors(max(self._size, self.INITIAL_CAPACITY))
+            self._log = open(self._log_path(self._generation), "a", encoding="utf-8")
+            
+            if self._should_compact():
+                self.compact()
+            return self.metadata
+    
+    def _replay_log(self) -> None:
+        self._ids, self._documents, self._metadatas = [], [], []
+        self._row_of = {}
+        alive: List[bool] = []
+        path = self._log_path(self._generation)
+        complete = 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Torn write from a crash; the vector row is simply unused
+                        break
+                    complete += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record["op"] == "add":
+                        row = record["row"]
+                        while len(self._ids) <= row:
+                            self._ids.append(None)
+                            self._documents.append(None)
+                            self._metadatas.append(None)
+                            alive.append(False)
+                        previous = self._row_of.get(record["id"])
+                        if previous is not None:
+                            alive[previous] = False
+                        self._ids[row] = record["id"]
+                        self._documents[row] = record["document"]
+                        self._metadatas[row] = record["metadata"]
+                        alive[row] = True
+                        self._row_of[record["id"]] = row
+                    elif record["op"] == "delete":
+                        for doc_id in record["ids"]:
+                            row = self._row_of.pop(doc_id, None)
+                            if row is not None:
+                                alive[row] = False
+            if os.path.getsize(path) > complete:
+                # Drop the fragment so the next append starts on a new line
+                os.truncate(path, complete)
+        self._size = len(alive)
+        self._alive = np.array(alive, dtype=bool)
+        self._dead = self._size - int(self._alive.sum())
+        for row in np.flatnonzero(~self._alive):
+            self._documents[row] = None
+            self._metadatas[row] = None
+    
+    def close(self) -> None:
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._vectors = None
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            self._unlock_directory()
+    
+    # Writes
+    
+    def _append_log(self, records: List[Dict[str, Any]]) -> None:
+        self._log.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+        self._log.flush()
+        os.fsync(self._log.fileno())
+    
+    def add(self, ids, embeddings, documents, metadatas) -> None:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dimension:
+            raise ValueError(f"Expected {self.dimension}-dim embeddings, got shape {vectors.shape}")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+        
+        with self._lock:
+            start = self._size
+            end = start + len(ids)
+            if end > self._capacity:
+                self._map_vectors(max(end, self._capacity * 2))
+            self._vectors[start:end] = vectors
+            self._vectors.flush()
+            
+            self._append_log([
+                {"op": "add", "row": start + i, "id": doc_id, "document": document, "metadata": metadata}
+                for i, (doc_id, document, metadata) in enumerate(zip(ids, documents, metadatas))
+            ])
+            
+            for i, (doc_id, document, metadata) in enumerate(zip(ids, documents, metadatas)):
+                row = start + i
+                # Re-adding an id replaces the earlier row
+                previous = self._row_of.get(doc_id)
+                if previous is not None:
+                    self._kill_row(previous)
+                self._ids.append(doc_id)
+                self._documents.append(document)
+                self._metadatas.append(metadata)
+                self._alive[row] = True
+                self._row_of[doc_id] = row
+            self._size = end
+            if self._should_compact():
+                self.compact()
+    
+    def _kill_row(self, row: int) -> None:
+        self._alive[row] = False
+        self._documents[row] = None
+        self._metadatas[row] = None
+        self._dead += 1
+    
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            present = [doc_id for doc_id in ids if doc_id in self._row_of]
+            if not present:
+                return
+            self._append_log([{"op": "delete", "ids": present}])
+            for doc_id in present:
+                self._kill_row(self._row_of.pop(doc_id))
+            if self._should_compact():
+                self.compact()
+    
+    def delete_where(self, where: Dict[str, Any]) -> None:
+        with self._lock:
+            ids = [
+                doc_id for doc_id, row in self._row_of.items()
+                if all((self._metadatas[row] or {}).get(key) == value for key, value in where.items())
+            ]
+            self.delete(ids)
+    
+    def _should_compact(self) -> bool:
+        return self._dead > 0 and self._dead >= self.compact_ratio * self._size
+    
+    def compact(self) -> None:
+        """Rewrite live rows contiguously into a new generation of files"""
+        with self._lock:
+            live_rows = np.flatnonzero(self._alive[:self._size])
+            new_generation = self._generation + 1
+            capacity = max(len(live_rows), self.INITIAL_CAPACITY)
+            
+            new_vectors = np.memmap(
+                self._vectors_path(new_generation), dtype=np.float32, mode="w+",
+                shape=(capacity, self.dimension)
+            )
+            # Copy in slices to keep peak memory bounded
+            for start in range(0, len(live_rows), 65536):
+                rows = live_rows[start:start + 65536]
+                new_vectors[start:start + len(rows)] = self._vectors[rows]
+            new_vectors.flush()
+            del new_vectors
+            
+            ids = [self._ids[row] for row in live_rows]
+            documents = [self._documents[row] for row in live_rows]
+            metadatas = [self._metadatas[row] for row in live_rows]
+            with open(self._log_path(new_generation), "w", encoding="utf-8") as f:
+                for new_row, (doc_id, document, metadata) in enumerate(zip(ids, documents, metadatas)):
+                    f.write(json.dumps(
+                        {"op": "add", "row": new_row, "id": doc_id, "document": document, "metadata": metadata},
+                        ensure_ascii=False
+                    ) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            
+            # Commit point: meta.json now names the new generation
+            old_generation = self._generation
+            self._generation = new_generation
+            self._write_meta()
+            
+            if self._log is not None:
+                self._log.close()
+            self._vectors = None
+            self._ids, self._documents, self._metadatas = ids, documents, metadatas
+            self._row_of = {doc_id: row for row, doc_id in enumerate(ids)}
+            self._size = len(ids)
+            self._dead = 0
+            self._alive = np.ones(len(ids), dtype=bool)
+            self._map_vectors(capacity)
+            self._log = open(self._log_path(new_generation), "a", encoding="utf-8")
+            
+            for path in (self._vectors_path(old_generation), self._log_path(old_generation)):
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    # Reads
+    
+    def query(self, query_embeddings: List[List[float]], top_k: int) -> List[Dict[str, List[Any]]]:
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries /= norms
+        
+        # Snapshot under the lock; compaction swaps these objects, it never mutates them
+        with self._lock:
+            size = self._size
+            vectors = self._vectors[:size]
+            alive = self._alive[:size].copy()
+            ids, documents, metadatas = self._ids, self._documents, self._metadatas
+            live = size - self._dead
+        
+        k = min(top_k, live)
+        if k <= 0:
+            return [{"ids": [], "documents": [], "metadatas": [], "scores": []} for _ in range(len(queries))]
+        
+        # One matrix product for the whole batch of queries: (queries x rows)
+        scores = queries @ vectors.T
+        scores[:, ~alive] = -np.inf
+        
+        results = []
+        for row_scores in scores:
+            if k < size:
+                top = np.argpartition(-row_scores, k - 1)[:k]
+            else:
+                top = np.arange(size)
+            top = top[np.argsort(-row_scores[top])][:k]
+            results.append({
+                "ids": [ids[row] for row in top],
+                "documents": [documents[row] for row in top],
+                "metadatas": [metadatas[row] for row in top],
+                "scores": [float(row_scores[row]) for row in top]
+            })
+        return results
+    
+    def get(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            found = {}
+            for doc_id in ids:
+                row = self._row_of.get(doc_id)
+                if row is not None:
+                    found[doc_id] = {"document": self._documents[row], "metadata": self._metadatas[row]}
+            return found
+    
+    def count(self) -> int:
+        return self._size - self._dead
@@ -0,0 +1,116 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Optional, AsyncIterator
+from app.core.config import settings
+
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+async def spool_upload(file, suffix: str = "", directory: Optional[str] = None) -> str:
+    """Copy an upload to a named temp file in 1 MB reads; the caller deletes it"""
+    fd, path = tempfile.mkstemp(prefix="upload_", suffix=suffix, dir=directory or settings.UPLOAD_SPOOL_DIRECTORY or None)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                data = await file.read(SPOOL_CHUNK_BYTES)
+                if not data:
+                    break
+                out.write(data)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+# Reader kept open per worker process: opening a PDF parses its whole page
+# tree, which costs far more than extracting a few pages. It is replaced
+# when the worker gets the next document (a deleted spool file's space is
+# released then).
+_open_reader = None
+
+def _reader(path: str):
+    global _open_reader
+    import PyPDF2
+    key = (path, os.stat(path).st_mtime_ns)
+    if _open_reader is None or _open_reader[0] != key:
+        if _open_reader is not None:
+            _open_reader[1].close()
+        f = open(path, "rb")
+        _open_reader = (key, f, PyPDF2.PdfReader(f))
+    return _open_reader[2]
+
+def extract_pages(path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """Text of pages [start, stop) as (1-based page number, text).
+
+    Runs in a worker process: only the path and the extracted text cross
+    the process boundary.
+    """
+    reader = _reader(path)
+    pages = []
+    for index in range(start, min(stop, len(reader.pages))):
+        try:
+            text = reader.pages[index].extract_text() or ""
+        except Exception as e:
+            # One malformed page shouldn't lose the rest of the document
+            print(f"PDF page {index + 1} extraction failed: {e}")
+            text = ""
+        pages.append((index + 1, text))
+    return pages
+
+def count_pages(path: str) -> int:
+    """Page count, read in a worker so that worker's reader is warm for the first pages"""
+    return len(_reader(path).pages)
+
+async def iter_pdf_pages(
+    path: str,
+    executor: Optional[ProcessPoolExecutor] = None,
+    pages_per_task: Optional[int] = None
+) -> AsyncIterator[Tuple[int, str]]:
+    """Yield (page number, text) in page order, extracting ranges of pages in
+    parallel. At most two tasks per worker are in flight, so extracted text
+    waiting to be consumed stays bounded whatever the page count."""
+    loop = asyncio.get_running_loop()
+    pages_per_task = pages_per_task or settings.PDF_PAGES_PER_TASK
+    executor = executor or get_pdf_executor()
+    total = await loop.run_in_executor(executor, count_pages, path)
+    ranges = [(start, start + pages_per_task) for start in range(0, total, pages_per_task)]
+    max_in_flight = max(settings.PDF_EXTRACT_WORKERS, 1) * 2
+    in_flight: List[asyncio.Future] = []
+    next_range = 0
+    try:
+        while next_range < len(ranges) or in_flight:
+            while next_range < len(ranges) and len(in_flight) < max_in_flight:
+                start, stop = ranges[next_range]
+                in_flight.append(loop.run_in_executor(executor, extract_pages, path, start, stop))
+                next_range += 1
+            for page in await in_flight.pop(0):
+                yield page
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+# Process pool shared by all uploads, created on first use
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+_pdf_executor_lock = threading.Lock()
+
+def get_pdf_executor() -> ProcessPoolExecutor:
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            # spawn: forking a process that runs an event loop and driver threads is unsafe
+            _pdf_executor = ProcessPoolExecutor(
+                max_workers=max(settings.PDF_EXTRACT_WORKERS, 1),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pdf_executor
+
+def shutdown_pdf_executor() -> None:
+    """Stop the extraction workers (called at shutdown)"""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        executor, _pdf_executor = _pdf_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
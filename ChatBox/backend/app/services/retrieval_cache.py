@@ -0,0 +1,213 @@
+import hashlib
+import json
+import re
+import time
+import unicodedata
+from typing import List, Dict, Any, Optional, Tuple
+from app.core.config import settings
+from app.core.cache import LRUCache
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_query(query: str) -> str:
+    """Cache key form of a query: Unicode NFC, case-folded, whitespace collapsed"""
+    return WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", query)).strip().casefold()
+
+def _copy(ranking: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
+    # Callers own what they get back; the cached lists stay untouched
+    return {"ids": list(ranking["ids"]), "scores": list(ranking["scores"])}
+
+
+class RetrievalCache:
+    """Search rankings keyed by (normalized query, top_k, corpus version).
+
+    Only the ranking is cached, the chunk ids and their scores (a few
+    hundred bytes); callers fill in chunk texts, metadata and the query
+    embedding from the vector store and the embedding cache.
+
+    Two tiers: an in-process LRU, then Redis shared by every worker and
+    process. The corpus version is a Redis counter bumped by each
+    ingestion or deletion and is part of every key, so results computed
+    against an older corpus are never read again and expire on their own;
+    nothing is scanned or deleted. The version is read from Redis at most
+    every `version_ttl_seconds`, so a bump made by another process is
+    seen within that interval (a bump made here is seen at once).
+
+    When Redis is unreachable the cache keeps working in memory under a
+    local version and retries Redis every `retry_seconds`; a bump made in
+    the meantime is applied to Redis once it is back. `client` is any
+    redis.asyncio compatible client (get, mget, set, incr, pipeline);
+    None keeps the cache in memory only.
+    """
+
+    prefix = "retrieval:"
+    version_key = "retrieval:version"
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: int,
+        client=None,
+        retry_seconds: float = 30.0,
+        version_ttl_seconds: float = 1.0
+    ):
+        self.memory = LRUCache(max_bytes, sizeof=lambda entry: entry[1])
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        self.version_ttl_seconds = version_ttl_seconds
+        self.redis_hits = 0
+        self.misses = 0
+        self.redis_errors = 0
+        self._local_version = 0
+        self._pending_bump = False
+        self._redis_down_until = 0.0
+        # Last version read from Redis, and until when it may be reused
+        self._version: Optional[str] = None
+        self._version_expires = 0.0
+
+    def _redis(self):
+        """The Redis client, unless there is none or it failed recently"""
+        if self.client is None or time.monotonic() < self._redis_down_until:
+            return None
+        return self.client
+
+    def _redis_failed(self, e: Exception) -> None:
+        self.redis_errors += 1
+        self._redis_down_until = time.monotonic() + self.retry_seconds
+        self._version = None
+        print(f"Retrieval cache falling back to memory: {e}")
+
+    async def version(self) -> str:
+        """Current corpus version; read it before searching and store results under it"""
+        client = self._redis()
+        if client is not None:
+            if self._version is not None and time.monotonic() < self._version_expires:
+                return self._version
+            try:
+                if self._pending_bump:
+                    await client.incr(self.version_key)
+                    self._pending_bump = False
+                self._remember_version(int(await client.get(self.version_key) or 0))
+                return self._version
+            except Exception as e:
+                self._redis_failed(e)
+        return f"l{self._local_version}"
+
+    def _remember_version(self, counter: int) -> None:
+        self._version = f"r{counter}"
+        self._version_expires = time.monotonic() + self.version_ttl_seconds
+
+    def make_key(self, version: str, query: str, top_k: int) -> str:
+        digest = hashlib.sha1(normalize_query(query).encode()).hexdigest()
+        return f"{self.prefix}{version}:{top_k}:{digest}"
+
+    async def get_many(self, version: str, queries: List[str], top_k: int) -> List[Optional[Dict[str, List[Any]]]]:
+        """Look up rankings ({"ids", "scores"}); None marks a miss in both tiers"""
+        keys = [self.make_key(version, query, top_k) for query in queries]
+        results: List[Optional[Dict[str, List[Any]]]] = [None] * len(keys)
+        pending: Dict[str, List[int]] = {}
+
+        for i, key in enumerate(keys):
+            entry = self.memory.get(key)
+            if entry is not None:
+                results[i] = _copy(entry[0])
+            else:
+                pending.setdefault(key, []).append(i)
+
+        client = self._redis() if version.startswith("r") else None
+        if pending and client is not None:
+            try:
+                values = await client.mget(list(pending))
+            except Exception as e:
+                self._redis_failed(e)
+                values = []
+            for key, value in zip(list(pending), values):
+                if value is None:
+                    continue
+                ranking = json.loads(value)
+                self.memory.set(key, (ranking, len(value)))
+                for i in pending.pop(key):
+                    results[i] = _copy(ranking)
+                self.redis_hits += 1
+
+        self.misses += sum(len(indices) for indices in pending.values())
+        return results
+
+    async def set_many(self, version: str, queries: List[str], top_k: int, results: List[Dict[str, List[Any]]]) -> None:
+        """Store the rankings of results computed against corpus `version`"""
+        items: Dict[str, bytes] = {}
+        for query, result in zip(queries, results):
+            key = self.make_key(version, query, top_k)
+            # float(): vector stores may return numpy scores
+            ranking = {"ids": list(result["ids"]), "scores": [float(score) for score in result["scores"]]}
+            payload = json.dumps(ranking).encode()
+            self.memory.set(key, (ranking, len(payload)))
+            items[key] = payload
+
+        client = self._redis() if version.startswith("r") else None
+        if items and client is not None:
+            try:
+                pipe = client.pipeline(transaction=False)
+                for key, payload in items.items():
+                    pipe.set(key, payload, ex=self.ttl_seconds)
+                await pipe.execute()
+            except Exception as e:
+                self._redis_failed(e)
+
+    async def bump(self) -> Tuple[str, str]:
+        """Start a new corpus version (after chunks were added or deleted);
+        returns the versions just before and after this bump"""
+        self._local_version += 1
+        local = (f"l{self._local_version - 1}", f"l{self._local_version}")
+        # Entries of older versions can't be hit any more
+        self.memory.clear()
+        self._version = None
+        if self.client is None:
+            return local
+        client = self._redis()
+        if client is None:
+            self._pending_bump = True
+            return local
+        try:
+            counter = await client.incr(self.version_key)
+        except Exception as e:
+            self._pending_bump = True
+            self._redis_failed(e)
+            return local
+        self._remember_version(counter)
+        return f"r{counter - 1}", self._version
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory": self.memory.stats(),
+            "redis": self.client is not None and self._redis() is not None,
+            "redis_hits": self.redis_hits,
+            "redis_errors": self.redis_errors,
+            "misses": self.misses
+        }
+
+
+def create_retrieval_cache() -> Optional[RetrievalCache]:
+    """Build the retrieval cache configured in settings"""
+    backend = settings.RETRIEVAL_CACHE_BACKEND
+    if backend == "none":
+        return None
+    if backend == "redis":
+        try:
+            from app.core.redis_client import get_async_redis
+            client = get_async_redis()
+        except Exception as e:
+            print(f"Retrieval cache in memory only: {e}")
+            client = None
+    elif backend == "memory":
+        client = None
+    else:
+        raise ValueError(f"Unknown RETRIEVAL_CACHE_BACKEND: {backend}")
+    return RetrievalCache(
+        settings.RETRIEVAL_CACHE_MAX_BYTES,
+        settings.RETRIEVAL_CACHE_TTL_SECONDS,
+        client=client,
+        retry_seconds=settings.RETRIEVAL_CACHE_RETRY_SECONDS,
+        version_ttl_seconds=settings.RETRIEVAL_CACHE_VERSION_TTL_SECONDS
+    )
@@ -1,45 +1,202 @@
-import chromadb
-from typing import List, Dict, Any
+import asyncio
+import threading
+from typing import List, Dict, Any, Optional
 from app.core.config import settings
-import openai
-import hashlib
+from app.services.embedding_cache import EmbeddingCache, create_embedding_cache, content_hash
+from app.services.embedding_provider import EmbeddingProvider, create_embedding_provider
+from app.services.retrieval_cache import RetrievalCache, create_retrieval_cache
+from app.services.vector_store import VectorStore, create_vector_store
+from app.services.lexical_index import LexicalIndex, get_lexical_index, reciprocal_rank_fusion, refresh_lexical_index
 
 class VectorService:
-    def __init__(self):
-        self.client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIRECTORY)
-        self.collection = self._get_or_create_collection()
-        openai.api_key = settings.OPENAI_API_KEY
+    def __init__(self, store: Optional[VectorStore] = None):
+        self.store: VectorStore = store or create_vector_store()
+        self.lexical_index: Optional[LexicalIndex] = get_lexical_index()
+        self.ready = False
+        self.error: Optional[str] = None
+        self.embedding_dimension: Optional[int] = None
+        self._lock = threading.RLock()
+        self.embedding_provider: EmbeddingProvider = create_embedding_provider()
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        try:
+            self.embedding_cache = create_embedding_cache()
+        except Exception as e:
+            print(f"Embedding cache disabled: {e}")
+        self.retrieval_cache: Optional[RetrievalCache] = None
+        try:
+            self.retrieval_cache = create_retrieval_cache()
+        except Exception as e:
+            print(f"Retrieval cache disabled: {e}")
+        self._lexical_refresh: Optional[asyncio.Task] = None
+        
+    def warmup(self) -> None:
+        """Open the vector store and embedding provider once per process"""
+        with self._lock:
+            if self.ready:
+                return
+            try:
+                self.embedding_provider.warmup()
+                create_metadata = {"embedding_model": self.embedding_provider.model_name}
+                if self.embedding_provider.dimension:
+                    create_metadata["embedding_dimension"] = self.embedding_provider.dimension
+                metadata = self.store.open(create_metadata)
+                self._check_embedding_compatibility(metadata)
+            except Exception as e:
+                self.error = str(e)
+                raise
+            self.error = None
+            self.ready = True
+    
+    def close(self) -> None:
+        """Release the vector store, provider and embedding cache"""
+        with self._lock:
+            self.ready = False
+            self.store.close()
+            self.embedding_provider.close()
+            if self.embedding_cache is not None:
+                self.embedding_cache.close()
+                self.embedding_cache = None
+    
+    def _check_embedding_compatibility(self, metadata: Dict[str, Any]) -> None:
+        """Refuse to mix vectors from different embedding models in one collection"""
+        if "embedding_model" in metadata:
+            stored_model = metadata["embedding_model"]
+            stored_dimension = metadata.get("embedding_dimension")
+        else:
+            # Collections created before the model was recorded were built with OpenAI ada-002
+            stored_model, stored_dimension = "text-embedding-ada-002", 1536
+        provider = self.embedding_provider
+        
+        if stored_model != provider.model_name:
+            raise ValueError(
+                f"Collection 'documents' was built with embedding model '{stored_model}' "
+                f"but the configured provider uses '{provider.model_name}'. "
+                f"Re-ingest the documents into a fresh vector store to switch models."
+            )
+        if stored_dimension and provider.dimension and stored_dimension != provider.dimension:
+            raise ValueError(
+                f"Collection 'documents' stores {stored_dimension}-dim embeddings "
+                f"but the configured provider produces {provider.dimension}-dim embeddings."
+            )
+        self.embedding_dimension = stored_dimension or provider.dimension
+    
+    def _get_store(self) -> VectorStore:
+        """Return the open store, warming up lazily if needed"""
+        if not self.ready:
+            self.warmup()
+        return self.store
+    
+    async def search(self, query: str, top_k: int = 3) -> Dict[str, Any]:
+        """Search for relevant chunks, returning ids, contents, metadata and scores
+        together with the query embedding"""
+        return (await self.search_many([query], top_k))[0]
+    
+    async def search_many(self, queries: List[str], top_k: int = 3) -> List[Dict[str, Any]]:
+        """Search several queries at once: one embedding batch and one store query.
+        
+        With hybrid search on, each query's vector and BM25 candidates are
+        fused with reciprocal rank fusion; "scores" are then RRF scores.
+        Rankings come from the retrieval cache when the same query was
+        searched since the corpus last changed; only the misses are searched.
+        When the corpus changed in another process the BM25 index is caught
+        up in the background, and results until then are not cached.
+        """
+        cache = self.retrieval_cache
+        if cache is None:
+            return await self._search_many(queries, top_k)
         
-    def _get_or_create_collection(self):
-        """Get existing collection or create new one"""
+        # Read the version first: results are stored under the corpus they were computed on
+        version = await cache.version()
+        current = self._lexical_index_current(version)
+        results = await cache.get_many(version, queries, top_k)
+        hits = [i for i, result in enumerate(results) if result is not None]
+        if hits:
+            await self._hydrate([queries[i] for i in hits], [results[i] for i in hits])
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            found = await self._search_many([queries[i] for i in missing], top_k)
+            if current:
+                await cache.set_many(version, [queries[i] for i in missing], top_k, found)
+            for i, result in zip(missing, found):
+                results[i] = result
+        for result in results:
+            # Lets the answer cache key its entries by corpus version too
+            result["corpus_version"] = version
+        return results
+    
+    def _lexical_index_current(self, version: str) -> bool:
+        """Whether the BM25 index reflects corpus `version`; if not, start
+        catching it up (once at a time)"""
+        index = self.lexical_index
+        if index is None or index.version == version:
+            return True
+        if self._lexical_refresh is None or self._lexical_refresh.done():
+            self._lexical_refresh = asyncio.create_task(self._refresh_lexical_index(index, version))
+        return False
+    
+    @staticmethod
+    async def _refresh_lexical_index(index: LexicalIndex, version: str) -> None:
         try:
-            collection = self.client.get_collection("documents")
-        except:
-            collection = self.client.create_collection(
-                name="documents",
-                metadata={"hnsw:space": "cosine"}
+            await refresh_lexical_index(index, version)
+        except Exception as e:
+            # Stays stale; the next search retries
+            print(f"Lexical index refresh failed: {e}")
+    
+    async def _hydrate(self, queries: List[str], rankings: List[Dict[str, List[Any]]]) -> None:
+        """Complete cached rankings in place with chunk texts and metadata from
+        the store and query embeddings from the embedding cache"""
+        found = self._get_store().get(list({doc_id for ranking in rankings for doc_id in ranking["ids"]}))
+        query_embeddings = await self._get_embeddings(queries, max_retries=0)
+        for ranking, query_embedding in zip(rankings, query_embeddings):
+            # A chunk deleted since is dropped (its deletion bumps the version anyway)
+            kept = [(doc_id, score) for doc_id, score in zip(ranking["ids"], ranking["scores"]) if doc_id in found]
+            ranking["ids"] = [doc_id for doc_id, _ in kept]
+            ranking["documents"] = [found[doc_id]["document"] for doc_id, _ in kept]
+            ranking["metadatas"] = [found[doc_id]["metadata"] for doc_id, _ in kept]
+            ranking["scores"] = [score for _, score in kept]
+            ranking["query_embedding"] = query_embedding
+    
+    async def _search_many(self, queries: List[str], top_k: int) -> List[Dict[str, Any]]:
+        # Queries are latency-sensitive: don't sit in the retry backoff
+        query_embeddings = await self._get_embeddings(queries, max_retries=0)
+        hybrid = self.lexical_index is not None and len(self.lexical_index) > 0
+        depth = max(top_k, settings.HYBRID_CANDIDATES) if hybrid else top_k
+        results = self._get_store().query(query_embeddings, depth)
+        
+        for query, query_embedding, result in zip(queries, query_embeddings, results):
+            if hybrid:
+                result.update(self._fuse(query, result, depth, top_k))
+            result["query_embedding"] = query_embedding
+        return results
+    
+    def _fuse(self, query: str, vector_result: Dict[str, Any], depth: int, top_k: int) -> Dict[str, List[Any]]:
+        """Merge vector and lexical rankings with reciprocal rank fusion"""
+        lexical_ids = [key for key, _ in self.lexical_index.search(query, depth)]
+        fused = reciprocal_rank_fusion([vector_result["ids"], lexical_ids], settings.RRF_K)[:top_k]
+        
+        known = {
+            doc_id: {"document": document, "metadata": metadata}
+            for doc_id, document, metadata in zip(
+                vector_result["ids"], vector_result["documents"], vector_result["metadatas"]
             )
-        return collection
+        }
+        # Lexical-only hits still need their text and metadata
+        missing = [doc_id for doc_id, _ in fused if doc_id not in known]
+        if missing:
+            known.update(self.store.get(missing))
+        
+        fused = [(doc_id, score) for doc_id, score in fused if doc_id in known]
+        return {
+            "ids": [doc_id for doc_id, _ in fused],
+            "documents": [known[doc_id]["document"] for doc_id, _ in fused],
+            "metadatas": [known[doc_id]["metadata"] for doc_id, _ in fused],
+            "scores": [score for _, score in fused]
+        }
     
     async def search_documents(self, query: str, top_k: int = 3) -> List[str]:
         """Search for relevant documents using vector similarity"""
         try:
-            # Generate query embedding
-            query_embedding = await self._get_embedding(query)
-            
-            # Search in vector store
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k,
-                include=["documents", "metadatas"]
-            )
-            
-            # Extract document content
-            documents = results.get("documents", [[]])
-            if documents and documents[0]:
-                return documents[0]
-            return []
-            
+            return (await self.search(query, top_k))["documents"]
         except Exception as e:
             print(f"Vector search error: {e}")
             return []
@@ -47,19 +204,14 @@ class VectorService:
     async def add_document(self, content: str, metadata: Dict[str, Any]) -> str:
         """Add a document to the vector store"""
         try:
-            # Generate document embedding
-            embedding = await self._get_embedding(content)
+            # Generate unique ID (also the embedding cache key)
+            doc_id = content_hash(content)
             
-            # Generate unique ID
-            doc_id = hashlib.md5(content.encode()).hexdigest()
+            # Generate document embedding
+            embedding = (await self._get_embeddings([content]))[0]
             
-            # Add to collection
-            self.collection.add(
-                embeddings=[embedding],
-                documents=[content],
-                metadatas=[metadata],
-                ids=[doc_id]
-            )
+            # Add to vector store
+            self._get_store().add([doc_id], [embedding], [content], [metadata])
             
             return doc_id
             
@@ -67,23 +219,133 @@ class VectorService:
             print(f"Error adding document: {e}")
             raise
     
-    async def _get_embedding(self, text: str) -> List[float]:
-        """Get OpenAI embedding for text"""
+    async def add_documents(
+        self,
+        contents: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: Optional[List[str]] = None,
+        embeddings: Optional[List[List[float]]] = None
+    ) -> List[str]:
+        """Add many documents to the vector store with batched embeddings and one insert.
+        
+        Pass `embeddings` from `embed_documents` to embed ahead of time.
+        """
+        if not contents:
+            return []
+        
+        text_hashes = [content_hash(content) for content in contents]
+        doc_ids = ids or text_hashes
+        if embeddings is None:
+            embeddings = await self._get_embeddings(contents, text_hashes)
+        
         try:
-            response = openai.Embedding.create(
-                model=settings.OPENAI_EMBEDDING_MODEL,
-                input=text
-            )
-            return response['data'][0]['embedding']
+            self._get_store().add(doc_ids, embeddings, contents, metadatas)
+        except Exception as e:
+            print(f"Error adding documents: {e}")
+            raise
+        
+        return doc_ids
+    
+    async def embed_documents(self, contents: List[str]) -> List[List[float]]:
+        """Embeddings for documents about to be added (cached, batched)"""
+        if not contents:
+            return []
+        return await self._get_embeddings(contents)
+    
+    def delete_documents(self, doc_ids: List[str]) -> bool:
+        """Delete many documents from the vector store in one call"""
+        if not doc_ids:
+            return True
+        try:
+            self._get_store().delete(doc_ids)
+            return True
         except Exception as e:
-            print(f"Embedding error: {e}")
-            # Return zero vector as fallback
-            return [0.0] * 1536  # OpenAI ada-002 dimension
+            print(f"Error deleting documents: {e}")
+            return False
+    
+    def delete_where(self, where: Dict[str, Any]) -> None:
+        """Delete every chunk whose metadata matches `where` in one call.
+        
+        Unlike delete_documents this raises on failure, so a caller running
+        a multi-step deletion can stop and retry it later.
+        """
+        self._get_store().delete_where(where)
+    
+    async def _get_embeddings(
+        self,
+        texts: List[str],
+        text_hashes: Optional[List[str]] = None,
+        max_retries: Optional[int] = None
+    ) -> List[List[float]]:
+        """Get embeddings for many texts, serving repeats from the cache and
+        calling the API once per batch of misses"""
+        model = self.embedding_provider.model_name
+        if text_hashes is None:
+            text_hashes = [content_hash(text) for text in texts]
+        
+        if self.embedding_cache is not None:
+            embeddings = await self.embedding_cache.get_many(model, text_hashes)
+        else:
+            embeddings = [None] * len(texts)
+        
+        # Embed each distinct missing text once
+        missing: Dict[str, List[int]] = {}
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                missing.setdefault(text_hashes[i], []).append(i)
+        if not missing:
+            return embeddings
+        
+        missing_hashes = list(missing)
+        missing_texts = [texts[missing[h][0]] for h in missing_hashes]
+        batch_size = max(1, settings.EMBEDDING_BATCH_SIZE)
+        for start in range(0, len(missing_texts), batch_size):
+            batch_hashes = missing_hashes[start:start + batch_size]
+            batch_embeddings = await self._embed_batch_with_retry(
+                missing_texts[start:start + batch_size], max_retries
+            )
+            self._check_dimension(batch_embeddings)
+            if self.embedding_cache is not None:
+                await self.embedding_cache.set_many(model, batch_hashes, batch_embeddings)
+            for text_hash, embedding in zip(batch_hashes, batch_embeddings):
+                for i in missing[text_hash]:
+                    embeddings[i] = embedding
+        
+        return embeddings
+    
+    async def _embed_batch_with_retry(
+        self,
+        batch: List[str],
+        max_retries: Optional[int] = None
+    ) -> List[List[float]]:
+        """Embed one batch, retrying only this batch with exponential backoff"""
+        if max_retries is None:
+            max_retries = settings.EMBEDDING_MAX_RETRIES
+        attempt = 0
+        while True:
+            try:
+                return await self.embedding_provider.embed(batch)
+            except Exception as e:
+                attempt += 1
+                if attempt > max_retries:
+                    raise Exception(f"Embedding batch failed after {attempt} attempts: {str(e)}")
+                delay = settings.EMBEDDING_RETRY_BASE_DELAY * (2 ** (attempt - 1))
+                print(f"Embedding batch error (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+    
+    def _check_dimension(self, embeddings: List[List[float]]) -> None:
+        """Never let a vector of the wrong size reach the index"""
+        expected = self.embedding_dimension or self.embedding_provider.dimension
+        for embedding in embeddings:
+            if expected and len(embedding) != expected:
+                raise ValueError(
+                    f"Embedding has {len(embedding)} dimensions, expected {expected}"
+                )
     
     def delete_document(self, doc_id: str) -> bool:
         """Delete a document from vector store"""
         try:
-            self.collection.delete(ids=[doc_id])
+            self._get_store().delete([doc_id])
             return True
         except Exception as e:
             print(f"Error deleting document: {e}")
@@ -92,10 +354,58 @@ class VectorService:
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the vector collection"""
         try:
-            count = self.collection.count()
+            count = self._get_store().count()
             return {
                 "total_documents": count,
-                "collection_name": "documents"
+                "collection_name": "documents",
+                "backend": self.store.name,
+                "embedding_model": self.embedding_provider.model_name,
+                "embedding_dimension": self.embedding_dimension,
+                "embedding_cache": self.embedding_cache.stats() if self.embedding_cache else None,
+                "retrieval_cache": self.retrieval_cache.stats() if self.retrieval_cache else None
             }
         except Exception as e:
             return {"error": str(e)}
+    
+    def health(self) -> Dict[str, Any]:
+        """Report readiness of the vector store"""
+        if not self.ready:
+            return {"status": "not_ready", "error": self.error}
+        stats = self.get_collection_stats()
+        if "error" in stats:
+            return {"status": "error", "error": stats["error"]}
+        return {"status": "ready", **stats}
+
+
+# Process-wide instance shared by all requests
+_vector_service: Optional[VectorService] = None
+_vector_service_lock = threading.Lock()
+
+def init_vector_service() -> VectorService:
+    """Create and warm up the shared vector service (called at startup)"""
+    global _vector_service
+    with _vector_service_lock:
+        if _vector_service is None:
+            _vector_service = VectorService()
+        service = _vector_service
+    service.warmup()
+    return service
+
+def shutdown_vector_service() -> None:
+    """Close the shared vector service (called at shutdown)"""
+    global _vector_service
+    with _vector_service_lock:
+        service = _vector_service
+        _vector_service = None
+    if service is not None:
+        service.close()
+
+def current_vector_service() -> Optional[VectorService]:
+    """The shared vector service if startup created it, without creating one"""
+    return _vector_service
+
+# Dependency to get the shared vector service
+def get_vector_service() -> VectorService:
+    if _vector_service is None:
+        return init_vector_service()
+    return _vector_service
@@ -0,0 +1,136 @@
+from typing import List, Dict, Any, Optional
+import chromadb
+from app.core.config import settings
+
+class VectorStore:
+    """Storage backend behind VectorService.
+    
+    Stores hold embeddings with their chunk text and metadata, keyed by
+    string ids, and answer cosine-similarity queries.
+    """
+    
+    name: str = ""
+    
+    def open(self, create_metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Open (or create with create_metadata) the store and return its metadata"""
+        raise NotImplementedError
+    
+    def close(self) -> None:
+        """Flush and release the store"""
+    
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        raise NotImplementedError
+    
+    def query(self, query_embeddings: List[List[float]], top_k: int) -> List[Dict[str, List[Any]]]:
+        """Return, per query, the ids, documents, metadatas and cosine scores of the top_k chunks"""
+        raise NotImplementedError
+    
+    def get(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Return {id: {"document", "metadata"}} for the ids that exist"""
+        raise NotImplementedError
+    
+    def delete(self, ids: List[str]) -> None:
+        raise NotImplementedError
+    
+    def delete_where(self, where: Dict[str, Any]) -> None:
+        """Delete every chunk whose metadata has all the given key/value pairs"""
+        raise NotImplementedError
+    
+    def count(self) -> int:
+        raise NotImplementedError
+
+
+class ChromaVectorStore(VectorStore):
+    """Chroma PersistentClient collection"""
+    
+    name = "chroma"
+    collection_name = "documents"
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.CHROMA_PERSIST_DIRECTORY
+        self.client = None
+        self.collection = None
+    
+    def open(self, create_metadata: Dict[str, Any]) -> Dict[str, Any]:
+        self.client = chromadb.PersistentClient(path=self.path)
+        try:
+            self.collection = self.client.get_collection(self.collection_name)
+        except:
+            self.collection = self.client.create_collection(
+                name=self.collection_name,
+                metadata={"hnsw:space": "cosine", **create_metadata}
+            )
+        # Touch the collection so the on-disk index is loaded before the first request
+        self.collection.count()
+        return self.collection.metadata or {}
+    
+    def close(self) -> None:
+        self.collection = None
+        if self.client is not None:
+            # PersistentClient has no close(); stop its system so the
+            # sqlite and HNSW files are released
+            try:
+                self.client._system.stop()
+            except Exception as e:
+                print(f"Error closing vector store: {e}")
+            self.client = None
+    
+    def add(self, ids, embeddings, documents, metadatas) -> None:
+        self.collection.add(
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids
+        )
+    
+    def query(self, query_embeddings: List[List[float]], top_k: int) -> List[Dict[str, List[Any]]]:
+        results = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=top_k,
+            include=["documents", "metadatas", "distances"]
+        )
+        return [
+            {
+                "ids": results["ids"][i],
+                "documents": results["documents"][i],
+                "metadatas": results["metadatas"][i],
+                # Cosine space: distance = 1 - similarity
+                "scores": [1.0 - distance for distance in results["distances"][i]]
+            }
+            for i in range(len(query_embeddings))
+        ]
+    
+    def get(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        results = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        return {
+            doc_id: {"document": document, "metadata": metadata}
+            for doc_id, document, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+        }
+    
+    def delete(self, ids: List[str]) -> None:
+        self.collection.delete(ids=ids)
+    
+    def delete_where(self, where: Dict[str, Any]) -> None:
+        if len(where) > 1:
+            where = {"$and": [{key: value} for key, value in where.items()]}
+        self.collection.delete(where=where)
+    
+    def count(self) -> int:
+        return self.collection.count()
+
+
+def create_vector_store() -> VectorStore:
+    """Build the vector store selected by settings.VECTOR_STORE_BACKEND"""
+    backend = settings.VECTOR_STORE_BACKEND
+    if backend == "chroma":
+        return ChromaVectorStore()
+    if backend == "numpy":
+        from app.services.numpy_vector_store import NumpyVectorStore
+        return NumpyVectorStore()
+    raise ValueError(f"Unknown VECTOR_STORE_BACKEND: {backend}")
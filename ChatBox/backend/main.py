@@ -3,12 +3,20 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
 from app.core.config import settings
-from app.api.routes import chat, documents, conversations, health
-from app.core.database import engine
-from app.models import base
+from app.api import chat, documents, conversations, health
+from app.core.database import AsyncSessionLocal, close_db, run_migrations
+from app.services.vector_service import init_vector_service, shutdown_vector_service, current_vector_service
+from app.services.lexical_index import init_lexical_index
+from app.services.document_service import DocumentService
+from app.services.message_writer import init_message_writer, shutdown_message_writer
+from app.services.ingestion_queue import init_ingestion_queue, shutdown_ingestion_queue
+from app.services.pdf_extractor import shutdown_pdf_executor
+from app.core.openai_client import close_openai_client
 
-# Create database tables
-base.Base.metadata.create_all(bind=engine)
+# Bring the database schema up to date (migrations live in alembic/versions).
+# With several workers, set AUTO_MIGRATE=false and run `alembic upgrade head` once on deploy.
+if settings.AUTO_MIGRATE:
+    run_migrations()
 
 app = FastAPI(
     title="Intelligent Chatbot API",
@@ -25,6 +33,60 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup():
+    # Open the vector store once and keep it warm for all requests
+    try:
+        init_vector_service()
+    except Exception as e:
+        # Keep serving; /api/health reports the vector store as not ready
+        print(f"Vector store warmup failed: {e}")
+    
+    # Finish document deletions cut short by the last shutdown, before the
+    # BM25 index is built from the remaining chunks
+    try:
+        async with AsyncSessionLocal() as db:
+            await DocumentService(db).reconcile_deletions()
+    except Exception as e:
+        print(f"Deletion reconciliation failed: {e}")
+    
+    # Build the BM25 index over stored chunks for hybrid retrieval, as of the
+    # corpus version read first (later changes from other processes are
+    # caught up on search)
+    try:
+        service = current_vector_service()
+        cache = service.retrieval_cache if service is not None else None
+        version = await cache.version() if cache is not None else None
+        async with AsyncSessionLocal() as db:
+            await init_lexical_index(db, version)
+    except Exception as e:
+        print(f"Lexical index build failed: {e}")
+    
+    # Replay journaled messages and start the write-behind writer (if enabled);
+    # without it chat turns are committed before responding
+    try:
+        await init_message_writer()
+    except Exception as e:
+        print(f"Message write-behind unavailable, committing turns directly: {e}")
+    
+    # Start the ingestion workers; jobs cut short by the last shutdown are requeued
+    try:
+        await init_ingestion_queue()
+    except Exception as e:
+        # Keep serving; uploads get 503 until the queue is available
+        print(f"Ingestion queue unavailable: {e}")
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Flush queued messages while the database is still open
+    await shutdown_message_writer()
+    # Stop ingestion before the services it writes to
+    await shutdown_ingestion_queue()
+    shutdown_vector_service()
+    shutdown_pdf_executor()
+    await close_openai_client()
+    await close_db()
+
 # Include routers
 app.include_router(health.router, prefix="/api", tags=["health"])
 app.include_router(chat.router, prefix="/api", tags=["chat"])
@@ -12,7 +12,7 @@ interface Message {
 interface ChatResponse {
   answer: string
   conversation_id: number
-  message_id: number
+  message_id: number | null
   sources: string[]
   tokens_used?: number
 }
@@ -70,7 +70,7 @@ const ChatInterface: React.FC = () => {
       })
 
       const botMessage: Message = {
-        id: response.message_id,
+        id: response.message_id ?? Date.now(),
         role: 'assistant',
         content: response.answer,
         timestamp: new Date().toISOString()
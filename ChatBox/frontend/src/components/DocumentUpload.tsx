@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react'
 import { Upload, FileText, Trash2, Eye } from 'lucide-react'
-import { uploadDocument, listDocuments, deleteDocument } from '../services/api'
+import { uploadDocument, getIngestJob, listDocuments, deleteDocument } from '../services/api'
 
 interface Document {
   id: number
@@ -8,10 +8,14 @@ interface Document {
   source: string
   document_type: string
   created_at: string
+  last_ingested_at: string
+  chunk_count: number
+  total_bytes: number
 }
 
 const DocumentUpload: React.FC = () => {
   const [documents, setDocuments] = useState<Document[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const [isUploading, setIsUploading] = useState(false)
   const [uploadProgress, setUploadProgress] = useState(0)
   const [selectedFile, setSelectedFile] = useState<File | null>(null)
@@ -22,8 +26,20 @@ const DocumentUpload: React.FC = () => {
 
   const loadDocuments = async () => {
     try {
-      const docs = await listDocuments()
-      setDocuments(docs)
+      const page = await listDocuments()
+      setDocuments(page.documents)
+      setNextCursor(page.next_cursor)
+    } catch (error) {
+      console.error('Failed to load documents:', error)
+    }
+  }
+
+  const loadMoreDocuments = async () => {
+    if (!nextCursor) return
+    try {
+      const page = await listDocuments(nextCursor)
+      setDocuments(docs => [...docs, ...page.documents])
+      setNextCursor(page.next_cursor)
     } catch (error) {
       console.error('Failed to load documents:', error)
     }
@@ -43,20 +59,19 @@ const DocumentUpload: React.FC = () => {
     setUploadProgress(0)
 
     try {
-      // Simulate upload progress
-      const progressInterval = setInterval(() => {
-        setUploadProgress(prev => {
-          if (prev >= 90) {
-            clearInterval(progressInterval)
-            return 90
-          }
-          return prev + 10
-        })
-      }, 200)
-
-      await uploadDocument(selectedFile)
+      // The upload is queued; follow the ingestion job until it finishes
+      let job = await uploadDocument(selectedFile)
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, 1000))
+        job = await getIngestJob(job.job_id)
+        if (job.chunks_total) {
+          setUploadProgress(Math.min(99, Math.round((job.chunks_done / job.chunks_total) * 100)))
+        }
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error)
+      }
       
-      clearInterval(progressInterval)
       setUploadProgress(100)
       
       // Reset form and reload documents
@@ -155,7 +170,7 @@ const DocumentUpload: React.FC = () => {
       <div className="bg-white rounded-lg shadow-sm border">
         <div className="px-6 py-4 border-b">
           <h2 className="text-lg font-medium text-gray-900">
-            Tài liệu đã upload ({documents.length})
+            Tài liệu đã upload ({documents.length}{nextCursor ? '+' : ''})
           </h2>
         </div>
 
@@ -173,7 +188,7 @@ const DocumentUpload: React.FC = () => {
                   <div>
                     <h3 className="text-sm font-medium text-gray-900">{doc.title}</h3>
                     <p className="text-sm text-gray-500">
-                      {doc.source} • {new Date(doc.created_at).toLocaleDateString('vi-VN')}
+                      {doc.chunk_count} chunk • {(doc.total_bytes / 1024).toFixed(1)} KB • {new Date(doc.last_ingested_at).toLocaleDateString('vi-VN')}
                     </p>
                   </div>
                 </div>
@@ -190,6 +205,16 @@ const DocumentUpload: React.FC = () => {
               </div>
             ))
           )}
+          {nextCursor && (
+            <div className="px-6 py-4 text-center">
+              <button
+                onClick={loadMoreDocuments}
+                className="text-sm text-blue-600 hover:text-blue-800"
+              >
+                Tải thêm
+              </button>
+            </div>
+          )}
         </div>
       </div>
     </div>
@@ -33,8 +33,13 @@ export const uploadDocument = async (file: File) => {
   return response.data
 }
 
-export const listDocuments = async () => {
-  const response = await api.get('/documents')
+export const getIngestJob = async (jobId: string) => {
+  const response = await api.get(`/documents/jobs/${jobId}`)
+  return response.data
+}
+
+export const listDocuments = async (cursor?: string) => {
+  const response = await api.get('/documents', { params: { cursor } })
   return response.data
 }
 
@@ -44,8 +49,8 @@ export const deleteDocument = async (documentId: number) => {
 }
 
 // Conversations API
-export const getUserConversations = async (userId: number) => {
-  const response = await api.get(`/conversations/${userId}`)
+export const getUserConversations = async (userId: number, cursor?: string) => {
+  const response = await api.get(`/conversations/${userId}`, { params: { cursor } })
   return response.data
 }
 
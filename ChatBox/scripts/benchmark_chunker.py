@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Script đo tốc độ MarkdownChunker trên văn bản nhiều MB.
+
+Dữ liệu là docs/sample_faq.md lặp lại (mỗi bản sao đổi tên mục để nội dung
+không trùng) cho tới kích thước cần đo, đưa vào chunker theo từng mẩu 64 KB
+như khi đọc file. Thời gian trên mỗi MB gần như không đổi khi kích thước
+tăng nghĩa là chunker chạy tuyến tính. Chunker cũ (tách câu bằng regex,
+nối chuỗi, kích thước theo ký tự) được chạy cùng để so sánh.
+
+    python scripts/benchmark_chunker.py --sizes-mb 1 4 16 --max-tokens 300 --overlap 40
+
+Khi tiktoken không tải được bảng mã (máy không có mạng), số token được
+ước lượng theo số ký tự, nên thời gian đo thấp hơn so với khi dùng tokenizer thật.
+"""
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, List
+
+import numpy as np
+
+# Add backend to path
+sys.path.append(str(Path(__file__).parent.parent / 'backend'))
+
+from app.core.config import settings
+from app.services.chunker import MarkdownChunker
+from app.services.context_assembler import count_tokens, get_encoding
+
+PIECE_BYTES = 64 * 1024
+SAMPLE = Path(__file__).parent.parent / 'docs' / 'sample_faq.md'
+
+def make_text(size_bytes: int) -> str:
+    sample = SAMPLE.read_text(encoding="utf-8")
+    copies = []
+    total = 0
+    i = 0
+    while total < size_bytes:
+        copy = re.sub(r"^(#{1,6}) (.*)$", rf"\1 \2 ({i})", sample, flags=re.MULTILINE)
+        copies.append(copy)
+        total += len(copy.encode("utf-8"))
+        i += 1
+    return "\n\n".join(copies)
+
+def pieces(text: str) -> Iterator[str]:
+    for start in range(0, len(text), PIECE_BYTES):
+        yield text[start:start + PIECE_BYTES]
+
+def legacy_chunks(text: str, chunk_size: int = 1000) -> List[str]:
+    """The sentence chunker this one replaced (regex split, `+=`, characters)"""
+    chunks = []
+    current_chunk = ""
+    for sentence in re.split(r'[.!?]+', text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(current_chunk) + len(sentence) < chunk_size:
+            current_chunk += sentence + ". "
+        else:
+            if current_chunk:
+                chunks.append(current_chunk.strip())
+            current_chunk = sentence + ". "
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+def run(text: str, max_tokens: int, overlap: int):
+    chunker = MarkdownChunker(max_tokens=max_tokens, overlap_tokens=overlap)
+    start = time.perf_counter()
+    sizes = []
+    with_headings = 0
+    for piece in pieces(text):
+        for chunk in chunker.feed(piece):
+            sizes.append(chunker.count(chunk.text))
+            with_headings += bool(chunk.heading_path)
+    for chunk in chunker.close():
+        sizes.append(chunker.count(chunk.text))
+        with_headings += bool(chunk.heading_path)
+    elapsed = time.perf_counter() - start
+    return elapsed, sizes, with_headings
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming Markdown chunker")
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--max-tokens", type=int, default=settings.CHUNK_MAX_TOKENS)
+    parser.add_argument("--overlap", type=int, default=settings.CHUNK_OVERLAP_TOKENS)
+    args = parser.parse_args()
+
+    tokenizer = "tiktoken" if get_encoding(settings.OPENAI_EMBEDDING_MODEL) is not None else "ước lượng theo ký tự"
+    print(f"Tokenizer: {tokenizer}; chunk tối đa {args.max_tokens} token, overlap {args.overlap}\n")
+    print(f"{'MB':>6}{'chunk':>9}{'s':>8}{'s/MB':>8}{'MB/s':>8}{'token p50':>11}{'token max':>11}"
+          f"{'có heading':>12}{'cũ s/MB':>9}{'cũ max tok':>11}")
+    for size_mb in args.sizes_mb:
+        text = make_text(int(size_mb * 1024 * 1024))
+        megabytes = len(text.encode("utf-8")) / (1024 * 1024)
+        elapsed, sizes, with_headings = run(text, args.max_tokens, args.overlap)
+
+        start = time.perf_counter()
+        legacy = legacy_chunks(text)
+        legacy_elapsed = time.perf_counter() - start
+        legacy_max = max(count_tokens(chunk, settings.OPENAI_EMBEDDING_MODEL) for chunk in legacy)
+
+        print(f"{megabytes:>6.1f}{len(sizes):>9,}{elapsed:>8.2f}{elapsed / megabytes:>8.3f}"
+              f"{megabytes / elapsed:>8.1f}{int(np.percentile(sizes, 50)):>11}{max(sizes):>11}"
+              f"{with_headings / len(sizes):>11.0%} {legacy_elapsed / megabytes:>8.3f}{legacy_max:>11}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Script đo tìm kiếm hội thoại: ILIKE '%q%' (cách cũ) so với full-text index
+(SQLite FTS5 hoặc Postgres tsvector/GIN) trên bảng tin nhắn tổng hợp.
+
+Tin nhắn được sinh từ một bộ từ vựng theo phân phối Zipf, chia cho nhiều
+người dùng; mỗi truy vấn là 1-2 từ của một người dùng ngẫu nhiên.
+
+    python scripts/benchmark_conversation_search.py --messages 1000000
+    python scripts/benchmark_conversation_search.py --database-url postgresql://user:pw@localhost/bench
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add backend to path
+sys.path.append(str(Path(__file__).parent.parent / 'backend'))
+
+from app.core.database import async_database_url
+from app.models import Base, User, Conversation, Message
+from app.models.message import MessageRole
+from app.services.conversation_service import ConversationService
+
+SYLLABLES = (
+    "giá cước gói internet cáp quang tháng năm hợp đồng lắp đặt miễn phí modem wifi tốc độ "
+    "khuyến mãi thanh toán hóa đơn chuyển khoản đổi trả bảo hành sửa chữa kỹ thuật viên hỗ trợ "
+    "tổng đài khách hàng tài khoản mật khẩu đăng nhập đăng ký hủy dịch vụ truyền hình kênh "
+    "điện thoại di động sim số data lưu lượng roaming quốc tế địa chỉ chi nhánh cửa hàng giờ "
+    "mở cửa ưu đãi sinh viên gia đình doanh nghiệp nâng cấp hạ cấp gia hạn trả trước trả sau"
+).split()
+
+def generate(session, messages: int, users: int, per_conversation: int, seed: int = 0) -> float:
+    rng = np.random.default_rng(seed)
+    conversations = max(messages // per_conversation, 1)
+    # Zipf-like word frequencies, as in real text
+    weights = 1.0 / np.arange(1, len(SYLLABLES) + 1)
+    weights /= weights.sum()
+    start = time.perf_counter()
+    now = datetime.utcnow()
+
+    session.execute(insert(User.__table__), [
+        {"id": u, "username": f"user{u}", "email": f"user{u}@example.com", "hashed_password": "x"}
+        for u in range(1, users + 1)
+    ])
+    session.execute(insert(Conversation.__table__), [
+        {
+            "id": c, "user_id": int(rng.integers(1, users + 1)), "title": f"Hội thoại {c}",
+            "message_count": per_conversation, "created_at": now, "last_message_at": now
+        }
+        for c in range(1, conversations + 1)
+    ])
+
+    batch = 20000
+    for offset in range(0, messages, batch):
+        size = min(batch, messages - offset)
+        lengths = rng.integers(6, 30, size)
+        words = rng.choice(len(SYLLABLES), size=int(lengths.sum()), p=weights)
+        rows, position = [], 0
+        for i, length in enumerate(lengths):
+            message_id = offset + i + 1
+            rows.append({
+                "id": message_id,
+                "conversation_id": (message_id - 1) // per_conversation % conversations + 1,
+                "role": (MessageRole.USER if i % 2 == 0 else MessageRole.ASSISTANT).name,
+                "content": " ".join(SYLLABLES[w] for w in words[position:position + length]),
+                "created_at": now - timedelta(seconds=messages - message_id)
+            })
+            position += length
+        session.execute(insert(Message.__table__), rows)
+        print(f"\r  {offset + size:,}/{messages:,} tin nhắn", end="", flush=True)
+    session.commit()
+    print()
+    return time.perf_counter() - start
+
+def legacy_search(session, user_id: int, query: str, limit: int = 10):
+    """The previous implementation: substring scan plus one query per conversation"""
+    messages = session.query(Message).join(Conversation).filter(
+        Conversation.user_id == user_id,
+        Message.content.ilike(f"%{query}%")
+    ).limit(limit).all()
+    return [
+        session.query(Conversation).filter(Conversation.id == conv_id).first()
+        for conv_id in {msg.conversation_id for msg in messages}
+    ]
+
+def percentile(values, p):
+    return float(np.percentile(values, p)) if values else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark conversation search")
+    parser.add_argument("--database-url", default=None, help="Mặc định: SQLite trong thư mục tạm")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--per-conversation", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    tmp = None
+    url = args.database_url
+    if url is None:
+        tmp = tempfile.mkdtemp(prefix="search_bench_")
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    print(f"Database: {engine.dialect.name}")
+
+    elapsed = generate(session, args.messages, args.users, args.per_conversation)
+    print(f"Sinh dữ liệu (kể cả cập nhật index): {elapsed:.1f}s")
+
+    rng = np.random.default_rng(1)
+    queries = [
+        (int(rng.integers(1, args.users + 1)),
+         " ".join(SYLLABLES[i] for i in rng.choice(len(SYLLABLES), size=int(rng.integers(1, 3)), replace=False)))
+        for _ in range(args.queries)
+    ]
+
+    # The service runs on the async driver, as in the app
+    async_engine = create_async_engine(async_database_url(url))
+    async_session = AsyncSession(async_engine)
+    service = ConversationService(async_session)
+    loop = asyncio.new_event_loop()
+    results = {}
+    for name, search in (
+        ("ilike (cũ)", lambda user_id, q: legacy_search(session, user_id, q)),
+        ("full-text", lambda user_id, q: loop.run_until_complete(service.search_conversations(user_id, q))),
+    ):
+        latencies, found = [], 0
+        for user_id, q in queries:
+            start = time.perf_counter()
+            found += len(search(user_id, q))
+            latencies.append((time.perf_counter() - start) * 1000)
+        results[name] = (latencies, found)
+
+    print(f"\n{'Phương pháp':<14}{'p50 (ms)':>10}{'p99 (ms)':>10}{'TB kết quả':>12}")
+    for name, (latencies, found) in results.items():
+        print(f"{name:<14}{percentile(latencies, 50):>10.1f}{percentile(latencies, 99):>10.1f}{found / len(queries):>12.1f}")
+
+    session.close()
+    engine.dispose()
+    loop.run_until_complete(async_session.close())
+    loop.run_until_complete(async_engine.dispose())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Script đo độ trễ tìm kiếm BM25 của LexicalIndex: p50/p99 cho câu hỏi gồm
+âm tiết phổ biến, âm tiết hiếm và một đoạn cắt từ chunk thật (giống câu
+hỏi của người dùng).
+
+Chunk là văn bản tổng hợp: âm tiết tiếng Việt ghép ngẫu nhiên, tần suất
+theo phân phối Zipf. Kết quả được đối chiếu với cách tính BM25 duyệt toàn
+bộ posting bằng Python (cách cũ): cùng id, cùng điểm (sai số float32).
+
+    python scripts/benchmark_lexical_index.py --chunks 100000 --queries 200
+"""
+
+import argparse
+import heapq
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add backend to path
+sys.path.append(str(Path(__file__).parent.parent / 'backend'))
+
+from app.services.lexical_index import LexicalIndex, tokenize
+
+ONSETS = ["", "b", "c", "ch", "d", "đ", "g", "gi", "h", "kh", "l", "m", "n", "ng", "nh", "ph", "qu", "s", "t", "th", "tr", "v", "x"]
+RHYMES = ["a", "ai", "an", "ang", "anh", "ao", "ắc", "ăn", "âm", "ây", "e", "em", "ên", "i", "iên", "inh", "o", "oa", "ói", "ông", "ơi", "u", "ục", "ung", "ư", "ước", "ương", "ữa"]
+
+def make_vocabulary(size: int, rng: np.random.Generator) -> list:
+    words = sorted({onset + rhyme for onset in ONSETS for rhyme in RHYMES})
+    vocabulary = list(rng.permutation(words))
+    # Numbered codes fill the long tail (gói cước, mã lỗi, ...)
+    while len(vocabulary) < size:
+        vocabulary.append(f"{vocabulary[len(vocabulary) % len(words)]}{len(vocabulary)}")
+    return vocabulary[:size]
+
+def make_chunks(count: int, words: int, vocabulary: list, rng: np.random.Generator) -> list:
+    ranks = (rng.zipf(1.1, size=(count, words)) - 1) % len(vocabulary)
+    return [" ".join(vocabulary[rank] for rank in row) for row in ranks]
+
+def make_queries(count: int, chunks: list, vocabulary: list, rng: np.random.Generator) -> dict:
+    common = [" ".join(vocabulary[i] for i in rng.integers(0, 20, 4)) for _ in range(count)]
+    rare = [" ".join(vocabulary[i] for i in rng.integers(len(vocabulary) // 2, len(vocabulary), 3)) for _ in range(count)]
+    mixed = []
+    for i in rng.integers(0, len(chunks), count):
+        words = chunks[i].split()
+        start = int(rng.integers(0, max(len(words) - 8, 1)))
+        mixed.append(" ".join(words[start:start + 8]))
+    return {"phổ biến": common, "hiếm": rare, "cắt từ chunk": mixed}
+
+def reference_search(index: LexicalIndex, query: str, top_k: int) -> list:
+    """Exhaustive BM25 over every posting, in plain Python"""
+    live = len(index._doc_of)
+    average_length = index._total_length / live
+    scores = {}
+    for term in set(tokenize(query)):
+        postings = index._postings.get(term)
+        if postings is None:
+            continue
+        docs, tfs = postings
+        df = min(len(docs), live)
+        idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+        for doc, tf in zip(docs, tfs):
+            norm = index.k1 * (1 - index.b + index.b * index._doc_lengths[doc] / average_length)
+            scores[doc] = scores.get(doc, 0.0) + idf * tf * (index.k1 + 1) / (tf + norm)
+    best = heapq.nlargest(top_k, ((score, doc) for doc, score in scores.items() if index._doc_keys[doc] is not None))
+    return [(index._doc_keys[doc], score) for score, doc in best]
+
+def same_ranking(result: list, expected: list) -> bool:
+    """Same scores rank by rank; ids may only differ between (near) ties"""
+    if len(result) != len(expected):
+        return False
+    for (key, score), (expected_key, expected_score) in zip(result, expected):
+        if not math.isclose(score, expected_score, rel_tol=1e-4, abs_tol=1e-4):
+            return False
+    # Ties at the cut-off may pick different chunks; everything above must match
+    cutoff = expected[-1][1] + 1e-3 if expected else 0
+    return {key for key, score in result if score > cutoff} == {key for key, score in expected if score > cutoff}
+
+def measure(search, queries: list, top_k: int) -> list:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query, top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=80, help="Số âm tiết mỗi chunk")
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--delete", type=float, default=0.1, help="Tỉ lệ chunk xóa sau khi nạp (tombstone)")
+    parser.add_argument("--reference-queries", type=int, default=20, help="Số câu mỗi loại đối chiếu với cách tính cũ")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    chunks = make_chunks(args.chunks, args.words, vocabulary, rng)
+    queries = make_queries(args.queries, chunks, vocabulary, rng)
+
+    index = LexicalIndex()
+    start = time.perf_counter()
+    for offset in range(0, len(chunks), 1000):
+        batch = chunks[offset:offset + 1000]
+        index.add([f"chunk-{i}" for i in range(offset, offset + len(batch))], batch)
+    build_s = time.perf_counter() - start
+    deleted = rng.choice(args.chunks, int(args.chunks * args.delete), replace=False)
+    index.remove(f"chunk-{i}" for i in deleted)
+
+    print(f"📊 {args.chunks} chunk x {args.words} âm tiết, {len(index._postings)} term, "
+          f"xóa {len(deleted)}, top_k={args.top_k}, nạp {build_s:.1f}s\n")
+    print(f"{'câu hỏi':<14}{'p50 ms':>9}{'p99 ms':>9}{'cũ p50 ms':>11}{'khớp':>8}")
+
+    failed = 0
+    for name, batch in queries.items():
+        index.search(batch[0], args.top_k)  # norms are computed on the first search
+        latencies = measure(index.search, batch, args.top_k)
+        sample = batch[:args.reference_queries]
+        reference = measure(lambda query, top_k: reference_search(index, query, top_k), sample, args.top_k)
+        matched = sum(
+            same_ranking(index.search(query, args.top_k), reference_search(index, query, args.top_k))
+            for query in sample
+        )
+        failed += len(sample) - matched
+        print(
+            f"{name:<14}{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 99):>9.2f}"
+            f"{np.percentile(reference, 50):>11.1f}{f'{matched}/{len(sample)}':>8}"
+        )
+
+    if failed:
+        print(f"\n❌ {failed} câu cho kết quả khác cách tính cũ")
+        sys.exit(1)
+    print("\n✅ Kết quả khớp cách tính cũ")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Script đo độ trễ tìm kiếm qua retrieval cache: miss, hit trong bộ nhớ
+(LRU), hit từ Redis (một worker khác đã tìm câu đó) và sau khi corpus đổi
+phiên bản (ingest/xóa tài liệu).
+
+Chunk mẫu được embedding và nạp vào NumpyVectorStore trong thư mục tạm.
+Cache chỉ lưu id và điểm của kết quả; khi hit, nội dung chunk lấy từ vector
+store và embedding câu hỏi lấy từ embedding cache (SQLite trong thư mục tạm,
+dùng chung giữa các worker như khi chạy thật). Embedding gọi API theo cấu
+hình, nên nên chạy cùng fake server (thêm --latency để giống API thật):
+
+    python scripts/fake_openai_server.py --port 9000 --latency 0.2
+    OPENAI_BASE_URL=http://localhost:9000/v1 python scripts/benchmark_retrieval_cache.py --chunks 2000 --queries 200
+
+Mặc định dùng một Redis giả lập trong process (LocalRedis); --redis-url để
+đo với Redis thật, --redis-down để kiểm tra cache chạy tiếp trong bộ nhớ
+khi Redis không kết nối được.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Add backend to path
+sys.path.append(str(Path(__file__).parent.parent / 'backend'))
+
+from app.core.config import settings
+from app.services.embedding_cache import EmbeddingCache, SQLiteEmbeddingStore
+from app.services.lexical_index import get_lexical_index
+from app.services.numpy_vector_store import NumpyVectorStore
+from app.services.retrieval_cache import RetrievalCache
+from app.services.vector_service import VectorService
+
+TOPICS = ["giá cước", "gói data", "chuyển mạng", "hóa đơn", "roaming", "sim", "khuyến mãi", "hỗ trợ"]
+
+class LocalRedis:
+    """In-process stand-in for the few redis.asyncio calls the cache makes"""
+    def __init__(self):
+        self.data: Dict[str, bytes] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.data.get(key)
+
+    async def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key: str, value: bytes, ex: Optional[int] = None) -> None:
+        self.data[key] = value
+
+    async def incr(self, key: str) -> int:
+        value = int(self.data.get(key, 0)) + 1
+        self.data[key] = str(value).encode()
+        return value
+
+    def pipeline(self, transaction: bool = True) -> "LocalPipeline":
+        return LocalPipeline(self)
+
+
+class LocalPipeline:
+    def __init__(self, client: LocalRedis):
+        self.client = client
+        self.commands = []
+
+    def set(self, key: str, value: bytes, ex: Optional[int] = None) -> None:
+        self.commands.append((key, value))
+
+    async def execute(self) -> None:
+        for key, value in self.commands:
+            await self.client.set(key, value)
+
+
+class DownRedis:
+    """A Redis that never answers"""
+    def pipeline(self, transaction: bool = True) -> "DownRedis":
+        return self
+
+    def set(self, *args, **kwargs) -> None:
+        pass
+
+    def __getattr__(self, name):
+        async def fail(*args, **kwargs):
+            raise ConnectionError("Redis unreachable")
+        return fail
+
+
+def make_client(args):
+    if args.redis_down:
+        return DownRedis()
+    if args.redis_url:
+        import redis.asyncio
+        return redis.asyncio.Redis.from_url(args.redis_url, socket_connect_timeout=1, socket_timeout=1)
+    return LocalRedis()
+
+def make_embedding_cache(directory: str) -> EmbeddingCache:
+    # A new memory tier over the shared store, like a freshly started worker
+    return EmbeddingCache(settings.EMBEDDING_CACHE_MAX_BYTES, SQLiteEmbeddingStore(os.path.join(directory, "embeddings.sqlite3")))
+
+def make_chunks(count: int) -> List[str]:
+    return [
+        f"Câu hỏi về {TOPICS[i % len(TOPICS)]} số {i}: khách hàng cần biết điều kiện và thủ tục {i % 37}."
+        for i in range(count)
+    ]
+
+def make_queries(count: int) -> List[str]:
+    return [f"Thủ tục {TOPICS[i % len(TOPICS)]} số {i} như thế nào?" for i in range(count)]
+
+async def load(service: VectorService, chunks: List[str]) -> None:
+    ids = [f"chunk-{i}" for i in range(len(chunks))]
+    for start in range(0, len(chunks), settings.EMBEDDING_BATCH_SIZE):
+        batch = chunks[start:start + settings.EMBEDDING_BATCH_SIZE]
+        metadatas = [{"source": "benchmark", "chunk_index": start + i} for i in range(len(batch))]
+        await service.add_documents(batch, metadatas, ids=ids[start:start + len(batch)])
+    if service.lexical_index is not None:
+        service.lexical_index.add(ids, chunks)
+        # Built here, not from the database: nothing for a refresh to catch up
+        service.lexical_index.version = await service.retrieval_cache.version()
+
+def counters(cache: RetrievalCache):
+    stats = cache.stats()
+    return np.array([stats["memory"]["hits"], stats["redis_hits"], stats["misses"]])
+
+async def phase(name: str, service: VectorService, queries: List[str], top_k: int):
+    """Search every query once and print latency and where the results came from"""
+    before = counters(service.retrieval_cache)
+    latencies, ids = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = await service.search(query, top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append(result["ids"])
+    memory_hits, redis_hits, misses = counters(service.retrieval_cache) - before
+    print(
+        f"{name:<22}{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 99):>9.2f}"
+        f"{memory_hits:>10}{redis_hits:>10}{misses:>8}"
+    )
+    return latencies, ids
+
+async def run(args) -> int:
+    directory = tempfile.mkdtemp(prefix="retrieval_cache_")
+    client = make_client(args)
+    service = VectorService(NumpyVectorStore(os.path.join(directory, "index")))
+    service.embedding_cache = make_embedding_cache(directory)
+    service.retrieval_cache = RetrievalCache(args.max_bytes, ttl_seconds=3600, client=client)
+    service.warmup()
+    try:
+        await load(service, make_chunks(args.chunks))
+        queries = make_queries(args.queries)
+        lexical = get_lexical_index()
+        print(f"📊 {args.chunks} chunk, {args.queries} câu hỏi, top_k={args.top_k}, "
+              f"hybrid={'bật' if lexical is not None else 'tắt'}, Redis: {type(client).__name__}\n")
+        print(f"{'':<22}{'p50 ms':>9}{'p99 ms':>9}{'hit LRU':>10}{'hit Redis':>10}{'miss':>8}")
+
+        cold, expected = await phase("lần đầu", service, queries, args.top_k)
+        warm, ids = await phase("lặp lại", service, queries, args.top_k)
+        assert ids == expected, "cached results differ from a fresh search"
+
+        # Another worker: empty LRUs, same Redis and embedding store
+        service.retrieval_cache = RetrievalCache(args.max_bytes, ttl_seconds=3600, client=client)
+        service.embedding_cache = make_embedding_cache(directory)
+        _, ids = await phase("worker khác", service, queries, args.top_k)
+        assert ids == expected, "results read from Redis differ from a fresh search"
+
+        # Query embeddings stay cached: this measures the search itself.
+        # The change is made here, so the BM25 index is already current
+        before, after = await service.retrieval_cache.bump()
+        if service.lexical_index is not None:
+            service.lexical_index.advance(before, after)
+        await phase("sau khi corpus đổi", service, queries, args.top_k)
+
+        print(f"\nLặp lại nhanh hơn lần đầu {np.median(cold) / np.median(warm):.0f}x (p50)")
+    finally:
+        service.close()
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the retrieval result cache")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=settings.RETRIEVAL_TOP_K)
+    parser.add_argument("--max-bytes", type=int, default=settings.RETRIEVAL_CACHE_MAX_BYTES)
+    parser.add_argument("--redis-url", default=None, help="Đo với Redis thật thay cho LocalRedis")
+    parser.add_argument("--redis-down", action="store_true", help="Giả lập Redis không kết nối được")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+if __name__ == "__main__":
+    main()
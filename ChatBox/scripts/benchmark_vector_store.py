@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Script so sánh NumpyVectorStore với Chroma: recall@k và độ trễ p50/p99.
+
+Dữ liệu là các vector ngẫu nhiên theo cụm (gần với embedding thật hơn
+nhiễu đều). Ground truth được tính bằng tìm kiếm cosine chính xác.
+
+    python scripts/benchmark_vector_store.py --rows 100000 --dim 384 --queries 500
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add backend to path
+sys.path.append(str(Path(__file__).parent.parent / 'backend'))
+
+from app.services.vector_store import ChromaVectorStore
+from app.services.numpy_vector_store import NumpyVectorStore
+
+def make_dataset(rows: int, dim: int, queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(rows // 200, 1), dim)).astype(np.float32)
+    data = centers[rng.integers(0, len(centers), rows)] + 0.3 * rng.normal(size=(rows, dim)).astype(np.float32)
+    probes = data[rng.integers(0, rows, queries)] + 0.1 * rng.normal(size=(queries, dim)).astype(np.float32)
+    return data, probes
+
+def exact_top_k(data: np.ndarray, probes: np.ndarray, k: int) -> np.ndarray:
+    data = data / np.linalg.norm(data, axis=1, keepdims=True)
+    probes = probes / np.linalg.norm(probes, axis=1, keepdims=True)
+    scores = probes @ data.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return top
+
+def load(store, data: np.ndarray, batch: int = 5000) -> float:
+    start = time.perf_counter()
+    for offset in range(0, len(data), batch):
+        rows = data[offset:offset + batch]
+        ids = [str(i) for i in range(offset, offset + len(rows))]
+        store.add(ids, rows.tolist(), ["" for _ in ids], [{"row": i} for i in range(offset, offset + len(rows))])
+    return time.perf_counter() - start
+
+def run(store, probes: np.ndarray, truth: np.ndarray, k: int):
+    latencies, hits = [], 0
+    for probe, expected in zip(probes, truth):
+        start = time.perf_counter()
+        result = store.query([probe.tolist()], k)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(int(i) for i in result["ids"]) & set(expected.tolist()))
+    
+    # Batched multi-query search (numpy only answers all probes with one matrix product)
+    start = time.perf_counter()
+    store.query(probes.tolist(), k)
+    batched_ms = (time.perf_counter() - start) * 1000
+    
+    return {
+        "recall": hits / (len(probes) * k),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "batched_ms_per_query": batched_ms / len(probes)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+    
+    data, probes = make_dataset(args.rows, args.dim, args.queries)
+    truth = exact_top_k(data, probes, args.top_k)
+    metadata = {"embedding_model": "benchmark", "embedding_dimension": args.dim}
+    
+    print(f"📊 {args.rows} vectors x {args.dim} dims, {args.queries} queries, top_k={args.top_k}\n")
+    print(f"{'backend':<8} {'load s':>8} {'recall':>8} {'p50 ms':>8} {'p99 ms':>8} {'batch ms/q':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for store in (ChromaVectorStore(f"{tmp}/chroma"), NumpyVectorStore(f"{tmp}/numpy")):
+            store.open(metadata)
+            load_s = load(store, data)
+            stats = run(store, probes, truth, args.top_k)
+            store.close()
+            print(
+                f"{store.name:<8} {load_s:>8.2f} {stats['recall']:>8.3f} {stats['p50_ms']:>8.3f} "
+                f"{stats['p99_ms']:>8.3f} {stats['batched_ms_per_query']:>11.3f}"
+            )
+
+if __name__ == "__main__":
+    main()
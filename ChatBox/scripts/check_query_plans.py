@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra kế hoạch truy vấn (EXPLAIN) của các truy vấn nóng.
+
+Tạo database bằng Alembic migrations, nạp dữ liệu mẫu, gọi các hàm service
+thật và ghi lại SQL chúng phát ra, rồi chạy EXPLAIN cho từng câu lệnh và
+kiểm tra rằng index mong đợi xuất hiện trong kế hoạch. Thoát với mã 1 nếu
+có truy vấn không dùng index.
+
+    python scripts/check_query_plans.py                      # SQLite tạm
+    DATABASE_URL=postgresql://user:pw@localhost/plans python scripts/check_query_plans.py
+
+Với Postgres, database phải trống (script chạy migrations trên đó) và
+enable_seqscan bị tắt khi EXPLAIN để kiểm tra index có dùng được hay không
+trên bộ dữ liệu nhỏ.
+
+Đây là script chứ không phải test pytest vì repo chưa có bộ test, và cùng
+một lệnh phải chạy được trên cả SQLite lẫn Postgres (chọn bằng DATABASE_URL).
+Chạy trước khi gửi thay đổi về migration, model hoặc truy vấn (xem
+STARTUP_GUIDE.md).
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent / 'backend'
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='query_plans_'), 'plans.db')}"
+# Add backend to path
+sys.path.append(str(BACKEND_DIR))
+
+from sqlalchemy import create_engine, event, insert, select
+
+from app.core.config import settings
+from app.core.database import engine, AsyncSessionLocal, close_db, run_migrations
+from app.models import User, Conversation, Message, Document, Source
+from app.models.message import MessageRole
+from app.services.chat_service import ChatService
+from app.services.conversation_memory import ConversationMemory
+from app.services.conversation_service import ConversationService
+from app.services.document_service import DocumentService
+from app.services.lexical_index import LexicalIndex, refresh_lexical_index
+
+# Seeding goes through a plain sync engine; the services and EXPLAIN run on
+# the app's async engine, so captured statements keep their driver's paramstyle
+sync_engine = create_engine(settings.DATABASE_URL)
+
+USERS, CONVERSATIONS, MESSAGES_PER_CONVERSATION, SOURCES, CHUNKS_PER_SOURCE = 50, 1000, 20, 100, 20
+
+def seed():
+    now = datetime.utcnow()
+    with sync_engine.begin() as db:
+        _insert_rows(db, now)
+    with sync_engine.connect() as connection:
+        connection.exec_driver_sql("ANALYZE")
+        connection.commit()
+
+def _insert_rows(db, now):
+    db.execute(insert(User.__table__), [
+        {"id": u, "username": f"user{u}", "email": f"user{u}@example.com", "hashed_password": "x"}
+        for u in range(1, USERS + 1)
+    ])
+    db.execute(insert(Conversation.__table__), [
+        {
+            "id": c, "user_id": c % USERS + 1, "title": f"Hội thoại {c}", "created_at": now,
+            "message_count": MESSAGES_PER_CONVERSATION, "last_message_at": now + timedelta(seconds=c)
+        }
+        for c in range(1, CONVERSATIONS + 1)
+    ])
+    db.execute(insert(Message.__table__), [
+        {
+            "conversation_id": c, "role": MessageRole.USER.name if m % 2 == 0 else MessageRole.ASSISTANT.name,
+            "content": f"giá cước gói {m} tháng {c}", "created_at": now + timedelta(seconds=m)
+        }
+        for c in range(1, CONVERSATIONS + 1) for m in range(MESSAGES_PER_CONVERSATION)
+    ])
+    db.execute(insert(Source.__table__), [
+        {
+            "id": s + 1, "name": f"doc{s}.txt", "document_type": "txt", "status": "active", "created_at": now,
+            "chunk_count": CHUNKS_PER_SOURCE, "total_bytes": 12 * CHUNKS_PER_SOURCE,
+            "last_ingested_at": now + timedelta(seconds=s)
+        }
+        for s in range(SOURCES)
+    ])
+    db.execute(insert(Document.__table__), [
+        {
+            "title": f"doc{s}.txt - Chunk {i + 1}", "content": f"nội dung {s} {i}", "source": f"doc{s}.txt",
+            "source_id": s + 1, "chunk_index": i, "embedding_id": f"vec-{s}-{i}", "content_hash": f"{s:016x}{i:016x}"
+        }
+        for s in range(SOURCES) for i in range(CHUNKS_PER_SOURCE)
+    ])
+
+@contextmanager
+def capture():
+    """Collect (statement, parameters) of every SELECT and DELETE run inside the block"""
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH", "DELETE")):
+            statements.append((statement, parameters))
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+async def explain(statement, parameters) -> str:
+    parameters = tuple(parameters)
+    async with engine.connect() as connection:
+        if engine.dialect.name == "sqlite":
+            rows = (await connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)).all()
+            return "\n".join(row[-1] for row in rows)
+        await connection.exec_driver_sql("SET enable_seqscan = off")
+        rows = (await connection.exec_driver_sql("EXPLAIN " + statement, parameters)).all()
+        return "\n".join(row[0] for row in rows)
+
+
+class NoVectors:
+    """Vector side of DocumentService is out of scope here: only SQL is checked"""
+    retrieval_cache = None
+
+    def delete_document(self, doc_id):
+        pass
+
+    def delete_documents(self, ids):
+        pass
+
+    def delete_where(self, where):
+        pass
+
+
+async def collect(records):
+    return [record async for record in records]
+
+async def stale_lexical_index(db) -> LexicalIndex:
+    """A BM25 index that is current except for source 3 (it has since
+    lost a chunk and gained one) and source 999 (since deleted)"""
+    index = LexicalIndex()
+    rows = await db.execute(select(Source.id, Source.last_ingested_at, Source.chunk_count))
+    index.sources = {row.id: ((row.last_ingested_at, row.chunk_count), set()) for row in rows}
+    index.sources[3] = (None, {"vec-2-0", "vec-gone"})
+    index.sources[999] = (None, {"vec-5-1"})
+    return index
+
+async def checks(db):
+    conversations = ConversationService(db)
+    first_page = await conversations.get_user_conversations(1, 10)
+    first_documents = await DocumentService(db, NoVectors()).list_documents(10)
+    lexical_index = await stale_lexical_index(db)
+    search_index = "messages_fts" if sync_engine.dialect.name == "sqlite" else "ix_messages_search_vector"
+    return [
+        ("conversation list", lambda: conversations.get_user_conversations(1, 10),
+         ["ix_conversations_user_last_message"]),
+        ("conversation list, next page", lambda: conversations.get_user_conversations(1, 10, first_page["next_cursor"]),
+         ["ix_conversations_user_last_message"]),
+        ("conversation messages", lambda: conversations.get_conversation_messages(42),
+         ["ix_messages_conversation_created"]),
+        ("conversation summary", lambda: conversations.get_conversation_summary(42),
+         ["ix_messages_conversation_created"]),
+        ("conversation search", lambda: conversations.search_conversations(1, "giá cước"),
+         [search_index]),
+        ("memory load", lambda: ConversationMemory(db).load(42),
+         ["ix_messages_conversation_created"]),
+        ("history export", lambda: collect(ChatService(db).iter_user_history(1, 5)),
+         ["ix_conversations_user_created", "ix_messages_conversation_created"]),
+        ("document list", lambda: DocumentService(db, NoVectors()).list_documents(10),
+         ["ix_sources_last_ingested"]),
+        ("document list, next page", lambda: DocumentService(db, NoVectors()).list_documents(
+            10, first_documents["next_cursor"]),
+         ["ix_sources_last_ingested"]),
+        ("document chunks by source", lambda: db.scalars(select(Document).where(Document.source_id == 8)),
+         ["ix_documents_source_id"]),
+        ("document chunks by vector id", lambda: db.scalars(select(Document).where(
+            Document.embedding_id.in_(["vec-3-1", "vec-9-4"]))),
+         ["ix_documents_embedding_id"]),
+        ("BM25 index refresh", lambda: refresh_lexical_index(lexical_index, "plans"),
+         ["uq_documents_source_embedding", "ix_documents_embedding_id"]),
+        ("document delete", lambda: DocumentService(db, NoVectors()).delete_document(1),
+         ["ix_documents_source_id"]),
+    ]
+
+async def run_checks() -> int:
+    failures = 0
+    async with AsyncSessionLocal() as db:
+        for name, call, expected in await checks(db):
+            with capture() as statements:
+                await call()
+            plans = [await explain(statement, parameters) for statement, parameters in statements]
+            failures += report(name, statements, plans, expected)
+    await close_db()
+    return failures
+
+def report(name, statements, plans, expected) -> int:
+    combined = "\n".join(plans)
+    missing = [index for index in expected if index not in combined]
+    status = "OK  " if not missing else "FAIL"
+    print(f"[{status}] {name} ({len(statements)} queries)")
+    if missing:
+        print(f"       missing index: {', '.join(missing)}")
+        for (statement, _), plan in zip(statements, plans):
+            print("       " + " ".join(statement.split())[:160])
+            print("         " + plan.replace("\n", "\n         "))
+    return int(bool(missing))
+
+def main():
+    print(f"Database: {sync_engine.url.render_as_string(hide_password=True)}")
+    run_migrations()
+    seed()
+
+    failures = asyncio.run(run_checks())
+    sync_engine.dispose()
+    print(f"\n{failures} failing" if failures else "\nAll hot queries use their indexes")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Fake OpenAI-compatible server cho phát triển và kiểm thử cục bộ.
+
+Trả lời /v1/chat/completions và /v1/embeddings với kết quả xác định
+(không gọi mạng, không tốn tiền), có thể thêm độ trễ giả lập để kiểm tra
+event loop không bị chặn:
+
+    python scripts/fake_openai_server.py --port 9000 --latency 1.5
+    OPENAI_BASE_URL=http://localhost:9000/v1 uvicorn main:app
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import time
+from typing import List, Union
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+app = FastAPI(title="Fake OpenAI API")
+config = {"latency": 0.0, "dim": 1536}
+
+class ChatCompletionRequest(BaseModel):
+    model: str
+    messages: List[dict]
+    max_tokens: int = 500
+    temperature: float = 0.2
+    stream: bool = False
+
+class EmbeddingRequest(BaseModel):
+    model: str
+    input: Union[str, List[str]]
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """Deterministic unit vector derived from the text"""
+    values = []
+    seed = hashlib.sha256(text.encode()).digest()
+    while len(values) < dim:
+        seed = hashlib.sha256(seed).digest()
+        values.extend((byte - 127.5) / 127.5 for byte in seed)
+    values = values[:dim]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+async def stream_completion(request: ChatCompletionRequest, answer: str, usage: dict):
+    # Latency is spread across tokens: first token after a tenth, the rest evenly
+    words = answer.split(" ")
+    await asyncio.sleep(config["latency"] / 10)
+    for i, word in enumerate(words):
+        chunk = {
+            "object": "chat.completion.chunk",
+            "model": request.model,
+            "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}]
+        }
+        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        await asyncio.sleep(config["latency"] * 0.9 / len(words))
+    yield f"data: {json.dumps({'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+    yield "data: [DONE]\n\n"
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: ChatCompletionRequest):
+    question = request.messages[-1]["content"] if request.messages else ""
+    answer = f"Câu trả lời giả lập cho: {question}"
+    prompt_tokens = sum(count_tokens(m.get("content", "")) for m in request.messages)
+    completion_tokens = count_tokens(answer)
+    if request.stream:
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        return StreamingResponse(stream_completion(request, answer, usage), media_type="text/event-stream")
+    
+    await asyncio.sleep(config["latency"])
+    return {
+        "id": f"chatcmpl-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+@app.post("/v1/embeddings")
+async def embeddings(request: EmbeddingRequest):
+    await asyncio.sleep(config["latency"] / 10)
+    inputs = [request.input] if isinstance(request.input, str) else request.input
+    return {
+        "object": "list",
+        "model": request.model,
+        "data": [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(text, config["dim"])}
+            for i, text in enumerate(inputs)
+        ],
+        "usage": {"prompt_tokens": sum(map(count_tokens, inputs)), "total_tokens": sum(map(count_tokens, inputs))}
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per chat completion")
+    parser.add_argument("--dim", type=int, default=1536, help="embedding dimension")
+    args = parser.parse_args()
+    config["latency"] = args.latency
+    config["dim"] = args.dim
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Script ingest hàng loạt tài liệu (.txt, .md, .pdf) từ thư mục hoặc glob.
+
+Các file được xử lý đồng thời bởi một số worker cố định; embedding của
+nhiều file được gom thành batch đầy trước khi gọi API. Mỗi file xong (hoặc
+lỗi) được ghi vào manifest, nên chạy lại cùng lệnh sẽ bỏ qua các file đã
+ingest và chưa thay đổi (theo kích thước và mtime) — một lần chạy 50k file
+bị ngắt giữa chừng sẽ tiếp tục từ chỗ dừng. Ingest lại một file là an toàn:
+chunk không đổi được giữ nguyên.
+
+    python scripts/ingest_documents.py docs/
+    python scripts/ingest_documents.py "data/**/*.pdf" --workers 16 --manifest ingest_manifest.jsonl
+
+Source của tài liệu là đường dẫn tương đối so với thư mục hiện tại.
+
+Server đang chạy thấy tài liệu mới mà không cần khởi động lại khi
+RETRIEVAL_CACHE_BACKEND=redis: mỗi file ingest xong tăng phiên bản corpus
+trong Redis, và ở lần tìm kiếm kế tiếp server bắt kịp chỉ mục BM25 và bỏ
+kết quả cache cũ. Với cache memory hoặc none, phiên bản chỉ nằm trong từng
+process: khởi động lại server sau khi ingest.
+
+VECTOR_STORE_BACKEND=numpy chỉ cho một process mở chỉ mục: script từ chối
+chạy khi server đang mở nó. Dừng server, ingest, rồi khởi động lại server.
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+# Add backend to path
+sys.path.append(str(Path(__file__).parent.parent / 'backend'))
+
+from app.core.database import AsyncSessionLocal, close_db
+from app.services.context_assembler import count_tokens
+from app.services.document_service import DocumentService
+from app.services.embedding_provider import BatchingEmbeddingProvider
+from app.services.numpy_vector_store import VectorStoreLocked
+from app.services.pdf_extractor import shutdown_pdf_executor
+from app.services.vector_service import init_vector_service, shutdown_vector_service
+
+SUPPORTED_EXTENSIONS = ('.txt', '.md', '.pdf')
+
+class CountingEmbedder(BatchingEmbeddingProvider):
+    """Batching provider that also counts the tokens it embeds"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tokens = 0
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        self.tokens += sum(count_tokens(text) for text in texts)
+        return await super().embed(texts)
+
+class Manifest:
+    """Append-only JSONL record of processed files; the last line for a path wins"""
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.endswith("\n"):
+                        entry = json.loads(line)
+                        self.entries[entry["path"]] = entry
+        self._file = open(path, "a", encoding="utf-8")
+
+    def is_done(self, path: str, stat: os.stat_result) -> bool:
+        entry = self.entries.get(path)
+        return (
+            entry is not None and entry["status"] == "done"
+            and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+        )
+
+    def record(self, entry: dict) -> None:
+        self.entries[entry["path"]] = entry
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class Progress:
+    def __init__(self, total: int, embedder: CountingEmbedder):
+        self.total = total
+        self.embedder = embedder
+        self.started = time.perf_counter()
+        self.files = 0
+        self.failed = 0
+        self.chunks = 0
+
+    def line(self) -> str:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return (
+            f"{self.files + self.failed:,}/{self.total:,} file ({self.failed} lỗi) | "
+            f"{self.files / elapsed:.1f} file/s, {self.chunks / elapsed:.1f} chunk/s, "
+            f"{self.embedder.tokens / elapsed:,.0f} token/s | "
+            f"{self.embedder.texts:,} chunk mới qua {self.embedder.requests:,} request embedding"
+        )
+
+
+def expand_inputs(inputs: List[str]) -> List[str]:
+    """Files under directories and matches of glob patterns, sorted and unique"""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = (str(p) for p in Path(item).rglob("*") if p.is_file())
+        else:
+            candidates = glob.glob(item, recursive=True)
+        paths.update(
+            os.path.relpath(p).replace(os.sep, "/") for p in candidates
+            if p.lower().endswith(SUPPORTED_EXTENSIONS) and os.path.isfile(p)
+        )
+    return sorted(paths)
+
+async def ingest_one(service: DocumentService, path: str) -> dict:
+    stat = os.stat(path)
+    entry = {"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    try:
+        result = await service.ingest_file(path, filename=path)
+    except Exception as e:
+        return {**entry, "status": "failed", "error": str(e)}
+    return {
+        **entry,
+        "status": "done",
+        "chunks": result["total_chunks"],
+        "chunks_created": result["chunks_created"]
+    }
+
+async def worker(queue: asyncio.Queue, vector_service, manifest: Manifest, progress: Progress):
+    # One session per worker: an AsyncSession is not safe for concurrent use
+    async with AsyncSessionLocal() as db:
+        service = DocumentService(db, vector_service)
+        # The server builds its own BM25 index; don't grow one in this process
+        service.lexical_index = None
+        while True:
+            path = await queue.get()
+            if path is None:
+                return
+            entry = await ingest_one(service, path)
+            manifest.record(entry)
+            if entry["status"] == "done":
+                progress.files += 1
+                progress.chunks += entry["chunks"]
+            else:
+                progress.failed += 1
+                print(f"\n❌ {path}: {entry['error']}")
+
+async def report_progress(progress: Progress, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        print(f"\r{progress.line()}", end="", flush=True)
+
+async def run(args) -> int:
+    paths = expand_inputs(args.inputs)
+    manifest = Manifest(args.manifest)
+    todo = [p for p in paths if not manifest.is_done(p, os.stat(p))]
+    print(f"📁 {len(paths):,} file, {len(paths) - len(todo):,} đã ingest (manifest {args.manifest}), còn {len(todo):,}")
+    if not todo:
+        manifest.close()
+        return 0
+
+    try:
+        vector_service = init_vector_service()
+    except VectorStoreLocked as e:
+        print(f"❌ {e}\n   Dừng server rồi chạy lại script.")
+        manifest.close()
+        return 1
+    embedder = CountingEmbedder(
+        vector_service.embedding_provider, batch_size=args.batch_size, max_wait_ms=args.max_wait_ms
+    )
+    vector_service.embedding_provider = embedder
+
+    progress = Progress(len(todo), embedder)
+    # Bounded queue: paths are handed out as workers free up
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.workers * 2)
+    workers = [asyncio.create_task(worker(queue, vector_service, manifest, progress)) for _ in range(args.workers)]
+    reporter = asyncio.create_task(report_progress(progress, args.progress_interval))
+    try:
+        for path in todo:
+            await queue.put(path)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        reporter.cancel()
+        for task in workers:
+            task.cancel()
+        manifest.close()
+        shutdown_vector_service()
+        shutdown_pdf_executor()
+        await close_db()
+
+    elapsed = time.perf_counter() - progress.started
+    print(f"\r{progress.line()}")
+    print(f"\n🎉 Xong trong {elapsed:.1f}s: {progress.files:,} file, {progress.chunks:,} chunk, {progress.failed:,} lỗi")
+    return 1 if progress.failed else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk document ingestion")
+    parser.add_argument("inputs", nargs="+", help="Thư mục hoặc glob (đặt trong dấu nháy, hỗ trợ **)")
+    parser.add_argument("--workers", type=int, default=8, help="Số file xử lý đồng thời")
+    parser.add_argument("--manifest", default="ingest_manifest.jsonl", help="File checkpoint để chạy tiếp")
+    parser.add_argument("--batch-size", type=int, default=None, help="Số chunk mỗi request embedding (mặc định EMBEDDING_BATCH_SIZE)")
+    parser.add_argument("--max-wait-ms", type=float, default=50, help="Thời gian chờ gom batch embedding")
+    parser.add_argument("--progress-interval", type=float, default=2.0)
+    args = parser.parse_args()
+    try:
+        sys.exit(asyncio.run(run(args)))
+    except KeyboardInterrupt:
+        print("\n⏸️  Dừng. Chạy lại cùng lệnh để tiếp tục từ manifest.")
+        sys.exit(130)
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,7 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent / 'backend'))
 
 from app.services.document_service import DocumentService
-from app.core.database import SessionLocal
+from app.core.database import AsyncSessionLocal, close_db
 
 # Sample documents content
 SAMPLE_DOCS = {
@@ -65,7 +65,7 @@ Nếu quên mật khẩu:
 
 async def ingest_sample_documents():
     """Ingest tài liệu mẫu vào hệ thống"""
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     
     try:
         doc_service = DocumentService(db)
@@ -94,9 +94,10 @@ async def ingest_sample_documents():
         
     except Exception as e:
         print(f"❌ Lỗi: {e}")
-        db.rollback()
+        await db.rollback()
     finally:
-        db.close()
+        await db.close()
+        await close_db()
 
 if __name__ == "__main__":
     import asyncio
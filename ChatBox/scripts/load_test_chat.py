@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Script tải cho /api/chat: gửi cùng một số request tuần tự rồi đồng thời và
+so sánh thông lượng, độ trễ p50/p99.
+
+Mỗi request mở một hội thoại mới (ghi tin nhắn người dùng, gọi LLM, ghi câu
+trả lời). Nếu truy cập database chặn event loop, các request đồng thời bị
+xếp hàng sau nhau và "mức song song" (tổng thời gian các request / thời
+gian thực) chỉ quanh 1; khi database chạy bất đồng bộ, nó tiến gần tới số
+request đồng thời.
+
+    python scripts/fake_openai_server.py --port 9000 --latency 0.5
+    OPENAI_BASE_URL=http://localhost:9000/v1 uvicorn main:app --port 8000
+    python scripts/load_test_chat.py --url http://localhost:8000 --requests 200 --concurrency 50
+
+user_id phải tồn tại trong bảng users khi database kiểm tra khóa ngoại (Postgres).
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List, Tuple
+
+import httpx
+import numpy as np
+
+QUESTIONS = [
+    "Gói cơ bản giá bao nhiêu?",
+    "Làm thế nào để đăng ký tài khoản?",
+    "Quên mật khẩu phải làm sao?",
+    "Gói chuyên nghiệp có hỗ trợ 24/7 không?",
+    "Dung lượng lưu trữ của gói cơ bản là bao nhiêu?",
+]
+
+async def send(client: httpx.AsyncClient, user_id: int, i: int) -> Tuple[float, bool]:
+    start = time.perf_counter()
+    try:
+        response = await client.post("/api/chat", json={
+            "user_id": user_id,
+            # Distinct questions so the answer cache doesn't short-circuit the LLM call
+            "message": f"{QUESTIONS[i % len(QUESTIONS)]} (#{i})"
+        })
+        ok = response.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    return time.perf_counter() - start, ok
+
+async def run(url: str, user_id: int, requests: int, concurrency: int) -> Tuple[float, List[float], int]:
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        async def bounded(i: int):
+            async with semaphore:
+                return await send(client, user_id, i)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(bounded(i) for i in range(requests)))
+        wall = time.perf_counter() - start
+    latencies = [latency for latency, ok in results if ok]
+    return wall, latencies, requests - len(latencies)
+
+def report(name: str, wall: float, latencies: List[float], errors: int) -> float:
+    throughput = len(latencies) / wall if wall else 0.0
+    parallelism = sum(latencies) / wall if wall else 0.0
+    p50 = float(np.percentile(latencies, 50)) * 1000 if latencies else 0.0
+    p99 = float(np.percentile(latencies, 99)) * 1000 if latencies else 0.0
+    print(f"{name:<12}{wall:>9.2f}{throughput:>10.1f}{p50:>10.0f}{p99:>10.0f}{parallelism:>10.1f}{errors:>7}")
+    return throughput
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/chat")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--sequential-requests", type=int, default=10,
+                        help="Số request cho lượt tuần tự dùng làm mốc so sánh")
+    args = parser.parse_args()
+
+    print(f"{'Lượt':<12}{'Tổng (s)':>9}{'req/s':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}{'song song':>10}{'lỗi':>7}")
+    baseline = report("tuần tự", *asyncio.run(run(args.url, args.user_id, args.sequential_requests, 1)))
+    concurrent = report(f"đồng thời {args.concurrency}",
+                        *asyncio.run(run(args.url, args.user_id, args.requests, args.concurrency)))
+    if baseline:
+        print(f"\nThông lượng đồng thời / tuần tự: {concurrent / baseline:.1f}x (tối đa {args.concurrency}x)")
+
+if __name__ == "__main__":
+    main()